@@ -1,5 +1,5 @@
 from django.contrib import admin
-from api.models import User, Profile, Appointment
+from api.models import User, Profile, Appointment, WorkingHours, Task, AppointmentAudit, Notification
 
 # Register your models here.
 class UserAdmin(admin.ModelAdmin):
@@ -11,7 +11,7 @@ class ProfileAdmin(admin.ModelAdmin):
         'gender', 'phone_number', 'address',
         'date_of_birth', 'age',
         'medical_history', 'specialization',
-        'consultation_fees', 'license_number'
+        'consultation_fees', 'license_number', 'slot_duration'
     ]
     
     list_editable = [
@@ -19,9 +19,20 @@ class ProfileAdmin(admin.ModelAdmin):
         'gender', 'phone_number', 'address',
         'date_of_birth', 'age',
         'medical_history', 'specialization',
-        'consultation_fees', 'license_number'
+        'consultation_fees', 'license_number', 'slot_duration'
     ]
 
 admin.site.register(User, UserAdmin)
 admin.site.register(Profile, ProfileAdmin)
-admin.site.register(Appointment)
\ No newline at end of file
+admin.site.register(Appointment)
+admin.site.register(WorkingHours)
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_after', 'created_at']
+    list_filter = ['status', 'name']
+
+
+admin.site.register(Task, TaskAdmin)
+admin.site.register(AppointmentAudit)
+admin.site.register(Notification)
\ No newline at end of file
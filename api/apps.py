@@ -4,3 +4,21 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_save, post_delete
+        from api import events, metrics
+        from api.models import Appointment
+        from api.sqlite import apply_pragmas
+        from api.tasks import appointment_saved, appointment_deleted
+        connection_created.connect(apply_pragmas)
+        # Per-request DB timings for PerformanceMiddleware
+        connection_created.connect(metrics.instrument_connection)
+        # Pushed to event stream subscribers once committed; connected first, as the task receiver
+        # below resets what the instance remembers of how it was loaded
+        post_save.connect(events.appointment_saved, sender=Appointment)
+        post_delete.connect(events.appointment_deleted, sender=Appointment)
+        # Appointment side effects run as background tasks
+        post_save.connect(appointment_saved, sender=Appointment)
+        post_delete.connect(appointment_deleted, sender=Appointment)
@@ -0,0 +1,188 @@
+"""
+Async (ASGI) versions of the read-heavy views.
+
+When settings.HMS_ASYNC_VIEWS is on (hms/asgi.py turns it on by default), api/urls.py serves
+GET on these endpoints from the classes below instead of their DRF counterparts in
+api/views.py. They read through Django's async ORM, so a request waiting on the database
+does not hold a worker thread and one ASGI process can keep thousands of clients in flight.
+
+Responses match the sync views byte for byte: the same serializers, keyset pagination,
+cache entries and ETags, DRF's exception handler for error bodies and its JSON renderer.
+Every other method (PUT, PATCH, DELETE, POST) is handed to the sync DRF view through
+sync_to_async, so writes keep their existing validation, locking and booking checks.
+
+Authentication follows ClaimsJWTAuthentication (see api/authentication.py), so these views
+only ever touch user.pk and user.role, which a ClaimsUser answers without the database.
+
+AppointmentEventsView has no sync counterpart: it holds a Server-Sent Events stream open
+for as long as the client stays, which only an event loop can do cheaply.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
+
+from api import events, fieldsets, permissions, plans, views
+from api.authentication import aauthenticate
+from api.cache import acached_response
+from api.filters import AppointmentFilterBackend
+from api.models import User, Profile, Appointment
+from api.pagination import AppointmentCursorPagination, UserCursorPagination
+from api.routers import arecently_wrote, read_from_replica
+from api.serializers import (UserSerializer, ProfileSerializer, AppointmentSerializer, UserSummarySerializer,
+                             AppointmentSummarySerializer)
+
+
+class AsyncAPIView(View):
+    sync_view = None  # The DRF view class that handles every method but GET
+    sync_handler = None
+    replica_reads = False  # Read from settings.HMS_READ_REPLICA, as ReplicaReadMixin does
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(sync_handler=sync_to_async(cls.sync_view.as_view()), **initkwargs)
+        return csrf_exempt(view)  # Token-authenticated, like every DRF view
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return await self.sync_handler(request, *args, **kwargs)
+        return await self.read(request, *args, **kwargs)
+
+    async def read(self, request, *args, **kwargs):
+        replica_token = None
+        try:
+            user = await aauthenticate(request)
+            if user is None:
+                raise NotAuthenticated()
+            request = Request(request)
+            request.user = user  # Also sets the Django request's user, for the middleware
+            if self.replica_reads and settings.HMS_READ_REPLICA and not await arecently_wrote(user):
+                replica_token = read_from_replica.set(True)
+            response = await self.get(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc, request)
+        finally:
+            if replica_token is not None:
+                read_from_replica.reset(replica_token)
+        return render(response)
+
+    def handle_exception(self, exc, request):
+        response = exception_handler(exc, {'view': self, 'request': request})
+        if response is None:
+            raise exc
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            response['WWW-Authenticate'] = 'Bearer realm="api"'
+        return response
+
+
+def render(response):
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = 'application/json'
+    response.renderer_context = {}
+    return response.render()
+
+
+class AppointmentListView(AsyncAPIView):
+    sync_view = views.AppointmentListView
+    replica_reads = True
+
+    async def get(self, request):
+        plan = plans.plan(fieldsets.serializer_class(request, AppointmentSummarySerializer, AppointmentSerializer),
+                          *AppointmentCursorPagination.ordering)
+        appointments = AppointmentFilterBackend().filter_queryset(
+            request, plan.queryset(views.visible_appointments(request.user)), self)
+        paginator = AppointmentCursorPagination()
+        page = await paginator.apaginate_queryset(appointments, request, view=self)
+        return paginator.get_paginated_response(plan.serialize(page))
+
+
+class AppointmentDetailView(AsyncAPIView):
+    sync_view = views.AppointmentDetailView
+
+    async def get(self, request, pk):
+        appointments = AppointmentSerializer.setup_eager_loading(Appointment.objects.all())
+        appointment = await permissions.APPOINTMENTS.aget(appointments, request.user, pk=pk)  # As views.AppointmentDetailView
+        return Response(AppointmentSerializer(appointment, context={'request': request, 'view': self}).data)
+
+
+class DoctorListView(AsyncAPIView):
+    sync_view = views.DoctorListView
+    replica_reads = True
+
+    async def get(self, request):
+        if request.user.role not in (User.ADMIN, User.PATIENT, User.DOCTOR):
+            return Response({"detail": "You are not an Admin; you cannot view this list."}, status=403)
+        return await acached_response(request, 'doctors', lambda: self.list_doctors(request))
+
+    async def list_doctors(self, request):
+        plan = plans.plan(fieldsets.serializer_class(request, UserSummarySerializer, UserSerializer),
+                          *UserCursorPagination.ordering)
+        paginator = UserCursorPagination()
+        page = await paginator.apaginate_queryset(plan.queryset(User.objects.filter(role=User.DOCTOR)), request, view=self)
+        return paginator.get_paginated_response(plan.serialize(page)).data
+
+
+class PatientListView(AsyncAPIView):
+    sync_view = views.PatientListView
+    replica_reads = True
+
+    async def get(self, request):
+        if request.user.role not in (User.DOCTOR, User.ADMIN):
+            return Response({"detail": "You are a Patient; you cannot view this list."}, status=403)
+        plan = plans.plan(fieldsets.serializer_class(request, UserSummarySerializer, UserSerializer),
+                          *UserCursorPagination.ordering)
+        paginator = UserCursorPagination()
+        page = await paginator.apaginate_queryset(plan.queryset(User.objects.filter(role=User.PATIENT)), request, view=self)
+        return paginator.get_paginated_response(plan.serialize(page))
+
+
+class ProfileView(AsyncAPIView):
+    sync_view = views.ProfileView
+
+    async def get(self, request, pk=None):
+        profiles = ProfileSerializer.setup_eager_loading(Profile.objects.all())
+        if pk is not None:  # As views.ProfileView: any profile the caller may see
+            return Response(ProfileSerializer(await permissions.PROFILES.aget(profiles, request.user, pk=pk)).data)
+
+        async def own_profile():
+            try:
+                profile = await profiles.aget(user_id=request.user.pk)
+            except Profile.DoesNotExist:  # A 404, as get_object_or_404 gives the sync view
+                raise NotFound('No Profile matches the given query.')
+            return ProfileSerializer(profile).data
+        # Same cache entry as the sync view
+        return await acached_response(request, f'profile:{request.user.pk}', own_profile)
+
+
+class AppointmentEventsView(View):
+    """Server-Sent Events for the caller's appointments as they change; see api/events.py."""
+    http_method_names = ['get']
+
+    async def get(self, request):
+        if not settings.HMS_ASYNC_VIEWS:
+            # A sync worker would spend a thread per open stream, and never see another thread's events
+            return render(Response({"detail": "Event streams are served by the ASGI server (hms/asgi.py)."},
+                                   status=503))
+        if 'HTTP_AUTHORIZATION' not in request.META and 'token' in request.GET:
+            # Browsers' EventSource cannot set headers, so the access token may come as ?token=
+            request.META['HTTP_AUTHORIZATION'] = f'Bearer {request.GET["token"]}'
+        try:
+            user = await aauthenticate(request)
+            if user is None:
+                raise NotAuthenticated()
+        except (NotAuthenticated, AuthenticationFailed) as exc:
+            response = exception_handler(exc, {'view': self, 'request': request})
+            response['WWW-Authenticate'] = 'Bearer realm="api"'
+            return render(response)
+
+        response = StreamingHttpResponse(events.stream(events.hub.subscribe(user)), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Or nginx holds the events back to fill its buffer
+        return response
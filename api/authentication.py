@@ -0,0 +1,151 @@
+"""
+Opt-in stateless JWT authentication for read-heavy views.
+
+JWTAuthentication loads the User row on every request. The access tokens issued by
+MyTokenObtainPairSerializer already carry the user's id and role, which is all most list
+views look at, so ClaimsJWTAuthentication returns a ClaimsUser built from those claims and
+only reads the User row when a view asks for something the token does not carry.
+
+Access tokens cannot be blacklisted, so revocation means the user was deactivated, deleted,
+changed role or (with SIMPLE_JWT CHECK_REVOKE_TOKEN) changed password. That state is read
+through `user_states`, an in-process TTLCache: one small query per user every
+settings.HMS_AUTH_STATE_TTL seconds instead of one per request. A User save or delete evicts
+the entry in the process that made it; other processes notice within the TTL.
+
+Views that use request.user in ORM lookups must go through user.pk, since a ClaimsUser is
+not a model instance. The mode is off unless settings.HMS_STATELESS_AUTH is set; the
+classes then behave exactly like JWTAuthentication.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.utils.crypto import constant_time_compare
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import cached_property
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from api.cache import TTLCache
+from api.models import User
+
+user_states = TTLCache(ttl=settings.HMS_AUTH_STATE_TTL, max_entries=settings.HMS_AUTH_STATE_MAX_ENTRIES)
+
+
+def claimed_user_id(validated_token):
+    # Simple JWT stores the id as a string; cast it back so it matches User.pk everywhere
+    try:
+        return User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+    except (KeyError, ValidationError):
+        raise InvalidToken("Token contained no recognizable user identification")
+
+
+def user_state(user_id):
+    """Return (is_active, role, revoke_claim) for `user_id`, or None if there is no such user."""
+    state = user_states.get(user_id)
+    if state is None:
+        row = User.objects.filter(pk=user_id).values_list('is_active', 'role', 'password').first()
+        if row is None:
+            return None
+        is_active, role, password = row
+        revoke_claim = get_md5_hash_password(password) if api_settings.CHECK_REVOKE_TOKEN else None
+        state = (is_active, role, revoke_claim)
+        user_states.set(user_id, state)
+    return state
+
+
+class ClaimsUser(TokenUser):
+    """A user built from access-token claims; the User row is loaded once, only if needed."""
+
+    @cached_property
+    def id(self):
+        return claimed_user_id(self.token)
+
+    @cached_property
+    def user(self):
+        return User.objects.select_related('profile').get(pk=self.pk)
+
+    def claim(self, name):
+        return self.token[name] if name in self.token else getattr(self.user, name)
+
+    # TokenUser defaults these to ''/False when the claim is missing; compact tokens never carry them
+    username = cached_property(lambda self: self.claim('username'))
+    is_staff = cached_property(lambda self: self.claim('is_staff'))
+    is_superuser = cached_property(lambda self: self.claim('is_superuser'))
+
+    @cached_property
+    def role(self):
+        return self.claim('role')
+
+    def __getattr__(self, attr):
+        if attr.startswith('_') or attr == 'token':
+            raise AttributeError(attr)
+        if attr in self.token:
+            return self.token[attr]
+        return getattr(self.user, attr)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if not settings.HMS_STATELESS_AUTH:
+            return super().get_user(validated_token)
+        state = user_state(claimed_user_id(validated_token))
+        if state is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        is_active, role, revoke_claim = state
+        if api_settings.CHECK_USER_IS_ACTIVE and not is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != revoke_claim:
+            raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+        if validated_token.get('role', role) != role:
+            # The role changed after the token was issued: trust the database, not the claim
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Lets a metrics scraper in with `Authorization: Bearer <settings.HMS_METRICS_TOKEN>`.
+
+    The request stays anonymous with request.auth set to 'metrics'; any other bearer token is
+    left to the next authentication class.
+    """
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if not settings.HMS_METRICS_TOKEN or len(header) != 2 or header[0].lower() != b'bearer':
+            return None
+        if not constant_time_compare(header[1], settings.HMS_METRICS_TOKEN.encode()):
+            return None
+        return (AnonymousUser(), 'metrics')
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
+
+
+async def aauthenticate(request):
+    """
+    Authenticate a Django request for an async view, as ClaimsJWTAuthentication would.
+
+    Returns None when the request carries no bearer token; raises InvalidToken or
+    AuthenticationFailed like the sync class. Decoding the token is pure CPU work; the
+    user-state or User lookup runs through sync_to_async.
+    """
+    authentication = ClaimsJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    validated_token = authentication.get_validated_token(raw_token)
+    return await sync_to_async(authentication.get_user)(validated_token)
+
+
+def forget_user_state(sender, instance, **kwargs):
+    user_states.discard(instance.pk)
+
+post_save.connect(forget_user_state, sender=User)
+post_delete.connect(forget_user_state, sender=User)
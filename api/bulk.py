@@ -0,0 +1,237 @@
+"""
+Set-based writes behind POST /api/appointments/bulk/.
+
+A batch has up to three sections, processed as cancel -> update -> create so that slots
+freed earlier in the batch can be reused later in it:
+
+    {"cancel": [12, 13], "update": [{"id": 14, "status": "confirmed"}], "create": [{...}, ...]}
+
+Rows are validated with AppointmentSerializer (many=True for creates). Every invalid row is
+reported and skipped; the valid rows are written together. The overlap check for all moved
+and new bookings is one range query over the affected doctors, followed by in-memory
+IntervalIndex lookups that also catch collisions between rows of the same batch. The
+writes then go out as one UPDATE for cancellations, one bulk_update and one bulk_create,
+plus one insert for their background tasks (api/tasks.py), in a single transaction holding
+the doctors' row locks (see scheduling.locked_write). Their events go to the appointment
+event streams (api/events.py) once it commits.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+from api import events
+from api.models import User, Profile, Appointment
+from api.scheduling import IntervalIndex, locked_write
+from api.serializers import AppointmentSerializer
+from api.tasks import appointment_tasks, enqueue_many
+
+
+def scoped_appointments(user):
+    # Admins may touch any appointment, doctors only their own
+    if user.role == User.ADMIN:
+        return Appointment.objects.all()
+    return Appointment.objects.filter(doctor=user)
+
+
+def row_result(index, code, **extra):
+    return {"index": index, "status": code, **extra}
+
+
+def target_slot(instance, attrs):
+    # Where an updated appointment ends up; reads doctor_id so no doctor row is loaded
+    doctor_id = attrs['doctor'].pk if 'doctor' in attrs else instance.doctor_id
+    return doctor_id, attrs.get('appointment_date', instance.appointment_date)
+
+
+def parse_ids(values, section):
+    if not isinstance(values, list) or not all(isinstance(value, int) for value in values):
+        raise ValidationError({section: "Expected a list of appointment ids."})
+    return values
+
+
+class BulkAppointmentWriter:
+    def __init__(self, request):
+        self.request = request
+        self.user = request.user
+        self.context = {'request': request}
+        self.results = {"cancel": [], "update": [], "create": []}
+
+    def run(self, payload):
+        if not isinstance(payload, dict):
+            raise ValidationError({"detail": "Expected an object with cancel, update and/or create lists."})
+        cancels = parse_ids(payload.get('cancel', []), 'cancel')
+        updates = payload.get('update', [])
+        creates = payload.get('create', [])
+        if not isinstance(updates, list) or not isinstance(creates, list):
+            raise ValidationError({"detail": "update and create must be lists."})
+        if len(cancels) + len(updates) + len(creates) > settings.HMS_BULK_MAX_ITEMS:
+            raise ValidationError({"detail": f"A batch may hold at most {settings.HMS_BULK_MAX_ITEMS} items."})
+
+        to_cancel = self.validate_cancels(cancels)
+        to_update = self.validate_updates(updates)
+        to_create = self.validate_creates(creates)
+
+        doctor_ids = {attrs['doctor'].pk for _, attrs in to_create}
+        for _, instance, attrs in to_update:
+            doctor_ids |= {instance.doctor_id, target_slot(instance, attrs)[0]}
+        if to_cancel or to_update or to_create:
+            written = locked_write(doctor_ids, lambda: self.write(to_cancel, to_update, to_create))
+            for section, results in written.items():
+                self.results[section] += results
+        for results in self.results.values():
+            results.sort(key=lambda result: result["index"])
+        return self.results
+
+    def validate_cancels(self, ids):
+        found = scoped_appointments(self.user).in_bulk(ids)
+        to_cancel = []
+        for index, pk in enumerate(ids):
+            if pk in found:
+                to_cancel.append((index, found[pk]))
+            else:
+                self.results["cancel"].append(row_result(index, status.HTTP_404_NOT_FOUND, id=pk))
+        return to_cancel
+
+    def validate_updates(self, items):
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        instances = scoped_appointments(self.user).in_bulk([pk for pk in ids if isinstance(pk, int)])
+        to_update = []
+        for index, item in enumerate(items):
+            instance = instances.get(item.get('id')) if isinstance(item, dict) else None
+            if instance is None:
+                self.results["update"].append(row_result(index, status.HTTP_404_NOT_FOUND))
+                continue
+            data = {key: value for key, value in item.items() if key != 'id'}
+            serializer = AppointmentSerializer(instance, data=data, partial=True, context=self.context)
+            if not serializer.is_valid():
+                self.results["update"].append(row_result(index, status.HTTP_400_BAD_REQUEST, errors=serializer.errors))
+                continue
+            attrs = serializer.validated_data
+            if self.user.role == User.DOCTOR:
+                attrs['doctor'] = self.user  # Doctors cannot hand appointments to someone else
+            to_update.append((index, instance, attrs))
+        return to_update
+
+    def validate_creates(self, items):
+        serializer = AppointmentSerializer(data=items, many=True, context=self.context)
+        serializer.is_valid()
+        for index, errors in serializer.row_errors.items():
+            self.results["create"].append(row_result(index, status.HTTP_400_BAD_REQUEST, errors=errors))
+
+        to_create = []
+        for index, attrs in serializer.validated_data:
+            if self.user.role == User.DOCTOR:
+                attrs['doctor'] = self.user
+            missing = [field for field in ('doctor', 'patient') if not attrs.get(field)]
+            if missing:
+                errors = {field: ["This field is required."] for field in missing}
+                self.results["create"].append(row_result(index, status.HTTP_400_BAD_REQUEST, errors=errors))
+                continue
+            to_create.append((index, attrs))
+        return to_create
+
+    def write(self, to_cancel, to_update, to_create):
+        # Runs inside locked_write's transaction, possibly more than once on retry,
+        # so it collects its results locally instead of touching self.results
+        results = {"cancel": [], "update": [], "create": []}
+        now = timezone.now()
+        canceled_ids = {instance.pk for _, instance in to_cancel}
+        # Updates that take a new slot: moved, or reopened after a cancellation
+        moving = [
+            (index, instance, attrs) for index, instance, attrs in to_update
+            if attrs.get('status', instance.status) != 'canceled' and (
+                target_slot(instance, attrs) != (instance.doctor_id, instance.appointment_date)
+                or instance.status == 'canceled'
+            )
+        ]
+        booked = self.load_schedules(
+            [target_slot(instance, attrs) for _, instance, attrs in moving]
+            + [(attrs['doctor'].pk, attrs['appointment_date']) for _, attrs in to_create],
+            ignore=canceled_ids | {instance.pk for _, instance, _ in moving},
+        )
+
+        Appointment.objects.filter(pk__in=canceled_ids).update(status='canceled', updated_at=now)
+        results["cancel"] += [row_result(index, status.HTTP_200_OK, id=instance.pk) for index, instance in to_cancel]
+
+        moving_ids = {instance.pk for _, instance, _ in moving}
+        changed, fields = [], {'updated_at'}
+        for index, instance, attrs in to_update:
+            if instance.pk in moving_ids:
+                if not booked.claim(*target_slot(instance, attrs)):
+                    results["update"].append(row_result(index, status.HTTP_409_CONFLICT, id=instance.pk))
+                    continue
+            for field, value in attrs.items():
+                setattr(instance, field, value)
+            instance.updated_at = now  # bulk_update skips auto_now
+            fields.update(attrs)
+            changed.append((index, instance))
+        Appointment.objects.bulk_update([instance for _, instance in changed], fields=sorted(fields))
+        results["update"] += [row_result(index, status.HTTP_200_OK, id=instance.pk) for index, instance in changed]
+
+        new = []
+        for index, attrs in to_create:
+            if not booked.claim(attrs['doctor'].pk, attrs['appointment_date']):
+                results["create"].append(row_result(index, status.HTTP_409_CONFLICT))
+                continue
+            new.append((index, Appointment(**attrs)))
+        Appointment.objects.bulk_create([appointment for _, appointment in new])
+        results["create"] += [row_result(index, status.HTTP_201_CREATED, id=appointment.pk) for index, appointment in new]
+
+        # Set-based writes send no post_save, so their side effects are enqueued here, in one insert
+        for _, instance in to_cancel:
+            instance.status = 'canceled'
+            instance.updated_at = now
+        enqueue_many(
+            [task for _, instance in to_cancel + changed for task in appointment_tasks(instance)]
+            + [task for _, appointment in new for task in appointment_tasks(appointment, created=True)]
+        )
+        events.publish(
+            [events.event(instance) for _, instance in to_cancel + changed]
+            + [events.event(appointment, created=True) for _, appointment in new]
+        )
+        return results
+
+    def load_schedules(self, wanted, ignore):
+        """Load the active bookings around every (doctor_id, start) in `wanted` with one query."""
+        schedules = DoctorSchedules(dict(
+            Profile.objects.filter(user_id__in={doctor_id for doctor_id, _ in wanted}).values_list('user_id', 'slot_duration')
+        ))
+        if not wanted:
+            return schedules
+        longest = max(schedules.length(doctor_id) for doctor_id, _ in wanted)
+        starts = [start for _, start in wanted]
+        existing = Appointment.objects.filter(
+            doctor_id__in={doctor_id for doctor_id, _ in wanted},
+            appointment_date__gt=min(starts) - longest,
+            appointment_date__lt=max(starts) + longest,
+        ).exclude(status='canceled').exclude(pk__in=ignore)
+        booked = {}
+        for doctor_id, start in existing.values_list('doctor_id', 'appointment_date'):
+            booked.setdefault(doctor_id, []).append((start, start + schedules.length(doctor_id)))
+        schedules.indexes = {doctor_id: IntervalIndex(intervals) for doctor_id, intervals in booked.items()}
+        return schedules
+
+
+class DoctorSchedules:
+    """Per-doctor IntervalIndex of booked slots, keyed by doctor id."""
+
+    def __init__(self, slot_minutes):
+        self.slot_minutes = slot_minutes
+        self.indexes = {}
+
+    def length(self, doctor_id):
+        return timedelta(minutes=self.slot_minutes.get(doctor_id) or settings.HMS_DEFAULT_SLOT_MINUTES)
+
+    def add(self, doctor_id, start):
+        self.indexes.setdefault(doctor_id, IntervalIndex()).add(start, start + self.length(doctor_id))
+
+    def claim(self, doctor_id, start):
+        """Book `start` for the doctor unless it overlaps a slot already held; return whether it was free."""
+        end = start + self.length(doctor_id)
+        if self.indexes.get(doctor_id, IntervalIndex()).overlaps(start, end):
+            return False
+        self.add(doctor_id, start)
+        return True
@@ -0,0 +1,141 @@
+"""
+Cached read responses with generation-based invalidation and ETags.
+
+Entries live under a namespace ("doctors", "profile:<user id>", ...). Each namespace has a
+generation counter that is part of every key, so invalidating a namespace is one counter
+bump: stale entries are never read again and simply age out. The post_save/post_delete
+receivers in api/models.py bump the namespaces a write affects, once its transaction commits.
+
+Which cache holds the entries is set by settings.HMS_CACHE_BACKEND (see hms/settings.py).
+The default local-memory cache is per process, so with several worker processes pick the
+file or database backend, or a write made in one process is only seen by the others once
+their copies expire (settings.HMS_CACHE_TIMEOUT).
+
+Every cached body carries an ETag; a request whose If-None-Match matches gets an empty 304.
+
+TTLCache is a separate, much smaller tool: a bounded in-process map for values that must
+be read without any I/O at all, such as the per-user auth state in api/authentication.py.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def get_cache():
+    return caches[settings.HMS_CACHE_ALIAS]
+
+
+# Counters start from the clock, not from 1: a backend that culls entries (the file and database
+# ones) can drop a counter while entries keyed on its old values remain, and a restart at 1
+# would make those current again
+new_generation = time.time_ns
+
+
+def generation(namespace):
+    return get_cache().get_or_set(f'hms:gen:{namespace}', new_generation, timeout=None)
+
+
+def invalidate(*namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        key = f'hms:gen:{namespace}'
+        try:
+            cache.incr(key)
+        except ValueError:  # Never read since the cache started, or culled; nothing to invalidate
+            cache.add(key, new_generation(), timeout=None)
+
+
+def make_etag(data):
+    body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+    return '"%s"' % hashlib.sha1(body.encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match', '')
+    return header.strip() == '*' or etag in [tag.strip() for tag in header.split(',')]
+
+
+def cached_response(request, namespace, build, key=None):
+    """
+    Return the cached body for `key` in `namespace`, or call build() to produce and cache it.
+
+    `key` defaults to the absolute request URL, so query parameters (page, cursor, ...) each
+    get their own entry. build() must return plain JSON-compatible data, e.g. serializer.data.
+    """
+    cache = get_cache()
+    cache_key = entry_key(request, namespace, generation(namespace), key)
+    entry = cache.get(cache_key)
+    if entry is None:
+        data = build()
+        entry = (make_etag(data), data)
+        cache.set(cache_key, entry, timeout=settings.HMS_CACHE_TIMEOUT)
+    return entry_response(request, entry)
+
+
+async def acached_response(request, namespace, build, key=None):
+    """cached_response() for async views: `build` is a coroutine function."""
+    cache = get_cache()
+    gen = await cache.aget_or_set(f'hms:gen:{namespace}', new_generation, timeout=None)
+    cache_key = entry_key(request, namespace, gen, key)
+    entry = await cache.aget(cache_key)
+    if entry is None:
+        data = await build()
+        entry = (make_etag(data), data)
+        await cache.aset(cache_key, entry, timeout=settings.HMS_CACHE_TIMEOUT)
+    return entry_response(request, entry)
+
+
+def entry_key(request, namespace, gen, key=None):
+    key = key or request.build_absolute_uri()
+    return 'hms:%s:%s:%s' % (namespace, gen, hashlib.md5(key.encode()).hexdigest())
+
+
+def entry_response(request, entry):
+    etag, data = entry
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(data, headers={'ETag': etag})
+
+
+class TTLCache:
+    """A thread-safe in-process map whose entries expire `ttl` seconds after they are set."""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)  # Oldest first
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
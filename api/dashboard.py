@@ -0,0 +1,110 @@
+"""
+The numbers behind GET /api/dashboard/, aggregated by the database.
+
+Over the caller's appointments (every one for an admin, their own for a doctor or a
+patient) it reports:
+
+- counts per status, and the total;
+- active (not canceled) appointments still ahead today and in the rest of this week;
+- per-doctor load: the settings.HMS_DASHBOARD_DOCTORS doctors with the most active
+  appointments, with their counts per status;
+- revenue: each doctor's current consultation fee times their confirmed appointments.
+
+Everything but the two upcoming counts derives from appointment counts per doctor and
+status: one GROUP BY over the appointments, or, for admins and doctors with
+settings.HMS_DASHBOARD_SUMMARY, a read of api_appointmentsummary, which holds exactly those
+counts (a few rows per doctor, however many appointments there are) and is kept current by
+database triggers on every appointment write (migration 0011). A patient's appointments are
+few and are always grouped directly. The upcoming counts depend on the clock, so they are
+always counted, from the date index, over at most a week of appointments. Revenue comes
+from the confirmed counts and the doctors' fees, summed by the database over the summary
+table, and only the listed doctors' names are read: four queries in all.
+
+On SQLite, a later migration that rebuilds api_appointment (Django does that for most column
+changes) drops the triggers with the old table and must create them again.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from api import permissions
+from api.models import User, Profile, Appointment, AppointmentSummary
+
+STATUSES = [status for status, _ in Appointment.STATUS_CHOICES]
+ACTIVE = ~Q(status='canceled')  # Appointments without a status hold their slot too
+
+
+def tallies(user):
+    """(doctor id, status, count) for the caller's appointments; the status is '' when unset."""
+    if settings.HMS_DASHBOARD_SUMMARY and user.role in (User.ADMIN, User.DOCTOR):
+        rows = AppointmentSummary.objects.filter(count__gt=0)
+        if user.role == User.DOCTOR:
+            rows = rows.filter(doctor_id=user.pk)
+        return list(rows.values_list('doctor_id', 'status', 'count'))
+    rows = (Appointment.objects.filter(permissions.appointments(user)).order_by().values('doctor_id', 'status')
+            .annotate(count=Count('id')).values_list('doctor_id', 'status', 'count'))
+    return [(doctor_id, status or '', count) for doctor_id, status, count in rows]
+
+
+def upcoming(user, now=None):
+    """Active appointments from `now` to the end of today and to the end of the week (Sunday)."""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    tomorrow = timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min))
+    next_week = timezone.make_aware(datetime.combine(today + timedelta(days=7 - today.weekday()), time.min))
+    return Appointment.objects.filter(
+        permissions.appointments(user), ACTIVE, appointment_date__gte=now, appointment_date__lt=next_week
+    ).aggregate(today=Count('id', filter=Q(appointment_date__lt=tomorrow)), this_week=Count('id'))
+
+
+def revenue(user, load):
+    """Current consultation fees times confirmed appointments; `load` holds the confirmed counts per doctor."""
+    if settings.HMS_DASHBOARD_SUMMARY and user.role in (User.ADMIN, User.DOCTOR):
+        rows = AppointmentSummary.objects.filter(status='confirmed')
+        if user.role == User.DOCTOR:
+            rows = rows.filter(doctor_id=user.pk)
+        total = rows.aggregate(total=Sum(F('count') * F('doctor__profile__consultation_fees')))['total']
+        return Decimal(total or 0)
+    # Grouped directly: the doctors are a patient's few, or this is the slow path anyway
+    fees = Profile.objects.filter(user_id__in=list(load)).values_list('user_id', 'consultation_fees')
+    return sum(((fee or 0) * load[doctor_id]['confirmed'] for doctor_id, fee in fees), Decimal(0))
+
+
+def summary(user, now=None):
+    counts = dict.fromkeys(STATUSES, 0)
+    total = 0
+    load = {}
+    for doctor_id, status, count in tallies(user):
+        total += count
+        if status in counts:
+            counts[status] += count
+        per_status = load.setdefault(doctor_id, dict.fromkeys(STATUSES, 0) | {'total': 0})
+        per_status['total'] += count
+        if status in per_status:
+            per_status[status] += count
+
+    # Busiest first: the appointments still holding a slot
+    busiest = sorted(load, key=lambda doctor_id: (load[doctor_id]['canceled'] - load[doctor_id]['total'], doctor_id))
+    busiest = busiest[:settings.HMS_DASHBOARD_DOCTORS]
+    profiles = {
+        row[0]: row[1:] for row in Profile.objects.filter(user_id__in=busiest).values_list(
+            'user_id', 'first_name', 'last_name', 'specialization', 'consultation_fees'
+        )
+    }
+    doctors = []
+    for doctor_id in busiest:
+        first_name, last_name, specialization, fee = profiles.get(doctor_id, (None, None, None, None))
+        doctors.append({
+            'id': doctor_id, 'first_name': first_name, 'last_name': last_name, 'specialization': specialization,
+            **load[doctor_id], 'revenue': f'{(fee or 0) * load[doctor_id]["confirmed"]:.2f}',
+        })
+
+    return {
+        'counts': counts | {'total': total},
+        'upcoming': upcoming(user, now),
+        'revenue': f'{revenue(user, load):.2f}',
+        'doctors': doctors,
+    }
@@ -0,0 +1,168 @@
+"""
+In-process pub/sub for GET /api/appointments/events/, a Server-Sent Events stream.
+
+Every appointment created, updated, canceled or deleted, through a model save or delete or
+through api/bulk.py, is published once its transaction commits, to the subscribers allowed
+to see it: admins get every event, doctors and patients those of their own appointments
+(and of one just taken from them, so they can drop it). An event carries the appointment's
+id, doctor, patient, status and dates; clients fetch anything more, or catch up after a
+reconnect, through /api/appointments/changes/ (api/sync.py).
+
+The hub keeps its subscribers indexed by audience ('admin', or a doctor's or patient's
+id), so publishing costs one lookup per audience plus one callback per event loop,
+however many connections are open. An event is encoded once and the same bytes are
+queued for every recipient. A subscriber is a deque and an asyncio.Event, and an idle
+stream is a coroutine waiting on that event with a timeout for the keep-alive comment:
+a few kilobytes per connection, no thread and no database connection.
+
+Writes happen on worker threads (sync views, sync_to_async), so publish() hands the
+events to each subscriber's event loop with call_soon_threadsafe. A subscriber that falls
+settings.HMS_EVENTS_BUFFER events behind is sent an `overflow` event and disconnected
+rather than buffered without bound; its client reconnects and syncs.
+
+Only writes made in this process are seen: run one ASGI worker for the streams, or put a
+broker (e.g. Postgres LISTEN/NOTIFY) in front of publish() to serve them from several.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from api.models import User
+
+
+class Subscriber:
+    def __init__(self, user, loop):
+        self.audience = 'admin' if user.role == User.ADMIN else (user.role, user.pk)
+        self.loop = loop
+        self.pending = deque()
+        self.ready = asyncio.Event()
+        self.overflowed = False
+
+    def deliver(self, message):
+        # On the subscriber's loop
+        if len(self.pending) >= settings.HMS_EVENTS_BUFFER:
+            self.overflowed = True
+        else:
+            self.pending.append(message)
+        self.ready.set()
+
+
+class Hub:
+    def __init__(self):
+        self.lock = threading.Lock()  # Subscriptions change on event loops, publishing happens on worker threads
+        self.audiences = {}
+
+    def subscribe(self, user):
+        subscriber = Subscriber(user, asyncio.get_running_loop())
+        with self.lock:
+            self.audiences.setdefault(subscriber.audience, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            audience = self.audiences.get(subscriber.audience, set())
+            audience.discard(subscriber)
+            if not audience:
+                self.audiences.pop(subscriber.audience, None)
+
+    def count(self):
+        with self.lock:
+            return sum(len(subscribers) for subscribers in self.audiences.values())
+
+    def publish(self, events):
+        """Send each event, as made by event(), to its audience."""
+        by_loop = {}
+        with self.lock:
+            if not self.audiences:
+                return
+            for data, audiences in events:
+                message = encode(data)
+                for audience in audiences:
+                    for subscriber in self.audiences.get(audience, ()):
+                        by_loop.setdefault(subscriber.loop, []).append((subscriber, message))
+        for loop, deliveries in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(deliver_all, deliveries)
+            except RuntimeError:
+                pass  # The loop has closed; its subscribers are going away with it
+
+
+def deliver_all(deliveries):
+    for subscriber, message in deliveries:
+        subscriber.deliver(message)
+
+
+hub = Hub()
+
+
+def encode(data, name='appointment'):
+    return f'event: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'.encode()
+
+
+def event(appointment, created=False, deleted=False):
+    """(data, audiences) for one saved or deleted appointment, compared with how it was loaded."""
+    before = getattr(appointment, '_loaded', {})
+    if deleted:
+        kind = 'deleted'
+    elif created:
+        kind = 'created'
+    elif appointment.status == 'canceled' and before.get('status', 'canceled') != 'canceled':
+        kind = 'canceled'
+    else:
+        kind = 'updated'
+    data = {
+        'kind': kind,
+        'id': appointment.pk,
+        'doctor': appointment.doctor_id,
+        'patient': appointment.patient_id,
+        'status': appointment.status,
+        'appointment_date': appointment.appointment_date,
+        'updated_at': appointment.updated_at,
+    }
+    audiences = {'admin', (User.DOCTOR, appointment.doctor_id), (User.PATIENT, appointment.patient_id)}
+    # The doctor or patient it was taken from, if it moved
+    audiences |= {(User.DOCTOR, before['doctor_id'])} if 'doctor_id' in before else set()
+    audiences |= {(User.PATIENT, before['patient_id'])} if 'patient_id' in before else set()
+    return data, audiences
+
+
+def publish(events):
+    """Publish `events` once the current transaction commits (at once outside one)."""
+    if events:
+        transaction.on_commit(lambda: hub.publish(events))
+
+
+def appointment_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        publish([event(instance, created=created)])
+
+
+def appointment_deleted(sender, instance, **kwargs):
+    publish([event(instance, deleted=True)])
+
+
+async def stream(subscriber):
+    """The event stream of one subscriber, with keep-alive comments while it is idle."""
+    try:
+        yield b'retry: 3000\n\n' + encode({}, 'ready')
+        while True:
+            try:
+                await asyncio.wait_for(subscriber.ready.wait(), settings.HMS_EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+                continue
+            subscriber.ready.clear()
+            if subscriber.pending:
+                messages = b''.join(subscriber.pending)
+                subscriber.pending.clear()
+                yield messages
+            if subscriber.overflowed:
+                yield encode({}, 'overflow')
+                return
+    finally:
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,138 @@
+"""
+Streaming CSV and NDJSON exports: GET /api/appointments/export/ and /api/patients/export/.
+
+The format is ?format=csv (the default) or ?format=ndjson, or the Accept header (text/csv,
+application/x-ndjson). The role checks are the list views': appointments are those the
+caller may list, narrowed by the same filters (AppointmentFilterBackend), and only doctors
+and admins may export patients.
+
+No export is ever held in memory. The rows are read as tuples from a values_list() query
+with .iterator(), settings.HMS_EXPORT_CHUNK_SIZE at a time (through a server-side cursor on
+Postgres), and each chunk is encoded into one piece of a StreamingHttpResponse, which the
+server sends before the next chunk is read. Under ASGI the chunks are read through
+sync_to_async: an async server reads a synchronous stream to the end before sending it.
+
+Spreadsheets run a cell that starts with =, +, - or @ as a formula, so CSV text values
+starting with one of those are prefixed with a quote.
+"""
+import csv
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+# Column name -> values_list() lookup
+APPOINTMENT_COLUMNS = {
+    'id': 'id',
+    'appointment_date': 'appointment_date',
+    'status': 'status',
+    'reason': 'reason',
+    'doctor_id': 'doctor_id',
+    'doctor_first_name': 'doctor__profile__first_name',
+    'doctor_last_name': 'doctor__profile__last_name',
+    'specialization': 'doctor__profile__specialization',
+    'consultation_fees': 'doctor__profile__consultation_fees',
+    'patient_id': 'patient_id',
+    'patient_first_name': 'patient__profile__first_name',
+    'patient_last_name': 'patient__profile__last_name',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+PATIENT_COLUMNS = {
+    'id': 'id',
+    'username': 'username',
+    'email': 'email',
+    'first_name': 'profile__first_name',
+    'last_name': 'profile__last_name',
+    'gender': 'profile__gender',
+    'date_of_birth': 'profile__date_of_birth',
+    'age': 'profile__age',
+    'phone_number': 'profile__phone_number',
+    'address': 'profile__address',
+    'medical_history': 'profile__medical_history',
+    'date_joined': 'date_joined',
+}
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')  # What spreadsheets may read as the start of a formula
+
+
+class ExportRenderer(BaseRenderer):
+    """Names an export format for content negotiation; exports stream their own body."""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only error responses get here
+        return json.dumps(data, cls=DjangoJSONEncoder).encode(self.charset)
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+def csv_cell(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(columns, rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([csv_cell(value) for value in row])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(columns, rows, chunk_size):
+    encoder = DjangoJSONEncoder()
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(dict(zip(columns, row))))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+ENCODERS = {'csv': csv_chunks, 'ndjson': ndjson_chunks}
+
+
+async def async_chunks(chunks):
+    # One thread for the whole export: the cursor behind `chunks` belongs to its connection
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def stream(request, filename, columns, queryset):
+    """Stream `queryset` as the `columns` (see APPOINTMENT_COLUMNS) in the negotiated format."""
+    renderer = request.accepted_renderer
+    chunk_size = settings.HMS_EXPORT_CHUNK_SIZE
+    # Pick the database now: the rows are read after the view returns, outside any replica routing it set up
+    queryset = queryset.using(queryset.db)
+    rows = queryset.values_list(*columns.values()).iterator(chunk_size=chunk_size)
+    chunks = ENCODERS[renderer.format](list(columns), rows, chunk_size)
+    if settings.HMS_ASYNC_VIEWS:
+        chunks = async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=f'{renderer.media_type}; charset={renderer.charset}')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{renderer.format}"'
+    return response
@@ -0,0 +1,59 @@
+"""
+Compact rows and sparse fieldsets for GET /api/appointments/, /api/doctors/ and /api/patients/.
+
+List rows used to nest every profile column, address and medical history included, once
+per user and twice per appointment, though the list screens show a name, an email and a
+specialization. By default the lists now return compact rows (the *SummarySerializer
+classes of api/serializers.py), and two query parameters adjust them:
+
+    ?fields=id,status,appointment_date     only these top-level fields
+    ?expand=patient_detail                 this nested user (or profile) in full
+
+The rows are read and serialized through the plan of the resulting class (api/plans.py),
+so columns nobody asked for are not read, and a nested user nobody asked for is not even
+joined. The detail endpoints, search and delta sync keep the full representation.
+"""
+import copy
+from functools import lru_cache
+
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+def requested(request, param):
+    """The comma-separated names of ?<param>=, or None when it is absent."""
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return frozenset(name.strip() for name in value.split(',') if name.strip())
+
+
+def serializer_class(request, compact, full):
+    """
+    `compact`, or a subclass of it with only the ?fields= asked for and the nested fields of
+    ?expand= declared as in `full`. Unknown names are a 400.
+    """
+    fields, expand = requested(request, 'fields'), requested(request, 'expand') or frozenset()
+    names = compact.Meta.fields
+    expandable = [name for name, field in compact._declared_fields.items() if isinstance(field, serializers.BaseSerializer)]
+    errors = {}
+    if fields is not None and not fields <= set(names):
+        errors['fields'] = f"Unknown field(s): {', '.join(sorted(fields - set(names)))}. Choose from: {', '.join(names)}."
+    if not expand <= set(expandable):
+        errors['expand'] = (f"Cannot expand: {', '.join(sorted(expand - set(expandable)))}. "
+                            f"Choose from: {', '.join(expandable)}.")
+    if errors:
+        raise ValidationError(errors)
+    if fields is None and not expand:
+        return compact
+    return trimmed(compact, full, fields, expand)
+
+
+@lru_cache(maxsize=256)  # Bounded anyway: one class per valid combination
+def trimmed(compact, full, fields, expand):
+    names = [name for name in compact.Meta.fields if fields is None or name in fields]
+    # DRF insists that fields declared on the subclass itself are listed, so only declare kept ones
+    declared = {name: copy.deepcopy(full._declared_fields[name]) for name in expand if name in names}
+    meta = type('Meta', (compact.Meta,), {'fields': names})
+    return type(compact.__name__, (compact,), {**declared, 'Meta': meta})
+
@@ -0,0 +1,71 @@
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from api.models import Appointment
+
+
+def parse_datetime_param(params, name, default_time=time.min):
+    """
+    Read an ISO 8601 date or datetime query parameter as an aware datetime.
+
+    A bare date is combined with `default_time`, so ranges can pass time.min for a lower
+    bound and time.max for an inclusive upper bound. Returns None when the parameter is absent.
+    """
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime.combine(day, default_time) if day else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: 'Must be an ISO 8601 date or datetime.'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class AppointmentFilterBackend(BaseFilterBackend):
+    """
+    Server-side filtering for appointment lists.
+
+    Supported query parameters: ``doctor``, ``patient`` (user ids), ``status`` (one of the
+    Appointment status choices, comma separated for several) and ``date_from`` / ``date_to``
+    (ISO date or datetime, inclusive). The role scoping done in the view's get_queryset is
+    applied first, so these can only narrow what the caller is already allowed to see.
+    """
+    valid_statuses = {choice for choice, _ in Appointment.STATUS_CHOICES}
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        for field in ('doctor', 'patient'):
+            value = params.get(field)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({field: 'Must be a user id.'})
+                queryset = queryset.filter(**{f'{field}_id': int(value)})
+
+        status = params.get('status')
+        if status:
+            statuses = status.split(',')
+            unknown = set(statuses) - self.valid_statuses
+            if unknown:
+                raise ValidationError({'status': f'Unknown status: {", ".join(sorted(unknown))}.'})
+            queryset = queryset.filter(status__in=statuses)
+
+        date_from = parse_datetime_param(params, 'date_from', time.min)
+        if date_from:
+            queryset = queryset.filter(appointment_date__gte=date_from)
+        date_to = parse_datetime_param(params, 'date_to', time.max)
+        if date_to:
+            queryset = queryset.filter(appointment_date__lte=date_to)
+
+        return queryset
@@ -0,0 +1,222 @@
+"""
+Bulk user import, behind `python manage.py import_users` and POST /api/users/import/.
+
+Rows are read one at a time from CSV (a header line, then one user per line) or NDJSON (one
+JSON object per line), or taken from a JSON array. Every row has a username, email,
+password and role, and may carry any of PROFILE_FIELDS; empty CSV cells count as missing.
+
+Rows are checked as RegisterView checks one registration: the username and email field
+validators, the role choices, the password validators and the profile field types. The
+uniqueness checks are set lookups: the existing usernames and emails are read with one
+query before the first row, and every accepted row adds its own, so duplicates within the
+import are caught too. Rejected rows are reported with their errors and skipped.
+
+Accepted rows go to the database settings.HMS_IMPORT_BATCH_SIZE at a time: their passwords
+are hashed in a pool of settings.HMS_IMPORT_WORKERS processes (PBKDF2 takes most of the
+time, and one process hashes on one core), then the users and their profiles are written
+with one bulk_create each, in one transaction per batch. bulk_create sends no signals, so
+the profiles are built here, and the cached doctor directory is invalidated once at the end
+if any doctors came in. No appointments are involved, so no task is queued.
+
+The endpoint only validates: it stores the rows as a UserImport and answers 202, and the
+`import_users` task (api/tasks.py) runs them under `run_tasks`, a request being far too
+short for thousands of hashes. GET /api/users/import/<id>/ returns the report once it has.
+"""
+import codecs
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from api import cache
+from api.models import User, Profile
+
+USER_FIELDS = ['username', 'email', 'password', 'role']
+PROFILE_FIELDS = [
+    'first_name', 'middle_name', 'last_name', 'gender', 'phone_number', 'address', 'date_of_birth',
+    'medical_history', 'specialization', 'consultation_fees', 'license_number', 'slot_duration',
+]
+FORMATS = ['csv', 'ndjson', 'json']
+
+
+def csv_rows(lines):
+    for row in csv.DictReader(lines):
+        yield {key: value for key, value in row.items() if value not in ('', None)}
+
+
+def ndjson_rows(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_rows(stream, format):
+    """Rows of a binary stream (an open file, or a request) in `format`, read as they are needed."""
+    if format == 'json':
+        rows = json.load(stream)
+        if not isinstance(rows, list):
+            raise ValueError('Expected a JSON array of users.')
+        return iter(rows)
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    return csv_rows(lines) if format == 'csv' else ndjson_rows(lines)
+
+
+def age_on(born, today):
+    # As Profile.save would, which bulk_create skips
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+def setup_worker():
+    # Spawned workers (the default outside Linux) start without the project loaded
+    django.setup()
+
+
+def hash_password(password, algorithm):
+    return make_password(password, hasher=algorithm)
+
+
+class UserImporter:
+    """Validates and inserts rows of users; run() returns the report (created counts only, with dry_run)."""
+
+    def __init__(self, batch_size=None, workers=None, dry_run=False):
+        self.batch_size = batch_size or settings.HMS_IMPORT_BATCH_SIZE
+        self.workers = workers or settings.HMS_IMPORT_WORKERS
+        self.dry_run = dry_run
+        self.usernames = set()
+        self.emails = set()
+        self.created = {role: 0 for role, _ in User.ROLE_CHOICES}
+        self.rejected = []
+        self.rows = 0
+
+    def run(self, rows):
+        # The one read for every uniqueness check of the import
+        for username, email in User.objects.values_list('username', 'email').iterator(chunk_size=10_000):
+            self.usernames.add(username)
+            self.emails.add(email)
+        # The pool only pays off when there is more to hash than it takes to start it
+        pool = ProcessPoolExecutor(self.workers, initializer=setup_worker) if self.workers > 1 and not self.dry_run else None
+        try:
+            while batch := list(islice(rows, self.batch_size)):
+                accepted = []
+                for index, row in enumerate(batch, self.rows + 1):
+                    if (fields := self.validate(index, row)) is not None:
+                        accepted.append((index, fields))
+                self.rows += len(batch)
+                if self.dry_run:
+                    for _, fields in accepted:
+                        self.created[fields['role']] += 1
+                elif accepted:
+                    self.write(accepted, pool)
+        finally:
+            if pool:
+                pool.shutdown()
+        if self.created[User.DOCTOR]:
+            cache.invalidate('doctors')
+        return {
+            'rows': self.rows,
+            'created': sum(self.created.values()),
+            'created_by_role': self.created,
+            'rejected': self.rejected,
+            'dry_run': self.dry_run,
+        }
+
+    def validate(self, index, row):
+        """The row's cleaned fields, or None once its errors are reported."""
+        if not isinstance(row, dict):
+            self.rejected.append({'row': index, 'errors': {'non_field_errors': ['Expected an object.']}})
+            return None
+        errors = {}
+        fields = {}
+        for name, value in row.items():
+            if name == 'password':
+                continue
+            if name not in USER_FIELDS and name not in PROFILE_FIELDS:
+                errors[name] = ['Unknown field.']
+                continue
+            model = User if name in USER_FIELDS else Profile
+            try:
+                fields[name] = model._meta.get_field(name).clean(value, None)
+            except ValidationError as error:
+                errors[name] = error.messages
+        for name in USER_FIELDS:
+            if row.get(name) in (None, ''):
+                errors[name] = ['This field is required.']
+
+        if fields.get('username') in self.usernames:
+            errors['username'] = ['Username is already taken.']
+        if fields.get('email') in self.emails:
+            errors['email'] = ['Email is already in use.']
+        if 'password' not in errors and not isinstance(row['password'], str):
+            errors['password'] = ['Not a valid string.']
+        elif 'password' not in errors:
+            try:
+                validate_password(row['password'], User(username=fields.get('username'), email=fields.get('email')))
+                fields['password'] = row['password']
+            except ValidationError as error:
+                errors['password'] = error.messages
+
+        if errors:
+            self.rejected.append({'row': index, 'username': row.get('username'), 'errors': errors})
+            return None
+        self.usernames.add(fields['username'])
+        self.emails.add(fields['email'])
+        return fields
+
+    def write(self, accepted, pool):
+        algorithm = get_hasher().algorithm  # Resolved here, so the workers hash as this process would
+        passwords = [fields.pop('password') for _, fields in accepted]
+        if pool:
+            hashed = list(pool.map(hash_password, passwords, [algorithm] * len(passwords),
+                                   chunksize=max(1, len(passwords) // (self.workers * 4))))
+        else:
+            hashed = [hash_password(password, algorithm) for password in passwords]
+        try:
+            self.insert(accepted, hashed)
+        except IntegrityError:
+            # Someone registered one of these names since they were read: drop those rows and retry
+            self.recheck(accepted, hashed)
+
+    def insert(self, accepted, hashed):
+        today = date.today()
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(password=password, **{name: fields[name] for name in USER_FIELDS if name in fields})
+                for (_, fields), password in zip(accepted, hashed)
+            ])
+            profiles = []
+            for user, (_, fields) in zip(users, accepted):
+                profile = {name: fields[name] for name in PROFILE_FIELDS if name in fields}
+                if profile.get('date_of_birth'):
+                    profile['age'] = age_on(profile['date_of_birth'], today)
+                profiles.append(Profile(user=user, **profile))
+            Profile.objects.bulk_create(profiles)
+        for user in users:
+            self.created[user.role] += 1
+
+    def recheck(self, accepted, hashed):
+        usernames = {fields['username'] for _, fields in accepted}
+        emails = {fields['email'] for _, fields in accepted}
+        taken = User.objects.filter(username__in=usernames).values_list('username', flat=True)
+        used = User.objects.filter(email__in=emails).values_list('email', flat=True)
+        taken, used = set(taken), set(used)
+        keep = []
+        for (index, fields), password in zip(accepted, hashed):
+            errors = {}
+            if fields['username'] in taken:
+                errors['username'] = ['Username is already taken.']
+            if fields['email'] in used:
+                errors['email'] = ['Email is already in use.']
+            if errors:
+                self.rejected.append({'row': index, 'username': fields['username'], 'errors': errors})
+            else:
+                keep.append(((index, fields), password))
+        if keep:
+            self.insert([row for row, _ in keep], [password for _, password in keep])
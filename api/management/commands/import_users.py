@@ -0,0 +1,53 @@
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import imports
+
+
+class Command(BaseCommand):
+    help = ('Create users and their profiles in bulk from a CSV, NDJSON or JSON file (api/imports.py). '
+            'Invalid rows are reported and skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The file to import, or - for standard input.')
+        parser.add_argument('--format', choices=imports.FORMATS,
+                            help='Defaults to the file extension (.csv, .ndjson or .jsonl, .json).')
+        parser.add_argument('--batch-size', type=int, help='Defaults to settings.HMS_IMPORT_BATCH_SIZE.')
+        parser.add_argument('--workers', type=int,
+                            help='Password hashing processes; defaults to settings.HMS_IMPORT_WORKERS.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate every row but write nothing.')
+        parser.add_argument('--report', help='Write the full report, rejected rows included, to this JSON file.')
+
+    def handle(self, *args, path, format, batch_size, workers, dry_run, report, verbosity, **options):
+        format = format or {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.json': 'json'}.get(
+            Path(path).suffix.lower())
+        if format is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format.')
+
+        began = time.perf_counter()
+        try:
+            stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as error:
+            raise CommandError(error)
+        with stream:
+            try:
+                results = imports.UserImporter(batch_size, workers, dry_run).run(imports.read_rows(stream, format))
+            except (ValueError, csv.Error) as error:
+                raise CommandError(f'Malformed {format} input: {error}. Batches before the error were written.')
+        seconds = time.perf_counter() - began
+
+        if report:
+            with open(report, 'w') as output:
+                json.dump(results, output, indent=2)
+        for rejection in results['rejected'][:20 if verbosity < 2 else None]:
+            self.stderr.write(f'  row {rejection["row"]}: {json.dumps(rejection["errors"])}')
+        created = 'Would create' if dry_run else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f'{created} {results["created"]} of {results["rows"]} users in {seconds:.1f}s; '
+            f'{len(results["rejected"])} rejected.'
+        ))
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import sync
+
+
+class Command(BaseCommand):
+    help = ('Delete appointment tombstones older than settings.HMS_SYNC_TOMBSTONE_DAYS, which no sync token '
+            'can still ask for (api/sync.py). Run it daily, e.g. from cron.')
+
+    def handle(self, *args, **options):
+        count = sync.prune()
+        self.stdout.write(f'Deleted {count} tombstones older than {settings.HMS_SYNC_TOMBSTONE_DAYS} days.')
@@ -0,0 +1,34 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.tasks import start_workers
+
+
+class Command(BaseCommand):
+    help = 'Run background tasks (api/tasks.py) with a pool of worker threads until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.HMS_TASK_WORKERS)
+        parser.add_argument('--batch-size', type=int, default=settings.HMS_TASK_BATCH_SIZE)
+        parser.add_argument('--poll', type=float, default=settings.HMS_TASK_POLL_SECONDS,
+                            help='Seconds an idle worker waits before looking for due tasks again.')
+        parser.add_argument('--drain', action='store_true',
+                            help='Exit once no task is due instead of waiting for more.')
+
+    def handle(self, *args, workers, batch_size, poll, drain, **options):
+        stop = threading.Event()
+        # Finish the batches in hand on SIGTERM (systemd, docker stop) as on Ctrl-C
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        threads = start_workers(workers, stop, batch_size=batch_size, poll=poll, drain=drain)
+        self.stdout.write(f'Running {workers} task workers.')
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
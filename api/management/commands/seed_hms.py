@@ -0,0 +1,52 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from api import seeding
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = ('Bulk-generate users, profiles and appointments (api/seeding.py) for load tests and benchmarks. '
+            'Every seeded user shares --password.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=500)
+        parser.add_argument('--patients', type=int, default=20_000)
+        parser.add_argument('--appointments', type=int, default=1_000_000)
+        parser.add_argument('--admins', type=int, default=1)
+        parser.add_argument('--password', default='hms-bench')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data.')
+        parser.add_argument('--history-days', type=int, default=365,
+                            help='How far back the first appointments are.')
+        parser.add_argument('--future-days', type=int, default=90,
+                            help='How far ahead appointments go, unless there are too many to fit.')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--flush', action='store_true',
+                            help='Empty the database (manage.py flush) first. Everything in it is lost.')
+
+    def handle(self, *args, doctors, patients, appointments, admins, password, seed, history_days, future_days,
+               batch_size, flush, verbosity, **options):
+        self.verbosity = verbosity
+        if flush:
+            call_command('flush', interactive=False, verbosity=0)
+        elif User.objects.filter(username__in=['admin0', 'doctor0', 'patient0']).exists():
+            raise CommandError('The database already holds seeded users; pass --flush to start over.')
+
+        began = time.perf_counter()
+        counts = seeding.seed(
+            doctors=doctors, patients=patients, appointments=appointments, admins=admins, password=password,
+            seed=seed, history_days=history_days, future_days=future_days, batch_size=batch_size, progress=self.progress,
+        )
+        seconds = time.perf_counter() - began
+        rows = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {counts["users"]} users and profiles and {counts["appointments"]} appointments '
+            f'in {seconds:.1f}s ({rows / seconds:,.0f} rows/s).'
+        ))
+
+    def progress(self, what, done, total):
+        if self.verbosity > 1 or done == total:
+            self.stdout.write(f'  {what}: {done}/{total}')
+
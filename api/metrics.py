@@ -0,0 +1,250 @@
+"""
+Request-level performance metrics: Server-Timing headers and a Prometheus endpoint.
+
+PerformanceMiddleware, first in MIDDLEWARE, samples settings.HMS_METRICS_SAMPLE_RATE of
+requests. For each sampled request it records, under the URL name of the view that served
+it and the HTTP method:
+
+- wall time, from the outermost middleware in to the rendered response out;
+- time in the database and the number of queries, from an execute wrapper installed on every
+  connection, so queries the async views run on the ORM's executor thread count as well;
+- duplicate queries: the same SQL with the same parameters run again in one request, which
+  is what an N+1 lookup or a missing select_related looks like;
+- time in serializers: the top-level .data of the serializers of api/serializers.py (through
+  TimedSerializerMixin) and the precompiled list plans of api/plans.py, queries they trigger
+  included;
+- response size in bytes (not for streamed responses).
+
+Sampled responses carry them as a Server-Timing header (settings.HMS_METRICS_SERVER_TIMING),
+which browser dev tools show per request, and every sample lands in in-process histograms
+served in the Prometheus text format by GET /api/metrics/. Counts are of sampled requests,
+and each worker process keeps its own histograms, so scrape every process.
+
+Requests that are not sampled pay one random() call and, per query, one context variable
+lookup.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import BaseRenderer
+from rest_framework.serializers import ListSerializer
+
+from api.models import User
+
+request_stats = ContextVar('request_stats', default=None)
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestStats:
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.duplicates = 0
+        self.seen = set()
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+    def record_query(self, sql, params, many, seconds):
+        self.db_seconds += seconds
+        self.queries += 1
+        key = (sql, None if many else repr(params))
+        if key in self.seen:
+            self.duplicates += 1
+        else:
+            self.seen.add(key)
+
+
+class Histogram:
+    """A Prometheus histogram with one series per label set, safe to observe from any thread."""
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}  # labels -> per-bucket counts (the last is +Inf), then sum
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            counts = self.series.get(labels)
+            if counts is None:
+                counts = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1  # le is inclusive
+            counts[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {labels: list(counts) for labels, counts in self.series.items()}
+        for labels, counts in sorted(series.items()):
+            names = ','.join(f'{name}="{escape(value)}"' for name, value in labels)
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{names},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{names}}} {counts[-1]}')
+            lines.append(f'{self.name}_count{{{names}}} {cumulative}')
+        return lines
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_seconds = Histogram('hms_request_duration_seconds', 'Wall time of sampled requests.', SECONDS)
+db_seconds = Histogram('hms_db_duration_seconds', 'Time sampled requests spent in database queries.', SECONDS)
+db_queries = Histogram('hms_db_queries', 'Database queries per sampled request.', (0, 1, 2, 3, 5, 10, 20, 50, 100))
+duplicate_queries = Histogram(
+    'hms_db_duplicate_queries', 'Queries repeating an earlier query of the same sampled request.', (0, 1, 2, 5, 10, 50)
+)
+serializer_seconds = Histogram('hms_serializer_duration_seconds', 'Time sampled requests spent in serializers.', SECONDS)
+response_bytes = Histogram(
+    'hms_response_size_bytes', 'Body size of sampled responses.', (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+)
+HISTOGRAMS = [request_seconds, db_seconds, db_queries, duplicate_queries, serializer_seconds, response_bytes]
+
+
+def render():
+    return '\n'.join(line for histogram in HISTOGRAMS for line in histogram.render()) + '\n'
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.clear()
+
+
+# Instrumentation, installed by api/apps.py
+
+def record_queries(execute, sql, params, many, context):
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record_query(sql, params, many, time.perf_counter() - began)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    # The wrapper list belongs to the connection alias and outlives reconnects
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+@contextmanager
+def serializing():
+    """Count the time spent inside towards the sampled request's serializer time."""
+    stats = request_stats.get()
+    if stats is None or stats.serializing:  # Nested serializers are part of the outer one
+        yield
+        return
+    stats.serializing = True
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_seconds += time.perf_counter() - began
+        stats.serializing = False
+
+
+class TimedSerializerMixin:
+    """Counts a serializer's .data as serializer time; nested ones count as part of the outer one."""
+
+    @property
+    def data(self):
+        with serializing():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    """The many=True form of a timed serializer, set as its Meta.list_serializer_class."""
+
+
+class PerformanceMiddleware:
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.HMS_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        began = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - began)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.HMS_METRICS_SAMPLE_RATE:
+            return await self.get_response(request)
+        stats = RequestStats()
+        token = request_stats.set(stats)  # Copied into sync_to_async threads with the rest of the context
+        began = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - began)
+
+    def finish(self, request, response, stats, seconds):
+        match = getattr(request, 'resolver_match', None)
+        labels = (('method', request.method), ('view', match.view_name if match else 'unresolved'))
+        request_seconds.observe(labels, seconds)
+        db_seconds.observe(labels, stats.db_seconds)
+        db_queries.observe(labels, stats.queries)
+        duplicate_queries.observe(labels, stats.duplicates)
+        serializer_seconds.observe(labels, stats.serializer_seconds)
+        if not response.streaming:
+            response_bytes.observe(labels, len(response.content))
+        if settings.HMS_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={seconds * 1000:.1f}',
+                f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries ({stats.duplicates} duplicate)"',
+                f'serialize;dur={stats.serializer_seconds * 1000:.1f}',
+            ])
+        return response
+
+
+# The /api/metrics/ endpoint
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):  # An error response
+            data = f'{data.get("detail", data)}\n'
+        return data.encode(self.charset)
+
+
+class IsMetricsReader(BasePermission):
+    """Scrapers presenting settings.HMS_METRICS_TOKEN, and admins."""
+
+    def has_permission(self, request, view):
+        if request.auth == 'metrics':
+            return True
+        return bool(request.user and request.user.is_authenticated and request.user.role == User.ADMIN)
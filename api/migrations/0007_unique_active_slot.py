@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+def cancel_duplicate_bookings(apps, schema_editor):
+    # Bookings made before the constraint existed may already collide; keep the earliest
+    # booking of each (doctor, appointment_date) pair and cancel the rest so the index can be built
+    Appointment = apps.get_model('api', 'Appointment')
+    seen = set()
+    duplicates = []
+    active = Appointment.objects.exclude(status='canceled').order_by('id')
+    for pk, doctor_id, appointment_date in active.values_list('id', 'doctor_id', 'appointment_date').iterator():
+        key = (doctor_id, appointment_date)
+        if key in seen:
+            duplicates.append(pk)
+        seen.add(key)
+    Appointment.objects.filter(pk__in=duplicates).update(status='canceled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_doctor_working_hours'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'canceled'), _negated=True), fields=('doctor', 'appointment_date'), name='appt_unique_active_slot'),
+        ),
+    ]
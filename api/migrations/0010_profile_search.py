@@ -0,0 +1,111 @@
+from django.db import migrations
+
+from api.migrations._sql import run
+
+# The search index of api/search.py, kept in sync with api_profile (and api_user.role) by
+# triggers, so bulk inserts and raw updates are indexed too. Its shape depends on the database.
+
+SQLITE_REFRESH = """
+    INSERT INTO api_profile_search (rowid, first_name, last_name, specialization, medical_history, role)
+    SELECT new.id, new.first_name, new.last_name, new.specialization, new.medical_history, u.role
+    FROM api_user u WHERE u.id = new.user_id;
+"""
+
+SQLITE = [
+    # rank weights: names count most, then specialization, then history; role only filters
+    """CREATE VIRTUAL TABLE api_profile_search USING fts5(
+        first_name, last_name, specialization, medical_history, role,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+    "INSERT INTO api_profile_search (api_profile_search, rank) VALUES ('rank', 'bm25(10.0, 10.0, 5.0, 1.0, 0.0)')",
+    # Distinct indexed terms per column, for typo-tolerant matching
+    "CREATE VIRTUAL TABLE api_profile_search_terms USING fts5vocab(api_profile_search, 'col')",
+    """INSERT INTO api_profile_search (rowid, first_name, last_name, specialization, medical_history, role)
+    SELECT p.id, p.first_name, p.last_name, p.specialization, p.medical_history, u.role
+    FROM api_profile p JOIN api_user u ON u.id = p.user_id""",
+    f"CREATE TRIGGER api_profile_search_insert AFTER INSERT ON api_profile BEGIN {SQLITE_REFRESH} END",
+    f"""CREATE TRIGGER api_profile_search_update AFTER UPDATE ON api_profile
+    WHEN old.first_name IS NOT new.first_name OR old.last_name IS NOT new.last_name
+        OR old.specialization IS NOT new.specialization OR old.medical_history IS NOT new.medical_history
+        OR old.user_id IS NOT new.user_id
+    BEGIN
+        DELETE FROM api_profile_search WHERE rowid = old.id;
+        {SQLITE_REFRESH}
+    END""",
+    "CREATE TRIGGER api_profile_search_delete AFTER DELETE ON api_profile BEGIN DELETE FROM api_profile_search WHERE rowid = old.id; END",
+    """CREATE TRIGGER api_profile_search_role AFTER UPDATE OF role ON api_user WHEN old.role IS NOT new.role BEGIN
+        UPDATE api_profile_search SET role = new.role WHERE rowid IN (SELECT id FROM api_profile WHERE user_id = new.id);
+    END""",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER api_profile_search_role",
+    "DROP TRIGGER api_profile_search_delete",
+    "DROP TRIGGER api_profile_search_update",
+    "DROP TRIGGER api_profile_search_insert",
+    "DROP TABLE api_profile_search_terms",
+    "DROP TABLE api_profile_search",
+]
+
+POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """CREATE TABLE api_profile_search (
+        profile_id bigint PRIMARY KEY REFERENCES api_profile (id) ON DELETE CASCADE,
+        role varchar(50) NOT NULL,
+        names text NOT NULL,
+        document tsvector NOT NULL
+    )""",
+    "CREATE INDEX api_profile_search_document ON api_profile_search USING gin (document)",
+    "CREATE INDEX api_profile_search_names ON api_profile_search USING gin (names gin_trgm_ops)",
+    # Weights: A names, B specialization, D history; api/search.py restricts patients to A and B
+    """CREATE FUNCTION api_profile_search_refresh(profile bigint) RETURNS void AS $$
+        INSERT INTO api_profile_search (profile_id, role, names, document)
+        SELECT p.id, u.role, concat_ws(' ', p.first_name, p.last_name, p.specialization),
+               setweight(to_tsvector('simple', concat_ws(' ', p.first_name, p.last_name)), 'A')
+               || setweight(to_tsvector('simple', coalesce(p.specialization, '')), 'B')
+               || setweight(to_tsvector('simple', coalesce(p.medical_history, '')), 'D')
+        FROM api_profile p JOIN api_user u ON u.id = p.user_id
+        WHERE p.id = profile
+        ON CONFLICT (profile_id) DO UPDATE
+        SET role = EXCLUDED.role, names = EXCLUDED.names, document = EXCLUDED.document
+    $$ LANGUAGE sql""",
+    """CREATE FUNCTION api_profile_search_profile() RETURNS trigger AS $$
+    BEGIN
+        PERFORM api_profile_search_refresh(NEW.id);
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER api_profile_search_profile
+    AFTER INSERT OR UPDATE OF first_name, last_name, specialization, medical_history, user_id ON api_profile
+    FOR EACH ROW EXECUTE FUNCTION api_profile_search_profile()""",
+    """CREATE FUNCTION api_profile_search_role() RETURNS trigger AS $$
+    BEGIN
+        UPDATE api_profile_search s SET role = NEW.role FROM api_profile p WHERE p.user_id = NEW.id AND s.profile_id = p.id;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER api_profile_search_role AFTER UPDATE OF role ON api_user
+    FOR EACH ROW WHEN (OLD.role IS DISTINCT FROM NEW.role) EXECUTE FUNCTION api_profile_search_role()""",
+    "SELECT api_profile_search_refresh(id) FROM api_profile",
+]
+
+POSTGRES_REVERSE = [
+    "DROP TRIGGER api_profile_search_role ON api_user",
+    "DROP TRIGGER api_profile_search_profile ON api_profile",
+    "DROP FUNCTION api_profile_search_role()",
+    "DROP FUNCTION api_profile_search_profile()",
+    "DROP FUNCTION api_profile_search_refresh(bigint)",
+    "DROP TABLE api_profile_search",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_task_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE, 'postgresql': POSTGRES}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from api.migrations._sql import run
+
+# Triggers keeping api_appointmentsummary (per doctor and status counts, see api/dashboard.py)
+# in step with api_appointment, so bulk writes and cascading deletes are counted too.
+
+SQLITE_ADD = """
+    INSERT INTO api_appointmentsummary (doctor_id, status, count) VALUES (new.doctor_id, COALESCE(new.status, ''), 1)
+    ON CONFLICT (doctor_id, status) DO UPDATE SET count = count + 1;
+"""
+SQLITE_REMOVE = """
+    UPDATE api_appointmentsummary SET count = count - 1 WHERE doctor_id = old.doctor_id AND status = COALESCE(old.status, '');
+"""
+
+SQLITE = [
+    """INSERT INTO api_appointmentsummary (doctor_id, status, count)
+    SELECT doctor_id, COALESCE(status, ''), COUNT(*) FROM api_appointment GROUP BY doctor_id, COALESCE(status, '')""",
+    f"CREATE TRIGGER api_appointment_summary_insert AFTER INSERT ON api_appointment BEGIN {SQLITE_ADD} END",
+    f"""CREATE TRIGGER api_appointment_summary_update AFTER UPDATE OF doctor_id, status ON api_appointment
+    WHEN old.doctor_id IS NOT new.doctor_id OR old.status IS NOT new.status
+    BEGIN {SQLITE_REMOVE} {SQLITE_ADD} END""",
+    f"CREATE TRIGGER api_appointment_summary_delete AFTER DELETE ON api_appointment BEGIN {SQLITE_REMOVE} END",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER api_appointment_summary_delete",
+    "DROP TRIGGER api_appointment_summary_update",
+    "DROP TRIGGER api_appointment_summary_insert",
+]
+
+POSTGRES = [
+    """INSERT INTO api_appointmentsummary (doctor_id, status, count)
+    SELECT doctor_id, COALESCE(status, ''), COUNT(*) FROM api_appointment GROUP BY doctor_id, COALESCE(status, '')""",
+    """CREATE FUNCTION api_appointment_summary() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE api_appointmentsummary SET count = count - 1
+            WHERE doctor_id = OLD.doctor_id AND status = COALESCE(OLD.status, '');
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO api_appointmentsummary (doctor_id, status, count) VALUES (NEW.doctor_id, COALESCE(NEW.status, ''), 1)
+            ON CONFLICT (doctor_id, status) DO UPDATE SET count = api_appointmentsummary.count + 1;
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER api_appointment_summary_write AFTER INSERT OR DELETE ON api_appointment
+    FOR EACH ROW EXECUTE FUNCTION api_appointment_summary()""",
+    """CREATE TRIGGER api_appointment_summary_update AFTER UPDATE OF doctor_id, status ON api_appointment
+    FOR EACH ROW WHEN (OLD.doctor_id IS DISTINCT FROM NEW.doctor_id OR OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION api_appointment_summary()""",
+]
+
+POSTGRES_REVERSE = [
+    "DROP TRIGGER api_appointment_summary_update ON api_appointment",
+    "DROP TRIGGER api_appointment_summary_write ON api_appointment",
+    "DROP FUNCTION api_appointment_summary()",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_profile_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(blank=True, default='', max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'status'), name='appt_summary_doctor_status')],
+            },
+        ),
+        migrations.RunPython(
+            run({'sqlite': SQLITE, 'postgresql': POSTGRES}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:08
+
+from django.db import migrations, models
+
+from api.migrations._sql import run
+
+# Triggers leaving an api_appointmenttombstone row (see api/sync.py) for every appointment deleted,
+# and for every one moved to another doctor or patient, under its previous doctor and patient.
+# SQLite's clock is read in the format Django stores datetimes in, to the microsecond.
+
+SQLITE_TOMBSTONE = """
+    INSERT INTO api_appointmenttombstone (appointment_id, doctor_id, patient_id, deleted_at)
+    VALUES (old.id, old.doctor_id, old.patient_id, strftime('%Y-%m-%d %H:%M:%f', 'now') || '000');
+"""
+
+SQLITE = [
+    f"CREATE TRIGGER api_appointment_tombstone_delete AFTER DELETE ON api_appointment BEGIN {SQLITE_TOMBSTONE} END",
+    f"""CREATE TRIGGER api_appointment_tombstone_move AFTER UPDATE OF doctor_id, patient_id ON api_appointment
+    WHEN old.doctor_id IS NOT new.doctor_id OR old.patient_id IS NOT new.patient_id
+    BEGIN {SQLITE_TOMBSTONE} END""",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER api_appointment_tombstone_move",
+    "DROP TRIGGER api_appointment_tombstone_delete",
+]
+
+POSTGRES = [
+    """CREATE FUNCTION api_appointment_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO api_appointmenttombstone (appointment_id, doctor_id, patient_id, deleted_at)
+        VALUES (OLD.id, OLD.doctor_id, OLD.patient_id, clock_timestamp());
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER api_appointment_tombstone_delete AFTER DELETE ON api_appointment
+    FOR EACH ROW EXECUTE FUNCTION api_appointment_tombstone()""",
+    """CREATE TRIGGER api_appointment_tombstone_move AFTER UPDATE OF doctor_id, patient_id ON api_appointment
+    FOR EACH ROW WHEN (OLD.doctor_id IS DISTINCT FROM NEW.doctor_id OR OLD.patient_id IS DISTINCT FROM NEW.patient_id)
+    EXECUTE FUNCTION api_appointment_tombstone()""",
+]
+
+POSTGRES_REVERSE = [
+    "DROP TRIGGER api_appointment_tombstone_move ON api_appointment",
+    "DROP TRIGGER api_appointment_tombstone_delete ON api_appointment",
+    "DROP FUNCTION api_appointment_tombstone()",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_appointment_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_id', models.BigIntegerField()),
+                ('doctor_id', models.BigIntegerField()),
+                ('patient_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['updated_at', 'id'], name='appt_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'updated_at', 'id'], name='appt_doctor_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmenttombstone',
+            index=models.Index(fields=['deleted_at'], name='appt_tombstone_deleted_idx'),
+        ),
+        migrations.RunPython(
+            run({'sqlite': SQLITE, 'postgresql': POSTGRES}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
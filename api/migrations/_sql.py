@@ -0,0 +1,18 @@
+"""
+Raw SQL that differs per database, for migrations whose triggers and indexes the ORM cannot
+express. The loader skips modules starting with an underscore, so this is not a migration.
+
+    migrations.RunPython(
+        run({'sqlite': SQLITE, 'postgresql': POSTGRES}),
+        run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+    )
+"""
+
+
+def run(statements):
+    """A RunPython function executing the statements listed for the connection's vendor, if any."""
+    def apply(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement, params=None)
+    return apply
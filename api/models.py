@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
+from django.db.models import F, Q
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
 from datetime import date
+from api import cache
 
 class User(AbstractUser): 
     username = models.CharField(max_length=100, unique=True)
@@ -22,6 +25,12 @@ class User(AbstractUser):
     
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email']
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Patient/doctor directories filter on role and page on id
+            models.Index(fields=['role', 'id'], name='user_role_id_idx'),
+        ]
     
     def __str__(self):
         return self.username
@@ -47,6 +56,10 @@ class Profile(models.Model):
     specialization = models.CharField(max_length=100, null=True, blank=True)
     consultation_fees = models.DecimalField(decimal_places=2, max_digits=10, null=True, blank=True)
     license_number = models.CharField(max_length=100, null=True, blank=True)
+    slot_duration = models.PositiveIntegerField(null=True, blank=True)  # Minutes per appointment; settings default if unset
+
+    # Bumped on every save, so holders of a compact token can tell their cached profile is stale
+    version = models.PositiveIntegerField(default=1)
     
     def __str__(self):
         return f'{self.user.username} Profile'
@@ -58,19 +71,53 @@ class Profile(models.Model):
             self.age = today.year - self.date_of_birth.year - (
                 (today.month, today.day) < (self.date_of_birth.month, self.date_of_birth.day)
             )
+        bumped = not self._state.adding
+        if bumped:
+            self.version = F('version') + 1  # In the UPDATE, so concurrent saves cannot both write one number
+        # Partial saves write the new version, and the recomputed age when date_of_birth changes
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extra = ['version'] + (['age'] if 'date_of_birth' in update_fields else [])
+            kwargs['update_fields'] = [*update_fields, *(field for field in extra if field not in update_fields)]
         super().save(*args, **kwargs)
+        if bumped:
+            self.refresh_from_db(fields=['version'])
 
 
-# Signal to create or save a profile when a User is created or saved
+# Signal to create a profile when a User is created. Later User saves leave the profile
+# alone; profile changes go through api.services.update_profile
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
-
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+        Profile.objects.create(user=instance, **getattr(instance, '_profile_fields', {}))
 
 post_save.connect(create_user_profile, sender=User)
-post_save.connect(save_user_profile, sender=User)
+
+
+# Signals to invalidate cached doctor directory and profile reads (api/cache.py)
+def invalidate_user_reads(sender, instance, created=False, update_fields=None, **kwargs):
+    # A new patient or admin changes no cached read, nor does a login; anything else may be a doctor or a role change
+    if created and instance.role != User.DOCTOR or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_on_commit('doctors', f'profile:{instance.pk}')
+
+def invalidate_profile_reads(sender, instance, created=False, **kwargs):
+    if created:
+        return  # The blank profile of a new user; the User signal already covered it
+    namespaces = [f'profile:{instance.user_id}']
+    # Only skip the directory when the user is at hand and known not to be a doctor
+    if not Profile.user.is_cached(instance) or instance.user.role == User.DOCTOR:
+        namespaces.append('doctors')
+    invalidate_on_commit(*namespaces)
+
+def invalidate_on_commit(*namespaces):
+    # Bumped once the write is visible: a read rebuilt between an earlier bump and the commit
+    # would cache the old rows under the new generation
+    transaction.on_commit(lambda: cache.invalidate(*namespaces))
+
+post_save.connect(invalidate_user_reads, sender=User)
+post_delete.connect(invalidate_user_reads, sender=User)
+post_save.connect(invalidate_profile_reads, sender=Profile)
+post_delete.connect(invalidate_profile_reads, sender=Profile)
 
 
 class Appointment(models.Model):
@@ -80,8 +127,9 @@ class Appointment(models.Model):
         ('canceled', 'Canceled'),
     ]
 
-    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='appointments_as_patient', limit_choices_to={'role': 'patient'})
-    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='appointments_as_doctor', limit_choices_to={'role': 'doctor'})
+    # The single-column FK indexes are dropped: the composite indexes below lead with these columns
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='appointments_as_patient', limit_choices_to={'role': 'patient'}, db_index=False)
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='appointments_as_doctor', limit_choices_to={'role': 'doctor'}, db_index=False)
     appointment_date = models.DateTimeField()
     reason = models.TextField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, null=True, blank=True)
@@ -89,5 +137,203 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Booking conflict check and a doctor's schedule, in keyset order
+            models.Index(fields=['doctor', 'appointment_date', 'id'], name='appt_doctor_date_idx'),
+            # A patient's appointments, in keyset order
+            models.Index(fields=['patient', 'appointment_date', 'id'], name='appt_patient_date_idx'),
+            # The admin list: every appointment, in keyset order
+            models.Index(fields=['appointment_date', 'id'], name='appt_date_idx'),
+            # ?status= filtering across all doctors
+            models.Index(fields=['status', 'appointment_date', 'id'], name='appt_status_date_idx'),
+            # Delta sync (api/sync.py): what changed since a watermark, in keyset order; doctors have
+            # thousands of appointments each, too many to scan for a few changes (patients have few)
+            models.Index(fields=['updated_at', 'id'], name='appt_updated_idx'),
+            models.Index(fields=['doctor', 'updated_at', 'id'], name='appt_doctor_updated_idx'),
+            # A doctor's pending queue (confirm/cancel work) stays small relative to history
+            models.Index(
+                fields=['doctor', 'appointment_date'], condition=Q(status='pending'), name='appt_doctor_pending_idx'
+            ),
+        ]
+        constraints = [
+            # Last line of defence against double booking: no two active appointments may share a
+            # doctor and start time. Overlapping-but-distinct starts are serialised in api/scheduling.py
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date'], condition=~Q(status='canceled'), name='appt_unique_active_slot'
+            ),
+        ]
+
+    def __str__(self):
+        return f'Appointment on {self.appointment_date} - {self.patient.username} with {self.doctor.username}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded, so the post_save receivers in api/tasks.py and api/events.py can tell a
+        # status change, a move, or a new doctor or patient
+        loaded = dict(zip(field_names, values))
+        instance._loaded = {
+            field: loaded[field] for field in ('status', 'appointment_date', 'doctor_id', 'patient_id')
+            if loaded.get(field, models.DEFERRED) is not models.DEFERRED
+        }
+        return instance
+
+
+class AppointmentSummary(models.Model):
+    """
+    How many appointments each doctor has per status, for /api/dashboard/.
+
+    Maintained by database triggers on api_appointment (migration 0011), so bulk inserts,
+    queryset updates and cascading deletes keep it exact as well as model saves.
+    """
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=20, blank=True, default='')  # '' counts appointments without one
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # The triggers' upsert target
+            models.UniqueConstraint(fields=['doctor', 'status'], name='appt_summary_doctor_status'),
+        ]
+
+    def __str__(self):
+        return f'{self.doctor_id} {self.status or "-"}: {self.count}'
+
+
+class AppointmentTombstone(models.Model):
+    """
+    An appointment deleted, or taken from a doctor or patient, for /api/appointments/changes/.
+
+    Written by database triggers on api_appointment (migration 0012), so cascading and bulk
+    deletes leave one too. The ids are plain integers: the appointment, and maybe its doctor
+    and patient, are gone.
+    """
+    appointment_id = models.BigIntegerField()
+    doctor_id = models.BigIntegerField()  # The previous doctor and patient, whose clients must drop it
+    patient_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at'], name='appt_tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f'Appointment {self.appointment_id} gone at {self.deleted_at}'
+
+
+class WorkingHours(models.Model):
+    """A period in which a doctor takes appointments; a doctor may have several per weekday."""
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='working_hours', limit_choices_to={'role': 'doctor'})
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ['weekday', 'start_time']
+        verbose_name_plural = 'working hours'
+
+    def __str__(self):
+        return f'{self.doctor.username}: {self.get_weekday_display()} {self.start_time}-{self.end_time}'
+
+
+class Task(models.Model):
+    """A unit of background work, run by `manage.py run_tasks` (see api/tasks.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When the task is next due: its delay or retry backoff while queued, its lease expiry while running
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The workers' claim query: due tasks in order; failed tasks wait for a person
+            models.Index(fields=['run_after', 'id'], condition=~Q(status='failed'), name='task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+
+class AppointmentAudit(models.Model):
+    """One change to an appointment, recorded by the `audit` task."""
+    ACTION_CHOICES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('status_changed', 'Status changed'),
+        ('rescheduled', 'Rescheduled'),
+        ('deleted', 'Deleted'),
+    ]
+
+    # Not a foreign key: the trail outlives the appointment
+    appointment_id = models.BigIntegerField(db_index=True)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    status = models.CharField(max_length=20, null=True, blank=True)
+    appointment_date = models.DateTimeField(null=True, blank=True)
+    changed_at = models.DateTimeField()
+    # The task that wrote the record; a redelivered task inserts nothing twice
+    source_task = models.BigIntegerField(unique=True)
+
+    def __str__(self):
+        return f'Appointment {self.appointment_id} {self.action} at {self.changed_at}'
+
+
+class Notification(models.Model):
+    """A message for a user about one of their appointments."""
+    KIND_CHOICES = [
+        ('reminder', 'Reminder'),
+        ('status', 'Status change'),
+    ]
+
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    source_task = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            # A redelivered task notifies nobody twice
+            models.UniqueConstraint(fields=['source_task', 'recipient'], name='notification_once_per_task'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} for {self.recipient.username}'
+
+
+class UserImport(models.Model):
+    """A bulk user import taken by POST /api/users/import/ and run by the `import_users` task."""
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # The uploaded rows, passwords included, until the import has run; then they are cleared
+    rows = models.JSONField(default=list)
+    report = models.JSONField(null=True, blank=True)  # UserImporter's report, once finished
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f'Appointment on {self.appointment_date} - {self.patient.username} with {self.doctor.username}'
\ No newline at end of file
+        return f'User import #{self.pk}'
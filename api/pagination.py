@@ -0,0 +1,205 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a compound, unique ordering such as (appointment_date, id).
+
+    The cursor stores the ordering values of the last (or first) row of a page, so every
+    page is fetched with an indexed range condition and LIMIT instead of an OFFSET scan:
+    page 1000 costs the same as page 1.
+    """
+    ordering = ('id',)  # Must end in a unique column so the position is unambiguous
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_rows(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Same page through the async ORM, for the async views
+        return self.paginate_rows([row async for row in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+
+        self.position, self.reverse = self.decode_cursor(request)
+        if self.position is not None:
+            queryset = queryset.filter(self.build_keyset_filter(self.position, self.reverse))
+
+        order = [f'-{field}' if self.reverse else field for field in self.ordering]
+        # Fetch one extra row to find out whether another page exists in this direction
+        return queryset.order_by(*order)[:self.page_size + 1]
+
+    def paginate_rows(self, rows):
+        position, reverse = self.position, self.reverse
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        self.first_position = self.get_position(rows[0]) if rows else None
+        self.last_position = self.get_position(rows[-1]) if rows else None
+        if not rows and position is not None:
+            # An empty page reached through a cursor: point both links back at it
+            self.first_position = self.last_position = position
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.first_position, reverse=True)
+
+    def build_keyset_filter(self, position, reverse):
+        # (a, b) > (x, y)  ==>  a > x OR (a = x AND b > y), generalised to N columns.
+        # The leading a >= x conjunct lets the database seek straight into the index.
+        op = 'lt' if reverse else 'gt'
+        condition = Q()
+        for i in reversed(range(len(self.ordering))):
+            field = self.ordering[i]
+            step = Q(**{f'{field}__{op}': position[i]})
+            if i < len(self.ordering) - 1:
+                step |= Q(**{field: position[i]}) & condition
+            condition = step
+        lead = self.ordering[0]
+        return Q(**{f'{lead}__{op}e': position[0]}) & condition
+
+    def get_position(self, instance):
+        return [getattr(instance, field) for field in self.ordering]
+
+    def encode_cursor(self, position, reverse):
+        payload = {'p': [_to_json(value) for value in position]}
+        if reverse:
+            payload['r'] = 1
+        token = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            raw = payload['p']
+            if len(raw) != len(self.ordering):
+                raise ValueError
+            position = [
+                self.model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.ordering, raw)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(payload.get('r'))
+
+
+def _to_json(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class AppointmentCursorPagination(KeysetPagination):
+    ordering = ('appointment_date', 'id')
+
+
+class UserCursorPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class RankedPagination(BasePagination):
+    """
+    Pagination for ranked search results, where no column orders the rows.
+
+    The cursor holds an offset, so page n costs the ranking of the first n pages; search only
+    ranks a bounded set of matches (settings.HMS_SEARCH_CANDIDATES), which bounds that too.
+    Links and response shape match KeysetPagination.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_search(self, search, request):
+        """Call search(offset, limit) for the requested page and return its rows."""
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.offset = self.decode_cursor(request)
+        rows = search(self.offset, self.page_size + 1)
+        self.has_next = len(rows) > self.page_size
+        return rows[:self.page_size]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.encode_cursor(self.offset + self.page_size) if self.has_next else None,
+            'previous': self.encode_cursor(max(0, self.offset - self.page_size)) if self.offset else None,
+            'results': data,
+        })
+
+    def encode_cursor(self, offset):
+        token = base64.urlsafe_b64encode(json.dumps({'o': offset}, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return 0
+        try:
+            offset = json.loads(base64.urlsafe_b64decode(token.encode()).decode())['o']
+            if not isinstance(offset, int) or offset < 0:
+                raise ValueError
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return offset
@@ -0,0 +1,94 @@
+"""
+Who may see and change which rows, as queryset filters.
+
+Each Rule turns the caller's role and id into two Q objects over its model: the rows the
+caller may see and those they may change. Lists filter on the first; a single object is
+fetched with the first in its WHERE clause and, for writes, the second as a selected
+boolean, so an authorization check is the one indexed lookup that loads the row:
+
+- a row the caller may not see is a 404, as if it did not exist;
+- a row they may see but not change is a 403 on PUT, PATCH and DELETE.
+
+Nothing is compared on the loaded object, so no related user is fetched just to read its
+role. Only user.pk and user.role are read: a ClaimsUser answers both without a query.
+
+    appointment = APPOINTMENTS.get(queryset, request.user, write=True, pk=pk)
+"""
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from rest_framework.exceptions import NotFound, PermissionDenied
+
+from api.models import Appointment, Profile, User
+
+EVERYTHING = Q()
+NOTHING = Q(pk__in=[])  # Django answers a filter on it without a query
+
+
+class Rule:
+    def __init__(self, model, read, write):
+        self.model = model
+        self.read = read  # user -> Q of the rows they may see
+        self.write = write  # user -> Q of the rows they may change, among those they see
+
+    def visible(self, queryset, user):
+        return queryset.filter(self.read(user))
+
+    def lookup(self, queryset, user, write, lookup):
+        queryset = self.visible(queryset, user).filter(**lookup)
+        writable = self.write(user) if write else EVERYTHING
+        if writable != EVERYTHING:
+            queryset = queryset.annotate(may_write=ExpressionWrapper(writable, output_field=BooleanField()))
+        return queryset
+
+    def check(self, instance, write, not_found, denied):
+        if instance is None:
+            raise NotFound(not_found or f'No {self.model._meta.object_name} matches the given query.')
+        if write and not getattr(instance, 'may_write', True):
+            raise PermissionDenied(denied)
+        return instance
+
+    def get(self, queryset, user, write=False, not_found=None, denied=None, **lookup):
+        """The row of `queryset` matching `lookup`: 404 unless the caller may see it, 403 for a write they may not make."""
+        return self.check(self.lookup(queryset, user, write, lookup).first(), write, not_found, denied)
+
+    async def aget(self, queryset, user, write=False, not_found=None, denied=None, **lookup):
+        return self.check(await self.lookup(queryset, user, write, lookup).afirst(), write, not_found, denied)
+
+
+def by_role(admin=NOTHING, doctor=NOTHING, patient=NOTHING):
+    """A user -> Q function from one function (or Q) per role; other roles get nothing."""
+    rules = {User.ADMIN: admin, User.DOCTOR: doctor, User.PATIENT: patient}
+
+    def rule(user):
+        scope = rules.get(user.role, NOTHING)
+        return scope(user) if callable(scope) else scope
+    return rule
+
+
+def own(field):
+    return lambda user: Q(**{field: user.pk})
+
+
+# Admins see and change every appointment, doctors and patients their own
+appointments = by_role(admin=EVERYTHING, doctor=own('doctor_id'), patient=own('patient_id'))
+APPOINTMENTS = Rule(Appointment, appointments, appointments)
+
+# Admins see every profile, doctors all but admins', patients their own and doctors'; only
+# admins change profiles other than their own
+PROFILES = Rule(
+    Profile,
+    by_role(admin=EVERYTHING, doctor=~Q(user__role=User.ADMIN), patient=lambda user: Q(user_id=user.pk) | Q(user__role=User.DOCTOR)),
+    by_role(admin=EVERYTHING, doctor=own('user_id'), patient=own('user_id')),
+)
+
+# The doctor directory is open to every role, the patients to doctors and admins (and each
+# patient to themself); only admins change users other than themselves
+DOCTORS = Rule(
+    User,
+    by_role(admin=Q(role=User.DOCTOR), doctor=Q(role=User.DOCTOR), patient=Q(role=User.DOCTOR)),
+    by_role(admin=EVERYTHING, doctor=own('pk')),
+)
+PATIENTS = Rule(
+    User,
+    by_role(admin=Q(role=User.PATIENT), doctor=Q(role=User.PATIENT), patient=lambda user: Q(role=User.PATIENT, pk=user.pk)),
+    by_role(admin=EVERYTHING, patient=own('pk')),
+)
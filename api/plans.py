@@ -0,0 +1,105 @@
+"""
+Precompiled serialization for the read-only list endpoints.
+
+A ModelSerializer turns each row into a dict one field at a time: get_attribute, a None
+check and to_representation per field, per nested serializer, per row, plus another pass
+through ProfileSerializer.to_representation for every profile. For a page of appointments
+that is most of the request's CPU.
+
+plan(serializer_class) does that walk once. It reads the serializer's fields (nested ones
+included) and returns a Plan with:
+
+- the values_list() columns the fields need;
+- a row function generated from them: a single dict display over the tuple, converting
+  only the values whose JSON form differs from the Python one (dates, decimals) with the
+  field's own to_representation;
+- ProfileSerializer's role rules baked in.
+
+Rows come out equal to serializer.data, so the rendered JSON is byte for byte the same.
+Plans are cached per serializer class, including the classes api/fieldsets.py derives
+for ?fields= and ?expand=.
+
+    plan = plans.plan(AppointmentSummarySerializer, 'appointment_date', 'id')  # + the paging keys
+    rows = plan.queryset(appointments)  # Named tuples, which the keyset paginators can read
+    data = plan.serialize(page)
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from rest_framework import serializers
+
+from api import metrics
+from api.models import User
+from api.serializers import ProfileSerializer
+
+# Fields whose to_representation returns the database value unchanged
+VERBATIM = (serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.ChoiceField)
+
+
+class Plan:
+    def __init__(self, serializer_class, always=()):
+        self.columns = list(always)
+        self.namespace = {}
+        serializer = serializer_class()
+        body = self.compile(serializer, serializer.Meta.model, '')
+        source = f'def row(r):\n    return {body}\n'
+        exec(compile(source, f'<plan {serializer_class.__name__}>', 'exec'), self.namespace)
+        self.row = self.namespace['row']
+        self.source = source  # For reading the generated code when debugging
+
+    def column(self, path):
+        if path not in self.columns:
+            self.columns.append(path)
+        return self.columns.index(path)
+
+    def compile(self, serializer, model, prefix):
+        items = []
+        for field in serializer._readable_fields:
+            items.append(f'{field.field_name!r}: {self.compile_field(serializer, field, model, prefix)}')
+        return '{' + ', '.join(items) + '}'
+
+    def compile_field(self, serializer, field, model, prefix):
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise ImproperlyConfigured(f'{type(serializer).__name__}.{field.field_name} is not a model field; '
+                                       f'use the serializer instead of a plan')
+        path = prefix + field.source
+        if isinstance(field, serializers.BaseSerializer) and not isinstance(field, serializers.ListSerializer):
+            nested_model = model_field.related_model
+            pk = self.column(f'{path}__{nested_model._meta.pk.name}')
+            # A missing related row serializes as None, as DRF does
+            return f'({self.compile(field, nested_model, path + "__")} if r[{pk}] is not None else None)'
+        if not model_field.concrete or model_field.many_to_many or isinstance(field, serializers.ListSerializer):
+            raise ImproperlyConfigured(f'{type(serializer).__name__}.{field.field_name} cannot be read from one column')
+
+        index = self.column(path)
+        if isinstance(serializer, ProfileSerializer) and field.source == 'consultation_fees':
+            # ProfileSerializer.to_representation str()s a doctor's fees, None included. The role is
+            # read from the user the profile was reached from, rather than through a join back to it
+            user = prefix[:-len('profile__')] if prefix.endswith('profile__') else prefix + 'user__'
+            role = self.column(user + 'role')
+            return f'(str(r[{index}]) if r[{role}] == {User.DOCTOR!r} else {self.convert(field, index)})'
+        return self.convert(field, index)
+
+    def convert(self, field, index):
+        if isinstance(field, VERBATIM) or (isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None):
+            return f'r[{index}]'
+        name = f'c{len(self.namespace)}'
+        self.namespace[name] = field.to_representation
+        return f'({name}(r[{index}]) if r[{index}] is not None else None)'
+
+    def queryset(self, queryset):
+        """`queryset` as named tuples of the plan's columns, which the keyset paginators can read."""
+        return queryset.select_related(None).values_list(*self.columns, named=True)
+
+    def serialize(self, rows):
+        row = self.row
+        with metrics.serializing():  # Timed as serializer.data is
+            return [row(r) for r in rows]
+
+
+@lru_cache(maxsize=256)
+def plan(serializer_class, *always):
+    """The Plan of `serializer_class`, also reading the `always` columns (e.g. the pagination's ordering)."""
+    return Plan(serializer_class, always)
@@ -0,0 +1,116 @@
+"""
+Primary/replica database routing with read-your-writes.
+
+Writes always go to `default`. Reads go to settings.HMS_READ_REPLICA only inside views that
+opt in with ReplicaReadMixin (the appointment, doctor and patient lists), and only for
+safe methods, so everything else, including the reads a booking makes inside its
+transaction, stays on the primary.
+
+A replica lags the primary, so a user who just booked could list their appointments and not
+see the booking. ReadYourWritesMiddleware notices requests that wrote and pins the writing
+user's reads to the primary for settings.HMS_REPLICA_PIN_SECONDS. The pin lives in the
+cache (api/cache.py), so it is shared between processes when the cache backend is.
+"""
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+from api.cache import get_cache
+
+read_from_replica = ContextVar('read_from_replica', default=False)
+request_wrote = ContextVar('request_wrote', default=None)
+
+
+def pin_key(user_id):
+    return f'hms:pin:{user_id}'
+
+
+def recently_wrote(user):
+    return get_cache().get(pin_key(user.pk)) is not None
+
+
+async def arecently_wrote(user):
+    return await get_cache().aget(pin_key(user.pk)) is not None
+
+
+class PrimaryReplicaRouter:
+    # Only the app's own rows are routed and tracked. The rest, notably the table of the
+    # database cache backend, stays on the primary: a cache fill is no write of the user's,
+    # and generation counters and pins must not be read from a lagging replica
+    def db_for_read(self, model, **hints):
+        if settings.HMS_READ_REPLICA and read_from_replica.get() and model._meta.app_label == 'api':
+            return settings.HMS_READ_REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        wrote = request_wrote.get()
+        if wrote is not None and model._meta.app_label == 'api':
+            wrote.append(model)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # The replica holds the same rows as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'  # Replicas get their schema through replication
+
+
+class ReadYourWritesMiddleware:
+    async_capable = True  # So ASGI requests reach the async views without a thread hop
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        wrote = []
+        token = request_wrote.set(wrote)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_wrote.reset(token)
+        if wrote:
+            self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        wrote = []
+        token = request_wrote.set(wrote)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_wrote.reset(token)
+        if wrote:
+            await sync_to_async(self.pin)(request)  # request.user may be a lazy session lookup
+        return response
+
+    def pin(self, request):
+        # DRF copies the user it authenticated onto the Django request
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            get_cache().set(pin_key(user.pk), 1, timeout=settings.HMS_REPLICA_PIN_SECONDS)
+
+
+class ReplicaReadMixin:
+    """Serve a view's GET reads from the replica unless the user wrote within the pin window."""
+
+    def dispatch(self, request, *args, **kwargs):
+        self.replica_token = None
+        return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)  # Authenticates, so request.user is known below
+        if settings.HMS_READ_REPLICA and request.method in SAFE_METHODS and not recently_wrote(request.user):
+            self.replica_token = read_from_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self.replica_token is not None:
+            read_from_replica.reset(self.replica_token)
+            self.replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,176 @@
+"""
+Doctor availability and booking overlap detection.
+
+Every appointment occupies one slot of its doctor's slot length (Profile.slot_duration,
+falling back to settings.HMS_DEFAULT_SLOT_MINUTES). Two appointments for the same doctor
+conflict when their slots overlap, not only when their start times are identical.
+
+Both the booking check and the availability listing read only the doctor's bookings inside
+the requested window, through the (doctor, appointment_date) index, so their cost depends
+on the window and not on how many appointments the doctor has in total.
+
+Bookings go through book(), which makes the check and the write one atomic unit; see its
+docstring for how concurrent requests for the same doctor are kept apart.
+"""
+import random
+import time as clock
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from api.models import User, Appointment, WorkingHours
+from api.sqlite import serialized_write
+
+BOOKING_ATTEMPTS = 5  # Tries before a transient lock/serialization failure is surfaced
+SLOT_CONSTRAINT = 'appt_unique_active_slot'
+
+
+class BookingConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This doctor is already booked at this time.'
+    default_code = 'booking_conflict'
+
+
+def slot_length(doctor):
+    minutes = doctor.profile.slot_duration or settings.HMS_DEFAULT_SLOT_MINUTES
+    return timedelta(minutes=minutes)
+
+
+def active_bookings(doctor):
+    # Canceled appointments free their slot
+    return Appointment.objects.filter(doctor=doctor).exclude(status='canceled')
+
+
+def find_conflict(doctor, start, exclude_pk=None):
+    """Return the first active booking of `doctor` overlapping the slot starting at `start`, if any."""
+    length = slot_length(doctor)
+    bookings = active_bookings(doctor).filter(appointment_date__gt=start - length, appointment_date__lt=start + length)
+    if exclude_pk is not None:
+        bookings = bookings.exclude(pk=exclude_pk)
+    return bookings.order_by('appointment_date').first()
+
+
+def slot_taken(error):
+    """Whether an IntegrityError is a violation of appt_unique_active_slot, rather than any other."""
+    message = str(error)
+    # PostgreSQL names the violated index; SQLite only names its columns
+    table = Appointment._meta.db_table
+    return SLOT_CONSTRAINT in message or message == f'UNIQUE constraint failed: {table}.doctor_id, {table}.appointment_date'
+
+
+def locked_write(doctor_ids, write):
+    """
+    Call `write()` in a transaction that holds row locks on the given doctors' user rows.
+
+    Locks are taken in primary-key order (SELECT ... FOR UPDATE), so concurrent writers for
+    the same doctors queue behind each other without deadlocking on databases with row locks;
+    SQLite serialises writers on its own. If two requests still race, the loser hits the
+    appt_unique_active_slot constraint (same start) or a lock/serialization error (overlap on
+    SQLite). A violation of that constraint becomes BookingConflict (409); any other integrity
+    error (a user deleted meanwhile, a missing value) is raised as is. Lock errors are retried
+    with jittered backoff, and the retry then sees the committed booking and reports the conflict.
+    With the SQLite profile on, all of this runs on the writer thread (see api/sqlite.py).
+    """
+    def attempts():
+        for attempt in range(BOOKING_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    list(User.objects.select_for_update().filter(pk__in=doctor_ids).order_by('pk').values_list('pk', flat=True))
+                    return write()
+            except IntegrityError as error:
+                if not slot_taken(error):
+                    raise
+                raise BookingConflict() from error
+            except OperationalError:
+                if attempt == BOOKING_ATTEMPTS - 1:
+                    raise
+                clock.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+    return serialized_write(attempts)
+
+
+def book(doctor, start, save, exclude_pk=None):
+    """Atomically check `doctor`'s schedule at `start` and call `save()` to write the booking."""
+    def write():
+        if find_conflict(doctor, start, exclude_pk=exclude_pk):
+            raise BookingConflict()
+        return save()
+    return locked_write([doctor.pk], write)
+
+
+class IntervalIndex:
+    """
+    Sorted half-open [start, end) intervals with O(log n) overlap queries.
+
+    Starts are kept sorted and the longest interval length is tracked, so anything that
+    can overlap [start, end) begins inside (start - longest, end): one bisect finds the
+    first candidate and only the few intervals inside that window are inspected.
+    """
+
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _ in intervals]
+        self.ends = [end for _, end in intervals]
+        self.longest = max((end - start for start, end in intervals), default=timedelta(0))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.longest = max(self.longest, end - start)
+
+    def overlaps(self, start, end):
+        i = bisect_right(self.starts, start - self.longest)
+        while i < len(self.starts) and self.starts[i] < end:
+            if self.ends[i] > start:
+                return True
+            i += 1
+        return False
+
+
+def working_periods(doctor):
+    """Map weekday -> [(start_time, end_time), ...] for `doctor`."""
+    periods = {}
+    for weekday, start, end in WorkingHours.objects.filter(doctor=doctor).values_list('weekday', 'start_time', 'end_time'):
+        periods.setdefault(weekday, []).append((start, end))
+    if periods:
+        return periods
+    return {
+        weekday: [(time.fromisoformat(start), time.fromisoformat(end)) for start, end in hours]
+        for weekday, hours in settings.HMS_DEFAULT_WORKING_HOURS.items()
+    }
+
+
+def free_slots(doctor, window_start, window_end):
+    """List the (start, end) slots of `doctor` inside [window_start, window_end) that are not booked."""
+    length = slot_length(doctor)
+    booked = IntervalIndex(
+        (start, start + length)
+        for start in active_bookings(doctor).filter(
+            appointment_date__gt=window_start - length, appointment_date__lt=window_end
+        ).values_list('appointment_date', flat=True)
+    )
+    periods = working_periods(doctor)
+    tz = timezone.get_current_timezone()
+
+    slots = []
+    day = timezone.localtime(window_start, tz).date()
+    last_day = timezone.localtime(window_end, tz).date()
+    while day <= last_day:
+        for period_start, period_end in periods.get(day.weekday(), ()):
+            start = timezone.make_aware(datetime.combine(day, period_start), tz)
+            period_close = timezone.make_aware(datetime.combine(day, period_end), tz)
+            while start + length <= period_close:
+                end = start + length
+                if start >= window_start and end <= window_end and not booked.overlaps(start, end):
+                    slots.append((start, end))
+                start = end
+        day += timedelta(days=1)
+    return slots
@@ -0,0 +1,192 @@
+"""
+Full-text search over profiles, behind GET /api/search/.
+
+The index is a table beside api_profile, filled and kept in sync by database triggers (see
+migration 0010), so every write reaches it, bulk_create and raw SQL included. What it looks
+like depends on settings.HMS_SEARCH_BACKEND:
+
+- fts5: an SQLite FTS5 table with a prefix index for two- and three-letter prefixes, ranked
+  by bm25 with names weighted above specialization and specialization above history.
+- tsvector: a Postgres table with a weighted tsvector (GIN) and the names again as plain
+  text under a trigram index (pg_trgm), ranked by ts_rank plus trigram similarity.
+
+Every word of a query must match, as a prefix of an indexed word. Typos are tolerated:
+with FTS5, when a query matches nothing as typed, each word of HMS_SEARCH_FUZZY_MIN_LENGTH
+letters or more that prefixes nothing in the index also matches the indexed words within
+one edit of it (two from eight letters); with Postgres, trigram similarity on the names
+does the same job.
+
+Ranking all matches of a very common word (a diagnosis shared by half the patients) would
+cost time proportional to the matches, so only settings.HMS_SEARCH_CANDIDATES of them are
+ranked: the newest with FTS5, the first found with Postgres. Searches for names, the common
+case, match far fewer rows than that and are ranked exactly.
+
+Who may find whom follows profile_detail: admins see every profile, doctors every profile
+but admins', and patients only doctors, by name and specialization; another patient's
+medical history is never searchable by a patient.
+
+On SQLite, a later migration that rebuilds api_profile or api_user (Django does that for
+most column changes) drops the triggers with the old table and must create them again.
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connections, router
+
+from api.models import User, Profile
+
+NAME_COLUMNS = ('first_name', 'last_name', 'specialization')
+ALL_COLUMNS = NAME_COLUMNS + ('medical_history',)
+ROLES = {User.ADMIN, User.DOCTOR, User.PATIENT}
+WORD = re.compile(r'\w+')
+
+
+def visible_roles(user):
+    if user.role == User.ADMIN:
+        return set(ROLES)
+    if user.role == User.DOCTOR:
+        return {User.DOCTOR, User.PATIENT}
+    return {User.DOCTOR}
+
+
+def searchable_columns(user):
+    return ALL_COLUMNS if user.role in (User.ADMIN, User.DOCTOR) else NAME_COLUMNS
+
+
+def query_terms(text):
+    """The lower-cased, accent-free words of a query, as the index tokenizes them."""
+    folded = ''.join(
+        char for char in unicodedata.normalize('NFKD', text.lower()) if not unicodedata.combining(char)
+    )
+    return WORD.findall(folded)[:settings.HMS_SEARCH_MAX_TERMS]
+
+
+def search_profiles(terms, roles, columns, offset, limit):
+    """Ids of the profiles matching every term, best first."""
+    connection = connections[router.db_for_read(Profile)]
+    backend = BACKENDS[settings.HMS_SEARCH_BACKEND]()
+    with connection.cursor() as cursor:
+        return backend.search(cursor, terms, roles, columns, offset, limit)
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between a and b, or limit + 1 once it exceeds limit."""
+    over = limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return over
+    # A shared prefix or suffix never needs an edit; names often differ only in the middle
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    # Only cells within `limit` of the diagonal can stay under the limit
+    before, previous = None, [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        for j in range(low, high + 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                distance = min(distance, before[j - 2] + 1)  # Transposition
+            current[j] = distance
+        if min(current[low - 1:high + 1]) > limit:
+            return over
+        before, previous = previous, current
+    return min(previous[-1], over)
+
+
+class FTS5Search:
+    table = 'api_profile_search'
+    terms_table = 'api_profile_search_terms'
+
+    def search(self, cursor, terms, roles, columns, offset, limit):
+        rows = self.ranked(cursor, [f'"{term}"*' for term in terms], roles, columns, offset, limit)
+        if rows or offset and self.ranked(cursor, [f'"{term}"*' for term in terms], roles, columns, 0, 1):
+            return rows
+        # Nothing matches as typed: let the words that prefix nothing stand for similar indexed words
+        expressions = [self.term_expression(cursor, term, columns) for term in terms]
+        if expressions == [f'"{term}"*' for term in terms]:
+            return rows
+        return self.ranked(cursor, expressions, roles, columns, offset, limit)
+
+    def ranked(self, cursor, expressions, roles, columns, offset, limit):
+        match = f'{{{" ".join(columns)}}} : ({" AND ".join(expressions)}){self.role_filter(roles)}'
+        cursor.execute(
+            f'SELECT rowid FROM ('
+            f'  SELECT rowid, rank FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rowid DESC LIMIT %s'
+            f') ORDER BY rank, rowid LIMIT %s OFFSET %s',
+            [match, settings.HMS_SEARCH_CANDIDATES, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def role_filter(self, roles):
+        others = ROLES - roles
+        if not others:
+            return ''
+        # Patients are nearly every row, so exclude the small roles rather than match the big one
+        if User.PATIENT in roles:
+            return f' NOT role : ({" OR ".join(sorted(others))})'
+        return f' AND role : ({" OR ".join(sorted(roles))})'
+
+    def term_expression(self, cursor, term, columns):
+        if len(term) < settings.HMS_SEARCH_FUZZY_MIN_LENGTH:
+            return f'"{term}"*'
+        # Candidates share the first two letters, swapped or not, or the first and third (a typo in
+        # the second letter). Reading a one-letter range of the vocabulary would cost too much
+        candidates = set()
+        for prefix in {term[:2], term[1] + term[0], term[0] + term[2]}:
+            candidates.update(self.indexed_terms(cursor, prefix, columns))
+        if any(candidate.startswith(term) for candidate in candidates):
+            return f'"{term}"*'  # Matches as typed; another word of the query is what failed
+        variants = [f'"{term}"*'] + [f'"{word}"' for word in self.similar_terms(term, candidates)]
+        return f'({" OR ".join(variants)})' if len(variants) > 1 else variants[0]
+
+    def indexed_terms(self, cursor, prefix, columns):
+        placeholders = ', '.join(['%s'] * len(columns))
+        cursor.execute(
+            f'SELECT DISTINCT term FROM {self.terms_table} WHERE term >= %s AND term < %s AND col IN ({placeholders})',
+            [prefix, prefix + '\uffff', *columns],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def similar_terms(self, term, candidates):
+        limit = 1 if len(term) < 8 else 2
+        letters = set(term)
+        scored = sorted(
+            (distance, candidate) for candidate in candidates
+            # Each letter of the term missing from the candidate costs at least one edit
+            if len(letters.difference(candidate)) <= limit and (distance := edit_distance(term, candidate, limit)) <= limit
+        )
+        return [candidate for _, candidate in scored[:settings.HMS_SEARCH_FUZZY_EXPANSIONS]]
+
+
+class TSVectorSearch:
+    weights = {'first_name': 'A', 'last_name': 'A', 'specialization': 'B', 'medical_history': 'D'}
+
+    def search(self, cursor, terms, roles, columns, offset, limit):
+        weights = ''.join(sorted({self.weights[column] for column in columns}))
+        if weights == 'ABD':
+            weights = ''  # Every weight in use; no restriction
+        tsquery = ' & '.join(f'{term}:*{weights}' for term in terms)
+        cursor.execute(
+            'SELECT profile_id FROM ('
+            '  SELECT s.profile_id, ts_rank(s.document, query) + similarity(s.names, %s) AS score'
+            '  FROM api_profile_search s, to_tsquery(\'simple\', %s) query'
+            '  WHERE s.role = ANY(%s) AND (s.document @@ query OR s.names %% %s)'
+            '  LIMIT %s'
+            ') candidates ORDER BY score DESC, profile_id LIMIT %s OFFSET %s',
+            [' '.join(terms), tsquery, sorted(roles), ' '.join(terms), settings.HMS_SEARCH_CANDIDATES, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'fts5': FTS5Search,
+    'tsvector': TSVectorSearch,
+}
@@ -0,0 +1,169 @@
+"""
+Synthetic hospital data at scale, for `python manage.py seed_hms` and the benchmarks.
+
+Rows go in with bulk_create, one transaction per batch, so none of the per-row signals run:
+profiles are bulk-created beside their users instead of by the post_save receiver, cached
+reads are not invalidated, and no audit or reminder tasks are queued for seeded
+appointments. Database triggers still fire, so the search index of migration 0010 fills
+as profiles go in.
+
+Every seeded user gets the same password, hashed once. Usernames are admin{i}, doctor{i}
+and patient{i}. Appointments keep to settings.HMS_DEFAULT_WORKING_HOURS on the default slot
+grid, from `history_days` back to `future_days` ahead: appointment i goes to doctor
+i % doctors, whose appointments are spread evenly over the slots of that window (packed
+past its end when there are more of them than slots), so no doctor is ever double-booked.
+Past appointments are mostly confirmed, future ones mostly pending, a few of either canceled.
+
+The same counts, seed and day give the same rows.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import User, Profile, Appointment
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Karen',
+    'Daniel', 'Lisa', 'Matthew', 'Nancy', 'Anthony', 'Sandra', 'Mark', 'Ashley', 'Ahmed', 'Fatima',
+    'Wei', 'Mei', 'Raj', 'Priya', 'Hiroshi', 'Yuki', 'Olga', 'Ivan', 'José', 'María', 'Chidi', 'Amara',
+    'Liam', 'Emma', 'Noah', 'Olivia', 'Lucas', 'Sofia', 'Mateo', 'Chloé', 'Omar', 'Leila', 'Sven', 'Ingrid',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+    'Walker', 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores', 'Green',
+    'Adams', 'Nelson', 'Baker', 'Hall', 'Rivera', 'Campbell', 'Mitchell', 'Carter', 'Roberts', 'Chen',
+    'Wang', 'Patel', 'Kim', 'Singh', 'Khan', 'Müller', 'Schmidt', 'Rossi', 'Dubois', 'Novak', 'Okafor',
+    'Tanaka', 'Sato', 'Ivanova', 'Petrov', 'Haddad', 'Cohen', 'Larsen', 'Nilsson', 'O\'Brien', 'Murphy',
+]
+SPECIALIZATIONS = [
+    'General Practice', 'Cardiology', 'Neurology', 'Dermatology', 'Pediatrics', 'Oncology', 'Orthopedics',
+    'Radiology', 'Psychiatry', 'Urology', 'Gastroenterology', 'Endocrinology', 'Nephrology', 'Ophthalmology',
+]
+CONDITIONS = [
+    'asthma', 'type 2 diabetes', 'hypertension', 'seasonal allergies', 'migraine', 'a fractured wrist',
+    'osteoarthritis', 'anemia', 'chronic bronchitis', 'eczema', 'gout', 'insomnia', 'hypothyroidism',
+    'psoriasis', 'recurrent sinusitis', 'high cholesterol', 'depression', 'lower back pain', 'GERD',
+]
+REASONS = [
+    'Annual checkup', 'Follow-up visit', 'Persistent headache', 'Chest pain', 'Skin rash', 'Back pain',
+    'Prescription renewal', 'Test results review', 'Fever and cough', 'Joint pain', 'Vaccination',
+    'Blood pressure check', 'Dizziness', 'Sleep problems', 'Stomach ache', None,
+]
+STREETS = ['Main St', 'Oak Ave', 'Maple Rd', 'Cedar Ln', 'Park Blvd', 'Elm St', 'Lake Dr', 'Hill Rd', 'River Way']
+CITIES = ['Springfield', 'Riverside', 'Fairview', 'Franklin', 'Greenville', 'Bristol', 'Clinton', 'Madison']
+PAST_STATUSES = ['confirmed'] * 17 + ['canceled'] * 2 + ['pending']
+FUTURE_STATUSES = ['pending'] * 11 + ['confirmed'] * 8 + ['canceled']
+
+
+def week_slots():
+    """Offsets from Monday 00:00 of every default-length slot in the default working hours."""
+    length = timedelta(minutes=settings.HMS_DEFAULT_SLOT_MINUTES)
+    offsets = []
+    for weekday, periods in sorted(settings.HMS_DEFAULT_WORKING_HOURS.items()):
+        for start, end in periods:
+            slot = datetime.combine(date.min, time.fromisoformat(start))
+            close = datetime.combine(date.min, time.fromisoformat(end))
+            while slot + length <= close:
+                offsets.append(timedelta(days=weekday) + (slot - datetime.min))
+                slot += length
+    return offsets
+
+
+def first_monday(day):
+    """Midnight, in the current time zone, of the Monday of `day`'s week."""
+    monday = day - timedelta(days=day.weekday())
+    return timezone.make_aware(datetime.combine(monday, time.min))
+
+
+def slot_start(monday, offsets, index):
+    """Start of the `index`-th slot of a doctor's calendar that begins on `monday`."""
+    week, slot = divmod(index, len(offsets))
+    return monday + timedelta(weeks=week) + offsets[slot]
+
+
+def profile(rng, role, today):
+    born = today - timedelta(days=rng.randint(18 * 365, 90 * 365) if role != User.PATIENT else rng.randint(0, 95 * 365))
+    age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))  # As Profile.save would
+    fields = {
+        'first_name': rng.choice(FIRST_NAMES),
+        'last_name': rng.choice(LAST_NAMES),
+        'gender': rng.choice(['male', 'female']),
+        'phone_number': f'+1{rng.randint(2000000000, 9999999999)}',
+        'address': f'{rng.randint(1, 9999)} {rng.choice(STREETS)}, {rng.choice(CITIES)}',
+        'date_of_birth': born,
+        'age': age,
+    }
+    if role == User.DOCTOR:
+        fields.update(
+            specialization=rng.choice(SPECIALIZATIONS),
+            consultation_fees=Decimal(rng.randrange(50, 300, 10)),
+            license_number=f'MD-{rng.randint(100000, 999999)}',
+        )
+    elif role == User.PATIENT and rng.random() < 0.7:
+        fields['medical_history'] = f'History of {" and ".join(rng.sample(CONDITIONS, rng.randint(1, 2)))}.'
+    return fields
+
+
+def seed(doctors=500, patients=20_000, appointments=1_000_000, admins=1, password='hms-bench', seed=42,
+         history_days=365, future_days=90, batch_size=10_000, progress=None):
+    """
+    Insert the users, profiles and appointments described in the module docstring.
+
+    `progress(what, done, total)` is called after every batch. Returns the number of rows
+    inserted per model.
+    """
+    rng = random.Random(seed)
+    today = timezone.localdate()
+    hashed = make_password(password)  # Once: hashing per user would take hours at this scale
+    report = progress or (lambda what, done, total: None)
+
+    ids = {}
+    for role, prefix, count in ((User.ADMIN, 'admin', admins), (User.DOCTOR, 'doctor', doctors),
+                                (User.PATIENT, 'patient', patients)):
+        ids[role] = []
+        for begin in range(0, count, batch_size):
+            numbers = range(begin, min(begin + batch_size, count))
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=f'{prefix}{i}', email=f'{prefix}{i}@hms.test', password=hashed, role=role)
+                    for i in numbers
+                ])
+                Profile.objects.bulk_create([Profile(user=user, **profile(rng, role, today)) for user in users])
+            ids[role].extend(user.pk for user in users)
+            report(f'{prefix}s', numbers.stop, count)
+
+    offsets = week_slots()
+    monday = first_monday(today - timedelta(days=history_days))
+    now = timezone.now()
+    doctor_ids, patient_ids = ids[User.DOCTOR], ids[User.PATIENT]
+    if doctor_ids:
+        window = len(offsets) * ((history_days + future_days) // 7 + 1)
+        step = max(1.0, window / -(-appointments // len(doctor_ids)))  # Slots per appointment of each doctor
+    for begin in range(0, appointments if doctor_ids and patient_ids else 0, batch_size):
+        batch = []
+        for i in range(begin, min(begin + batch_size, appointments)):
+            start = slot_start(monday, offsets, int(i // len(doctor_ids) * step))
+            batch.append(Appointment(
+                doctor_id=doctor_ids[i % len(doctor_ids)],
+                patient_id=rng.choice(patient_ids),
+                appointment_date=start,
+                reason=rng.choice(REASONS),
+                status=rng.choice(PAST_STATUSES if start < now else FUTURE_STATUSES),
+            ))
+        with transaction.atomic():
+            Appointment.objects.bulk_create(batch)
+        report('appointments', begin + len(batch), appointments)
+
+    return {
+        'users': admins + doctors + patients,
+        'profiles': admins + doctors + patients,
+        'appointments': appointments if doctor_ids and patient_ids else 0,
+    }
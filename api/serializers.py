@@ -1,13 +1,23 @@
 from api.models import User, Profile, Appointment
+from api.services import create_user, update_profile
+from django.conf import settings
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework import serializers
+from api import metrics
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(metrics.TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Profile
         fields = '__all__'  # Include all fields, including age and date_of_birth
+        read_only_fields = ['version']
+        list_serializer_class = metrics.TimedListSerializer
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # to_representation reads instance.user.role, so join the user up front
+        return queryset.select_related('user')
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -22,23 +32,57 @@ class ProfileSerializer(serializers.ModelSerializer):
 
         return representation
 
-class UserSerializer(serializers.ModelSerializer):
+    def update(self, instance, validated_data):
+        # Write only the columns that changed, and nothing at all if none did
+        return update_profile(instance, validated_data)
+
+class UserSerializer(metrics.TimedSerializerMixin, serializers.ModelSerializer):
     profile = ProfileSerializer()
      
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'role', 'profile']  # Added role field
+        list_serializer_class = metrics.TimedListSerializer
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # The nested profile is fetched with the user in a single JOIN; Django also
+        # caches profile.user, so ProfileSerializer's role lookup costs nothing
+        return queryset.select_related('profile')
+
+
+class ProfileSummarySerializer(metrics.TimedSerializerMixin, serializers.ModelSerializer):
+    # Only what the list screens show; ?expand=profile brings back ProfileSerializer (api/fieldsets.py)
+    class Meta:
+        model = Profile
+        fields = ['first_name', 'last_name', 'specialization']
+        list_serializer_class = metrics.TimedListSerializer
+
+
+class UserSummarySerializer(UserSerializer):
+    # The default row of /api/doctors/ and /api/patients/, and the nested users of AppointmentSummarySerializer
+    profile = ProfileSummarySerializer(read_only=True)
+
+    class Meta(UserSerializer.Meta):
+        pass
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
+        token['role'] = user.role  # Include the user's role
 
-        # Add custom claims
+        # The navbar and profile screens show these straight from the token
         token['username'] = user.username
         token['email'] = user.email
-        token['role'] = user.role  # Include the user's role
+
+        if settings.HMS_COMPACT_TOKENS:
+            # Bounded claims only; the profile details come from the cached /api/profile/
+            token['profile_version'] = user.profile.version if hasattr(user, 'profile') else None
+            return token
+
+        # Add custom claims
 
         if hasattr(user, 'profile'):
             token['first_name'] = user.profile.first_name
@@ -58,7 +102,7 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         return token
 
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(metrics.TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(
         write_only=True,
         required=True,
@@ -86,18 +130,13 @@ class RegisterSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        user = User.objects.create(
+        # One INSERT for the user (password already hashed) and one for its profile
+        return create_user(
             username=validated_data['username'],
             email=validated_data['email'],
+            password=validated_data['password'],
             role=validated_data['role']  # Assign role
         )
-        user.set_password(validated_data['password'])
-        user.save()
-
-        # Automatically create a profile for the new user, using get_or_create
-        Profile.objects.get_or_create(user=user)
-
-        return user
 
 
 
@@ -169,7 +208,66 @@ from rest_framework import serializers
 from .models import Appointment
   # Assuming you have a UserSerializer
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that can resolve ids from a batch loaded up front.
+
+    AppointmentListSerializer fills `preloaded` with one in_bulk() query per field before
+    validating its rows; otherwise every row would run its own SELECT per related field.
+    """
+    preloaded = None
+
+    def to_internal_value(self, data):
+        if self.preloaded is None:
+            return super().to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return self.preloaded[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class AppointmentListSerializer(metrics.TimedListSerializer):
+    """
+    many=True flavour of AppointmentSerializer, used to validate bulk writes.
+
+    Rows are validated independently: validated_data holds (index, attrs) pairs for the
+    valid rows and row_errors maps the index of every invalid row to its errors, so one bad
+    row does not reject the whole batch. Output (to_representation) is unchanged.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError({"non_field_errors": ["Expected a list of appointments."]})
+        self.preload_related(data)
+        self.row_errors = {}
+        rows = []
+        for index, item in enumerate(data):
+            try:
+                rows.append((index, self.child.run_validation(item)))
+            except serializers.ValidationError as exc:
+                self.row_errors[index] = exc.detail
+        return rows
+
+    def preload_related(self, data):
+        for name, field in self.child.fields.items():
+            if isinstance(field, PreloadedPrimaryKeyRelatedField):
+                ids = set()
+                for item in data:
+                    value = item.get(name) if isinstance(item, dict) else None
+                    if isinstance(value, bool):
+                        continue
+                    try:
+                        ids.add(int(value))
+                    except (TypeError, ValueError):
+                        pass  # Reported per row by to_internal_value
+                field.preloaded = field.get_queryset().in_bulk(ids)
+
+
+class AppointmentSerializer(metrics.TimedSerializerMixin, serializers.ModelSerializer):
     # Read-only for retrieving detailed doctor and patient data
     doctor_detail = UserSerializer(source='doctor', read_only=True)
     patient_detail = UserSerializer(source='patient', read_only=True)
@@ -180,19 +278,29 @@ class AppointmentSerializer(serializers.ModelSerializer):
     # - No patient ID is passed when a patient is booking an appointment.
     # This logic is managed in the backend, eliminating the need for frontend handling of these fields.
     
-    doctor = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role=User.DOCTOR), required=False)
-    patient = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role=User.PATIENT), required=False)
+    doctor = PreloadedPrimaryKeyRelatedField(queryset=User.objects.filter(role=User.DOCTOR), required=False)
+    patient = PreloadedPrimaryKeyRelatedField(queryset=User.objects.filter(role=User.PATIENT), required=False)
 
     class Meta:
         model = Appointment
         fields = ['id', 'doctor', 'patient', 'doctor_detail', 'patient_detail', 'appointment_date', 'reason', 'status']
+        # No auto-generated validator for the appt_unique_active_slot constraint: doctor is often
+        # filled in by the view, and api.scheduling.book() checks the slot atomically (409 on conflict)
+        validators = []
+        list_serializer_class = AppointmentListSerializer
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # doctor_detail and patient_detail each nest a UserSerializer -> ProfileSerializer,
+        # so join both users and their profiles to keep the query count flat per page
+        return queryset.select_related('doctor__profile', 'patient__profile')
     
     def validate(self, attrs):
         doctor = attrs.get('doctor')
         patient = attrs.get('patient')
 
-        # Ensure doctor is not the patient
-        if doctor == patient:
+        # Ensure doctor is not the patient (both are omitted on partial updates)
+        if doctor is not None and doctor == patient:
             raise serializers.ValidationError("Doctor and patient cannot be the same person.")
 
         return attrs
@@ -205,3 +313,13 @@ class AppointmentSerializer(serializers.ModelSerializer):
         
 
         return super().create(validated_data)
+
+
+class AppointmentSummarySerializer(AppointmentSerializer):
+    # The default row of /api/appointments/: names instead of whole profiles; ?expand=doctor_detail,patient_detail
+    # nests the full users of AppointmentSerializer instead (api/fieldsets.py)
+    doctor_detail = UserSummarySerializer(source='doctor', read_only=True)
+    patient_detail = UserSummarySerializer(source='patient', read_only=True)
+
+    class Meta(AppointmentSerializer.Meta):
+        pass
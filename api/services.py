@@ -0,0 +1,28 @@
+"""
+The single write path for users and their profiles.
+
+A user and its profile are created with exactly two INSERTs, and a profile update writes
+only the columns whose values changed (or nothing at all). Saving a User no longer touches
+its Profile; see the signals in api/models.py.
+"""
+from api.models import User, Profile
+
+
+def create_user(username, email, password, role=User.PATIENT, **profile_fields):
+    """Create a user with a hashed password and its profile, optionally pre-filled."""
+    user = User(username=username, email=email, role=role)
+    user.set_password(password)
+    # Picked up by the create_user_profile signal, so the profile is inserted once, already filled in
+    user._profile_fields = profile_fields
+    user.save()
+    return user
+
+
+def update_profile(profile, changes):
+    """Apply `changes` to `profile`, saving only the fields whose values differ."""
+    changed = [field for field, value in changes.items() if getattr(profile, field) != value]
+    for field in changed:
+        setattr(profile, field, changes[field])
+    if changed:
+        profile.save(update_fields=changed)
+    return profile
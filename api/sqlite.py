@@ -0,0 +1,58 @@
+"""
+Opt-in high-throughput profile for SQLite (settings.HMS_SQLITE_FAST).
+
+Two parts:
+
+- Every new SQLite connection gets settings.HMS_SQLITE_PRAGMAS: a WAL journal, so readers
+  never wait for the writer and vice versa, synchronous=NORMAL, which syncs at checkpoints
+  instead of on every commit, and a memory-mapped read window.
+- Booking and profile writes go through serialized_write(), which hands them to one writer
+  thread. That thread owns the only connection that ever writes, so writers queue in
+  process instead of contending for SQLite's file lock, and "database is locked" can no
+  longer happen between them. Reads stay on each request thread's own connection.
+
+A write that is already inside a transaction on the calling thread runs inline: the
+transaction cannot move to another connection. With several worker processes each has its
+own writer thread, and the busy timeout in DATABASES OPTIONS still arbitrates between them.
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+
+class WriteQueue:
+    """Runs callables one at a time on a single dedicated thread and waits for their results."""
+
+    def __init__(self):
+        # Created up front, so two first writes cannot each make one; its thread starts on first use
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hms-writer')
+
+    def run(self, write):
+        # In the caller's context, so the write still counts towards its request: the
+        # read-your-writes pin (api/routers.py) and the query metrics (api/metrics.py)
+        return self.executor.submit(contextvars.copy_context().run, write).result()
+
+
+write_queue = WriteQueue()
+
+
+def serialized_write(write):
+    """Call `write()` on the writer thread when the SQLite profile is on, inline otherwise."""
+    if not settings.HMS_SQLITE_FAST or connection.in_atomic_block or is_writer_thread():
+        return write()
+    return write_queue.run(write)
+
+
+def is_writer_thread():
+    return threading.current_thread().name.startswith('hms-writer')
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not settings.HMS_SQLITE_FAST:
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.HMS_SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -0,0 +1,100 @@
+"""
+Delta sync behind GET /api/appointments/changes/?since=<token>.
+
+A client keeps a local copy of the appointments it may see. The first call (no `since`)
+returns all of them, settings.HMS_SYNC_PAGE_SIZE per page; every later call returns only
+those created or changed since the token it passes (a cancellation is a change of status),
+and the ids of those that are gone, so applying `changed` and then `deleted` brings the
+copy up to date. Keep calling with `next` while `has_more` is true.
+
+Changes are found through the updated_at index, in (updated_at, id) keyset order. Deleted
+appointments leave a tombstone (AppointmentTombstone, written by the triggers of migration
+0012, so cascades and bulk deletes are covered), and so does an appointment moved to
+another doctor or patient, under the ones it left. A tombstone for an appointment the
+caller can still see (moved from one doctor to another, seen by the unchanged patient) is
+not reported: the row comes back as changed instead.
+
+updated_at is set when a row is saved, not when its transaction commits, and on each
+server's own clock, so a row can become visible with a timestamp a little in the past.
+Tokens therefore never move past now - settings.HMS_SYNC_SETTLE_SECONDS: anything newer is
+still returned, but again on the next call as well, so clients must apply changes
+idempotently (by id). For the same reason the endpoint reads the primary database, never
+a replica that may lag by more than that. Tombstones are kept for
+settings.HMS_SYNC_TOMBSTONE_DAYS (`manage.py prune_tombstones`); a token older than that
+gets 410 Gone, and the client starts over without `since`.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from api.models import Appointment, AppointmentTombstone
+from api import permissions
+
+SALT = 'api.sync'
+
+
+class ResyncRequired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'This sync token is too old; sync again without since.'
+    default_code = 'resync_required'
+
+
+def encode(cursor, since):
+    """The token for the (updated_at, id) position reached and the time tombstones were read up to."""
+    return signing.dumps({'c': [cursor[0].isoformat(), cursor[1]] if cursor else None, 't': since.isoformat()},
+                         salt=SALT, compress=True)
+
+
+def decode(token):
+    try:
+        data = signing.loads(token, salt=SALT)
+        cursor = (datetime.fromisoformat(data['c'][0]), int(data['c'][1])) if data['c'] else None
+        return cursor, datetime.fromisoformat(data['t'])
+    except (signing.BadSignature, KeyError, IndexError, TypeError, ValueError):
+        raise ValidationError({"since": "Invalid sync token."})
+
+
+def after(cursor):
+    return Q(updated_at__gt=cursor[0]) | Q(updated_at=cursor[0], id__gt=cursor[1])
+
+
+def changes(user, appointments, token=None, now=None):
+    """
+    The page of `appointments` (the caller's, eagerly loaded) changed since `token`.
+
+    Returns {'changed': [Appointment], 'deleted': [id], 'has_more': bool, 'next': token}.
+    """
+    now = now or timezone.now()
+    settled = now - timedelta(seconds=settings.HMS_SYNC_SETTLE_SECONDS)
+    cursor, since = decode(token) if token else (None, settled)
+    if since < now - timedelta(days=settings.HMS_SYNC_TOMBSTONE_DAYS):
+        raise ResyncRequired()
+
+    if cursor:
+        appointments = appointments.filter(after(cursor))
+    size = settings.HMS_SYNC_PAGE_SIZE
+    rows = list(appointments.filter(updated_at__lte=settled).order_by('updated_at', 'id')[:size + 1])
+    if len(rows) > size:
+        rows = rows[:size]
+        return {'changed': rows, 'deleted': [], 'has_more': True,
+                'next': encode((rows[-1].updated_at, rows[-1].pk), since)}
+
+    # Caught up: also send what is still settling, without moving the token past it
+    rows += appointments.filter(updated_at__gt=settled).order_by('updated_at', 'id')
+    # Tombstones carry the doctor and patient ids, so the appointments' scope applies to them as is
+    gone = set(AppointmentTombstone.objects.filter(permissions.appointments(user), deleted_at__gt=since)
+               .values_list('appointment_id', flat=True))
+    if gone:
+        gone -= set(Appointment.objects.filter(permissions.appointments(user), pk__in=gone).values_list('id', flat=True))
+    return {'changed': rows, 'deleted': sorted(gone), 'has_more': False, 'next': encode((settled, 0), settled)}
+
+
+def prune(now=None):
+    """Delete the tombstones no valid token can ask for any more; returns how many."""
+    cutoff = (now or timezone.now()) - timedelta(days=settings.HMS_SYNC_TOMBSTONE_DAYS)
+    return AppointmentTombstone.objects.filter(deleted_at__lt=cutoff).delete()[0]
@@ -0,0 +1,281 @@
+"""
+Background tasks kept in the database, for side effects that must not add to request latency.
+
+A request only inserts Task rows, in the same transaction as the change that caused them, so
+a task exists exactly when its change was committed. `python manage.py run_tasks` runs a pool
+of worker threads that claim due tasks in batches and call the handler registered under each
+task's name. No broker is involved: the database is the queue.
+
+Delivery is at least once:
+
+- A claim marks up to settings.HMS_TASK_BATCH_SIZE due tasks as running and pushes their
+  run_after forward by settings.HMS_TASK_LEASE_SECONDS. A worker that dies leaves them to be
+  claimed again when the lease runs out.
+- A handler's writes and the deletion of its finished tasks commit together.
+- A failed batch is retried task by task, so one bad task does not hold back the rest. A task
+  that keeps failing backs off exponentially from settings.HMS_TASK_RETRY_SECONDS and is
+  marked failed after settings.HMS_TASK_MAX_ATTEMPTS attempts.
+
+Handlers therefore have to be idempotent. The ones below key what they write on the task id,
+which a unique constraint makes safe to insert twice.
+
+Appointment saves and deletions enqueue an audit record, a reminder for the patient and,
+on a status change, a notification to both parties; the receivers are connected in
+api/apps.py. Bulk writes skip signals, so api/bulk.py enqueues the same tasks through
+appointment_tasks(). Imports taken by POST /api/users/import/ run as `import_users` tasks,
+so their password hashing uses the importer's process pool instead of the request.
+"""
+import logging
+import threading
+import traceback
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api import imports
+from api.models import Appointment, AppointmentAudit, Notification, Task, UserImport
+
+logger = logging.getLogger(__name__)
+
+handlers = {}
+
+
+def handler(name, atomic=True):
+    """
+    Register `fn(tasks)` as the handler for tasks called `name`; it gets a list of Task rows.
+    It runs in one transaction with the deletion of its tasks, unless `atomic` is False: then
+    it commits its own writes, for work too long to hold the write lock through.
+    """
+    def register(fn):
+        fn.atomic = atomic
+        handlers[name] = fn
+        return fn
+    return register
+
+
+def task(name, payload, run_after=None):
+    return Task(name=name, payload=payload, run_after=run_after or timezone.now())
+
+
+def enqueue(name, payload, run_after=None):
+    return enqueue_many([task(name, payload, run_after)])[0]
+
+
+def enqueue_many(tasks):
+    return Task.objects.bulk_create(tasks) if tasks else []
+
+
+# Appointment side effects
+
+def appointment_tasks(appointment, created=False, deleted=False):
+    """The tasks for one saved or deleted appointment, compared with how it was loaded."""
+    before = getattr(appointment, '_loaded', {})
+    moved = 'appointment_date' in before and before['appointment_date'] != appointment.appointment_date
+    status_changed = 'status' in before and before['status'] != appointment.status
+    if deleted:
+        action = 'deleted'
+    elif created:
+        action = 'created'
+    elif status_changed:
+        action = 'status_changed'
+    elif moved:
+        action = 'rescheduled'
+    else:
+        action = 'updated'
+
+    details = {
+        'appointment': appointment.pk,
+        'status': appointment.status,
+        'appointment_date': appointment.appointment_date.isoformat(),
+    }
+    tasks = [task('audit', {**details, 'action': action, 'changed_at': timezone.now().isoformat()})]
+    if not deleted and (created or moved) and appointment.status != 'canceled':
+        remind_at = max(timezone.now(), appointment.appointment_date - settings.HMS_REMINDER_LEAD)
+        tasks.append(task('remind', details, run_after=remind_at))
+    if not deleted and status_changed:
+        tasks.append(task('notify', {**details, 'recipients': [appointment.patient_id, appointment.doctor_id]}))
+    return tasks
+
+
+def appointment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return  # Fixture loading
+    enqueue_many(appointment_tasks(instance, created=created))
+    # A later save of the same instance compares against what is now stored
+    instance._loaded = {'status': instance.status, 'appointment_date': instance.appointment_date,
+                        'doctor_id': instance.doctor_id, 'patient_id': instance.patient_id}
+
+
+def appointment_deleted(sender, instance, **kwargs):
+    enqueue_many(appointment_tasks(instance, deleted=True))
+
+
+@handler('audit')
+def record_audits(tasks):
+    AppointmentAudit.objects.bulk_create([
+        AppointmentAudit(
+            appointment_id=task.payload['appointment'],
+            action=task.payload['action'],
+            status=task.payload['status'],
+            appointment_date=datetime.fromisoformat(task.payload['appointment_date']),
+            changed_at=datetime.fromisoformat(task.payload['changed_at']),
+            source_task=task.pk,
+        )
+        for task in tasks
+    ], ignore_conflicts=True)
+
+
+@handler('remind')
+def send_reminders(tasks):
+    appointments = Appointment.objects.in_bulk([task.payload['appointment'] for task in tasks])
+    notifications = []
+    for task in tasks:
+        appointment = appointments.get(task.payload['appointment'])
+        # Nothing to remind of once canceled, deleted or moved; a move scheduled its own reminder
+        if appointment is None or appointment.status == 'canceled':
+            continue
+        if appointment.appointment_date != datetime.fromisoformat(task.payload['appointment_date']):
+            continue
+        notifications.append(Notification(
+            recipient_id=appointment.patient_id,
+            appointment=appointment,
+            kind='reminder',
+            message=f'Reminder: you have an appointment on {appointment.appointment_date:%Y-%m-%d at %H:%M}.',
+            source_task=task.pk,
+        ))
+    Notification.objects.bulk_create(notifications, ignore_conflicts=True)
+
+
+@handler('notify')
+def notify_status_changes(tasks):
+    existing = set(Appointment.objects.filter(
+        pk__in=[task.payload['appointment'] for task in tasks]
+    ).values_list('pk', flat=True))
+    notifications = []
+    for task in tasks:
+        date = datetime.fromisoformat(task.payload['appointment_date'])
+        appointment_id = task.payload['appointment'] if task.payload['appointment'] in existing else None
+        notifications += [
+            Notification(
+                recipient_id=recipient,
+                appointment_id=appointment_id,
+                kind='status',
+                message=f'Your appointment on {date:%Y-%m-%d at %H:%M} is now {task.payload["status"]}.',
+                source_task=task.pk,
+            )
+            for recipient in task.payload['recipients']
+        ]
+    Notification.objects.bulk_create(notifications, ignore_conflicts=True)
+
+
+# User imports
+
+@handler('import_users', atomic=False)
+def import_users(tasks):
+    # Outside the batch transaction: hashing a large import takes minutes, and each batch of
+    # users commits on its own as the command's do
+    for task in tasks:
+        upload = UserImport.objects.filter(pk=task.payload['import'], report__isnull=True).first()
+        if upload is None:
+            continue  # Finished by an earlier delivery
+        report = imports.UserImporter().run(iter(upload.rows))
+        # The first delivery to finish reports; a redelivered one found the users already there
+        UserImport.objects.filter(pk=upload.pk, report__isnull=True).update(
+            rows=[], report=report, finished_at=timezone.now())
+
+
+# Workers
+
+class Worker:
+    """Claims due tasks and runs them, one batch per run_once() call."""
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.HMS_TASK_BATCH_SIZE
+
+    def claim(self):
+        now = timezone.now()
+        with transaction.atomic():
+            due = Task.objects.exclude(status=Task.FAILED).filter(run_after__lte=now).order_by('run_after', 'id')
+            # Postgres workers skip each other's rows; SQLite's IMMEDIATE transactions serialise claims instead
+            if connection.features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            ids = list(due.values_list('pk', flat=True)[:self.batch_size])
+            if not ids:
+                return []
+            Task.objects.filter(pk__in=ids).update(
+                status=Task.RUNNING,
+                run_after=now + timedelta(seconds=settings.HMS_TASK_LEASE_SECONDS),
+                attempts=F('attempts') + 1,
+            )
+            return list(Task.objects.filter(pk__in=ids).order_by('name', 'id'))
+
+    def run_once(self):
+        """Claim and run one batch; return how many tasks it held."""
+        tasks = self.claim()
+        for name, group in groupby(tasks, key=lambda task: task.name):
+            self.run(name, list(group))
+        return len(tasks)
+
+    def run(self, name, tasks):
+        try:
+            if name not in handlers:
+                raise LookupError(f'No handler registered for task {name!r}.')
+            with transaction.atomic() if getattr(handlers[name], 'atomic', True) else nullcontext():
+                handlers[name](tasks)
+                Task.objects.filter(pk__in=[task.pk for task in tasks]).delete()
+        except Exception as exc:
+            if len(tasks) > 1:
+                for task in tasks:  # Find the task that failed; the others can still finish now
+                    self.run(name, [task])
+            else:
+                self.retry(tasks[0], exc)
+
+    def retry(self, task, exc):
+        if task.attempts >= settings.HMS_TASK_MAX_ATTEMPTS:
+            task.status = Task.FAILED
+        else:
+            task.status = Task.QUEUED
+            delay = settings.HMS_TASK_RETRY_SECONDS * 2 ** (task.attempts - 1)
+            task.run_after = timezone.now() + timedelta(seconds=delay)
+        task.last_error = ''.join(traceback.format_exception_only(exc)).strip()
+        task.save(update_fields=['status', 'run_after', 'last_error'])
+
+
+def work(stop, batch_size=None, poll=None, drain=False):
+    """Run batches until `stop` is set, or, with `drain`, until nothing is due."""
+    worker = Worker(batch_size)
+    poll = settings.HMS_TASK_POLL_SECONDS if poll is None else poll
+    while not stop.is_set():
+        try:
+            claimed = worker.run_once()
+        except DatabaseError:
+            # The database went away or stayed locked; leased tasks come back when their lease runs out
+            logger.exception('Task worker could not reach the database')
+            connection.close()
+            claimed = 0
+        if not claimed:
+            if drain:
+                return
+            stop.wait(poll)
+
+
+def worker_thread(stop, **options):
+    try:
+        work(stop, **options)
+    finally:
+        connection.close()  # Each worker thread has its own connection
+
+
+def start_workers(count, stop, **options):
+    threads = [
+        threading.Thread(target=worker_thread, args=(stop,), kwargs=options, name=f'hms-task-{i}', daemon=True)
+        for i in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
@@ -1,3 +1,1734 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import tempfile
+import threading
+from io import StringIO
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import update_last_login
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.db.models import Count
+from django.db import IntegrityError, OperationalError, connection, transaction
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIClient
+
+from api.models import (
+    User, Profile, Appointment, AppointmentSummary, AppointmentTombstone, WorkingHours, Task, AppointmentAudit,
+    Notification, UserImport,
+)
+from api import async_views, dashboard, events, exports, metrics, plans, scheduling, sync, tasks
+from api.cache import generation
+from api.imports import age_on
+from api.authentication import ClaimsUser, user_states
+from api.routers import PrimaryReplicaRouter, ReadYourWritesMiddleware, read_from_replica, recently_wrote
+from api.sqlite import WriteQueue, serialized_write
+from api.serializers import (AppointmentSerializer, AppointmentSummarySerializer, MyTokenObtainPairSerializer,
+                             UserSerializer, UserSummarySerializer)
+from api.scheduling import IntervalIndex
+from api.services import create_user, update_profile
+
+
+def make_user(username, role, password=None, **profile_fields):
+    # No password by default: hashing one costs ~0.5s and most tests use force_authenticate
+    return create_user(username, f'{username}@example.com', password, role=role, **profile_fields)
+
+
+def make_appointments(doctor, patient, count, start=None):
+    start = start or timezone.now() + timedelta(days=1)
+    return Appointment.objects.bulk_create([
+        Appointment(doctor=doctor, patient=patient, appointment_date=start + timedelta(hours=i), status='pending')
+        for i in range(count)
+    ])
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        # Cached reads (api/cache.py) and auth states would otherwise leak between tests
+        cache.clear()
+        user_states.clear()
+
+
+class QueryCountTests(APITestCase):
+    """The read endpoints must issue a constant number of queries regardless of result size."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN)
+        self.doctor = make_user('doc', User.DOCTOR, first_name='Greg', specialization='Cardiology')
+        self.patient = make_user('pat', User.PATIENT, first_name='Ann', medical_history='None')
+        self.client = APIClient()
+
+    def get_query_count(self, url, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_appointment_list_query_count_is_constant(self):
+        url = reverse('appointment_list')
+        make_appointments(self.doctor, self.patient, 2)
+        small, _ = self.get_query_count(url, self.admin)
+
+        other_doctor = make_user('doc2', User.DOCTOR)
+        other_patient = make_user('pat2', User.PATIENT)
+        make_appointments(other_doctor, other_patient, 20, start=timezone.now() + timedelta(days=5))
+        large, response = self.get_query_count(url, self.admin)
+
+        self.assertEqual(small, large)
+        self.assertEqual(large, 1)
+        self.assertEqual(len(response.data['results']), 22)
+
+    def test_appointment_rows_include_role_specific_profile_fields(self):
+        make_appointments(self.doctor, self.patient, 1)
+        # Compact rows carry names only; the full nested users are one ?expand= away (api/fieldsets.py)
+        url = reverse('appointment_list') + '?expand=doctor_detail,patient_detail'
+        count, response = self.get_query_count(url, self.patient)
+        self.assertEqual(count, 1)
+        row = response.data['results'][0]
+        self.assertEqual(row['doctor_detail']['profile']['specialization'], 'Cardiology')
+        self.assertEqual(row['patient_detail']['profile']['medical_history'], 'None')
+
+    def test_appointment_detail_is_single_query(self):
+        appointment = make_appointments(self.doctor, self.patient, 1)[0]
+        count, _ = self.get_query_count(reverse('appointment_detail', args=[appointment.pk]), self.doctor)
+        self.assertEqual(count, 1)
+
+    def test_user_lists_query_count_is_constant(self):
+        small_doctors, _ = self.get_query_count(reverse('doctor_list'), self.patient)
+        small_patients, _ = self.get_query_count(reverse('patient_list'), self.doctor)
+        with self.captureOnCommitCallbacks(execute=True):  # The doctor directory is invalidated on commit
+            for i in range(10):
+                make_user(f'doc-extra-{i}', User.DOCTOR)
+                make_user(f'pat-extra-{i}', User.PATIENT)
+        large_doctors, _ = self.get_query_count(reverse('doctor_list'), self.patient)
+        large_patients, _ = self.get_query_count(reverse('patient_list'), self.doctor)
+        self.assertEqual(small_doctors, large_doctors)
+        self.assertEqual(small_patients, large_patients)
+
+    def test_user_detail_is_single_query(self):
+        count, _ = self.get_query_count(reverse('doctor_detail', args=[self.doctor.pk]), self.admin)
+        self.assertEqual(count, 1)
+        count, _ = self.get_query_count(reverse('patient_detail', args=[self.patient.pk]), self.admin)
+        self.assertEqual(count, 1)
+
+
+class FieldsetTests(APITestCase):
+    """Compact list rows, ?fields= and ?expand= (api/fieldsets.py)."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN)
+        self.doctor = make_user('doc', User.DOCTOR, first_name='Greg', specialization='Cardiology')
+        self.patient = make_user('pat', User.PATIENT, first_name='Ann', address='1 Long Road', medical_history='x' * 500)
+        make_appointments(self.doctor, self.patient, 2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, ' '.join(query['sql'] for query in ctx.captured_queries)
+
+    def test_list_rows_are_compact_and_skip_unused_columns(self):
+        response, sql = self.get(reverse('appointment_list'))
+        row = response.data['results'][0]
+        self.assertEqual(row['patient_detail']['profile'], {'first_name': 'Ann', 'last_name': None, 'specialization': None})
+        self.assertEqual(row['doctor_detail']['profile']['specialization'], 'Cardiology')
+        for column in ('medical_history', 'address', 'password', 'created_at'):
+            self.assertNotIn(column, sql)
+
+        response, sql = self.get(reverse('patient_list'))
+        self.assertEqual(set(response.data['results'][0]['profile']), {'first_name', 'last_name', 'specialization'})
+        self.assertNotIn('medical_history', sql)
+
+    def test_fields_drop_unused_joins(self):
+        response, sql = self.get(reverse('appointment_list') + '?fields=id,status')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'status'})
+        self.assertNotIn('JOIN', sql)
+        self.assertEqual(sql.count('SELECT'), 1)  # The paging keys are read with the rest, not row by row
+
+    def test_expand_returns_the_full_nested_representation(self):
+        response, _ = self.get(reverse('doctor_list') + '?expand=profile')
+        self.assertEqual(response.data['results'][0]['profile']['specialization'], 'Cardiology')
+        self.assertIn('license_number', response.data['results'][0]['profile'])
+        response, _ = self.get(reverse('appointment_list') + '?fields=id,patient_detail&expand=patient_detail')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'patient_detail'})
+        self.assertEqual(response.data['results'][0]['patient_detail']['profile']['address'], '1 Long Road')
+
+    def test_unknown_names_are_rejected(self):
+        response, _ = self.get(reverse('appointment_list') + '?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.data)
+        response, _ = self.get(reverse('patient_list') + '?expand=email')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expand', response.data)
+
+
+class PlanTests(APITestCase):
+    """Precompiled list serialization (api/plans.py) renders what the serializers render."""
+
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_user('doc', User.DOCTOR, first_name='Greg', specialization='Cardiology',
+                                consultation_fees=Decimal('150.5'), date_of_birth=date(1970, 5, 1))
+        self.unpriced = make_user('doc2', User.DOCTOR)  # ProfileSerializer renders its fees as 'None'
+        self.patient = make_user('pat', User.PATIENT, first_name='Ann', medical_history='Asthma')
+        make_appointments(self.doctor, self.patient, 2)
+        make_appointments(self.unpriced, self.patient, 1, start=timezone.now() + timedelta(days=3))
+
+    def assertSameJSON(self, serializer_class, queryset, *always):
+        plan = plans.plan(serializer_class, *always)
+        expected = JSONRenderer().render(serializer_class(queryset.order_by('id'), many=True).data)
+        self.assertEqual(JSONRenderer().render(plan.serialize(plan.queryset(queryset).order_by('id'))), expected)
+
+    def test_rows_match_the_serializers_byte_for_byte(self):
+        appointments = AppointmentSerializer.setup_eager_loading(Appointment.objects.all())
+        users = UserSerializer.setup_eager_loading(User.objects.all())
+        for serializer_class in (AppointmentSerializer, AppointmentSummarySerializer):
+            self.assertSameJSON(serializer_class, appointments, 'appointment_date', 'id')
+        for serializer_class in (UserSerializer, UserSummarySerializer):
+            self.assertSameJSON(serializer_class, users, 'id')
+
+    def test_datetimes_follow_the_current_time_zone(self):
+        with timezone.override('Asia/Kolkata'):
+            self.assertSameJSON(AppointmentSummarySerializer, Appointment.objects.all())
+
+
+class PermissionTests(APITestCase):
+    """Object access is decided by the query that loads the object (api/permissions.py)."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN)
+        self.doctor = make_user('doc', User.DOCTOR)
+        self.other_doctor = make_user('doc2', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT)
+        self.other_patient = make_user('pat2', User.PATIENT)
+        self.appointment = make_appointments(self.doctor, self.patient, 1)[0]
+        self.client = APIClient()
+
+    def request(self, user, method, url, data=None):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json')
+        return response.status_code, len(ctx.captured_queries)
+
+    def test_appointment_detail_for_every_role(self):
+        url = reverse('appointment_detail', args=[self.appointment.pk])
+        expected = {self.admin: 200, self.doctor: 200, self.patient: 200, self.other_doctor: 404, self.other_patient: 404}
+        for user, status_code in expected.items():
+            self.assertEqual(self.request(user, 'get', url), (status_code, 1), user.username)
+
+    def test_profile_by_id_for_every_role(self):
+        def url(user):
+            return reverse('profile_detail', args=[user.profile.pk])
+        # Admins reach any profile; doctors all but admins'; patients their own and doctors'
+        self.assertEqual(self.request(self.admin, 'get', url(self.patient)), (200, 1))
+        self.assertEqual(self.request(self.doctor, 'get', url(self.patient)), (200, 1))
+        self.assertEqual(self.request(self.doctor, 'get', url(self.admin)), (404, 1))
+        self.assertEqual(self.request(self.patient, 'get', url(self.doctor)), (200, 1))
+        self.assertEqual(self.request(self.patient, 'get', url(self.other_patient)), (404, 1))
+        # Only admins change other users' profiles
+        data = {'user': self.patient.pk, 'first_name': 'Ann'}
+        self.assertEqual(self.request(self.doctor, 'put', url(self.patient), data), (403, 1))
+        self.assertEqual(self.request(self.admin, 'put', url(self.patient), data)[0], 200)
+        self.patient.profile.refresh_from_db()
+        self.assertEqual(self.patient.profile.first_name, 'Ann')
+        self.assertEqual(self.request(self.patient, 'put', url(self.patient), {**data, 'first_name': 'Anna'})[0], 200)
+
+    def test_patient_and_doctor_details_for_every_role(self):
+        patient, doctor = reverse('patient_detail', args=[self.patient.pk]), reverse('doctor_detail', args=[self.doctor.pk])
+        self.assertEqual(self.request(self.doctor, 'get', patient), (200, 1))
+        self.assertEqual(self.request(self.patient, 'get', patient), (200, 1))
+        self.assertEqual(self.request(self.other_patient, 'get', patient), (404, 1))
+        self.assertEqual(self.request(self.patient, 'get', doctor), (200, 1))
+        self.assertEqual(self.request(self.doctor, 'delete', patient), (403, 1))
+        self.assertEqual(self.request(self.patient, 'put', doctor, {'email': 'x@example.com'}), (403, 1))
+        self.assertEqual(self.request(self.other_doctor, 'delete', doctor), (403, 1))
+        self.assertEqual(self.request(self.admin, 'delete', patient)[0], 204)
+        self.assertFalse(User.objects.filter(pk=self.patient.pk).exists())
+
+
+class PaginationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN)
+        self.doctor = make_user('doc', User.DOCTOR)
+        self.other_doctor = make_user('doc2', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT)
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        make_appointments(self.doctor, self.patient, 7, start=self.start)
+        # Two rows sharing one timestamp exercise the id tie-breaker
+        make_appointments(self.other_doctor, self.patient, 1, start=self.start + timedelta(hours=3))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def walk(self, url, **params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            pages += 1
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_walks_all_pages_in_date_then_id_order(self):
+        ids, pages = self.walk(reverse('appointment_list'), page_size=3)
+        expected = list(Appointment.objects.order_by('appointment_date', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_previous_link_returns_the_preceding_page(self):
+        url = reverse('appointment_list')
+        first = self.client.get(url, {'page_size': 3})
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_page_size_is_capped(self):
+        make_appointments(self.doctor, self.patient, 250, start=self.start + timedelta(days=30))
+        response = self.client.get(reverse('appointment_list'), {'page_size': 10000})
+        self.assertEqual(len(response.data['results']), 200)
+
+    def test_deep_page_is_single_query(self):
+        url = reverse('appointment_list')
+        first = self.client.get(url, {'page_size': 2})
+        deep = self.client.get(first.data['next'])
+        deep = self.client.get(deep.data['next'])
+        with self.assertNumQueries(1):
+            self.client.get(deep.data['next'])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('appointment_list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_filters(self):
+        url = reverse('appointment_list')
+        Appointment.objects.filter(pk=Appointment.objects.filter(doctor=self.doctor).earliest('id').pk).update(
+            status='confirmed'
+        )
+
+        ids, _ = self.walk(url, doctor=self.other_doctor.pk)
+        self.assertEqual(len(ids), 1)
+        ids, _ = self.walk(url, status='confirmed')
+        self.assertEqual(len(ids), 1)
+        ids, _ = self.walk(url, status='confirmed,pending', patient=self.patient.pk)
+        self.assertEqual(len(ids), 8)
+        ids, _ = self.walk(url, date_from=(self.start + timedelta(hours=5)).isoformat())
+        self.assertEqual(len(ids), 2)
+        ids, _ = self.walk(url, date_to=(self.start + timedelta(hours=1)).isoformat())
+        self.assertEqual(len(ids), 2)
+
+        self.assertEqual(self.client.get(url, {'status': 'bogus'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'doctor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'date_from': 'tomorrow'}).status_code, 400)
+
+    def test_filters_cannot_widen_role_scope(self):
+        self.client.force_authenticate(self.other_doctor)
+        ids, _ = self.walk(reverse('appointment_list'), doctor=self.doctor.pk)
+        self.assertEqual(ids, [])
+
+    def test_user_lists_are_paginated(self):
+        for i in range(4):
+            make_user(f'doc-extra-{i}', User.DOCTOR)
+        ids, pages = self.walk(reverse('doctor_list'), page_size=2)
+        self.assertEqual(ids, list(User.objects.filter(role=User.DOCTOR).order_by('id').values_list('id', flat=True)))
+        self.assertEqual(pages, 3)
+
+
+class SchedulingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_user('doc', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT)
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        # A Monday well in the future, inside the default 09:00-17:00 hours
+        today = timezone.localdate()
+        self.monday = today + timedelta(days=7 - today.weekday() + 7)
+        self.ten = timezone.make_aware(datetime.combine(self.monday, time(10, 0)))
+
+    def book(self, when):
+        return self.client.post(reverse('appointment_create'), {
+            'doctor': self.doctor.pk, 'appointment_date': when.isoformat(), 'status': 'pending',
+        })
+
+    def test_overlapping_booking_is_rejected(self):
+        self.assertEqual(self.book(self.ten).status_code, 201)
+        self.assertEqual(self.book(self.ten).status_code, 409)
+        self.assertEqual(self.book(self.ten + timedelta(minutes=5)).status_code, 409)
+        self.assertEqual(self.book(self.ten - timedelta(minutes=29)).status_code, 409)
+        self.assertEqual(self.book(self.ten + timedelta(minutes=30)).status_code, 201)
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_missing_doctor_is_rejected(self):
+        response = self.client.post(reverse('appointment_create'), {'appointment_date': self.ten.isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Appointment.objects.count(), 0)
+
+    def test_constraint_race_is_reported_as_conflict(self):
+        # Simulate a concurrent request committing between our check and our insert
+        make_appointments(self.doctor, self.patient, 1, start=self.ten)
+        with mock.patch('api.scheduling.find_conflict', return_value=None):
+            response = self.book(self.ten)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_transient_lock_errors_are_retried(self):
+        real_find_conflict = scheduling.find_conflict
+        calls = []
+
+        def flaky(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return real_find_conflict(*args, **kwargs)
+
+        with mock.patch('api.scheduling.find_conflict', side_effect=flaky):
+            self.assertEqual(self.book(self.ten).status_code, 201)
+        self.assertEqual(len(calls), 2)
+
+    def test_unique_constraint_ignores_canceled_rows(self):
+        make_appointments(self.doctor, self.patient, 1, start=self.ten)
+        Appointment.objects.update(status='canceled')
+        make_appointments(self.doctor, self.patient, 1, start=self.ten)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_appointments(self.doctor, self.patient, 1, start=self.ten)
+
+    def test_only_a_taken_slot_is_a_conflict(self):
+        make_appointments(self.doctor, self.patient, 1, start=self.ten)
+        with self.assertRaises(scheduling.BookingConflict):  # A race past find_conflict lands on the constraint
+            scheduling.locked_write([self.doctor.pk], lambda: make_appointments(self.doctor, self.patient, 1, start=self.ten))
+        with self.assertRaises(IntegrityError):
+            scheduling.locked_write([self.doctor.pk], lambda: Appointment.objects.create(
+                doctor=self.doctor, patient=self.patient, appointment_date=None))
+
+    def test_canceled_booking_frees_the_slot(self):
+        make_appointments(self.doctor, self.patient, 1, start=self.ten)
+        Appointment.objects.update(status='canceled')
+        self.assertEqual(self.book(self.ten).status_code, 201)
+
+    def test_slot_duration_comes_from_the_doctor_profile(self):
+        self.doctor.profile.slot_duration = 60
+        self.doctor.profile.save()
+        self.assertEqual(self.book(self.ten).status_code, 201)
+        self.assertEqual(self.book(self.ten + timedelta(minutes=45)).status_code, 409)
+
+    def test_moving_an_appointment_onto_a_booked_slot_is_rejected(self):
+        make_appointments(self.doctor, self.patient, 2, start=self.ten)
+        later = Appointment.objects.order_by('appointment_date').last()
+        url = reverse('appointment_detail', args=[later.pk])
+        response = self.client.patch(url, {'appointment_date': (self.ten + timedelta(minutes=10)).isoformat()})
+        self.assertEqual(response.status_code, 409)
+        response = self.client.patch(url, {'appointment_date': (self.ten + timedelta(hours=3)).isoformat()})
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_availability_uses_default_hours_and_skips_bookings(self):
+        make_appointments(self.doctor, self.patient, 1, start=self.ten)
+        response = self.client.get(reverse('doctor_availability', args=[self.doctor.pk]), {
+            'from': self.monday.isoformat(), 'to': (self.monday + timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        starts = [slot['start'] for slot in response.data['slots']]
+        self.assertEqual(len(starts), 15)  # 16 half-hour slots from 09:00 to 17:00, one booked
+        self.assertNotIn(self.ten, starts)
+        self.assertEqual(starts[0], timezone.make_aware(datetime.combine(self.monday, time(9, 0))))
+
+    def test_availability_uses_working_hours(self):
+        WorkingHours.objects.create(doctor=self.doctor, weekday=0, start_time=time(8, 0), end_time=time(9, 0))
+        WorkingHours.objects.create(doctor=self.doctor, weekday=0, start_time=time(13, 0), end_time=time(14, 0))
+        self.doctor.profile.slot_duration = 20
+        self.doctor.profile.save()
+        response = self.client.get(reverse('doctor_availability', args=[self.doctor.pk]), {
+            'from': self.monday.isoformat(), 'to': (self.monday + timedelta(days=7)).isoformat(),
+        })
+        self.assertEqual(response.data['slot_minutes'], 20)
+        self.assertEqual(len(response.data['slots']), 6)
+
+    def test_availability_validates_window(self):
+        url = reverse('doctor_availability', args=[self.doctor.pk])
+        self.assertEqual(self.client.get(url, {'from': '2030-01-02', 'to': '2030-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': '2030-01-01', 'to': '2030-06-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('doctor_availability', args=[self.patient.pk])).status_code, 404)
+
+    def test_interval_index(self):
+        base = self.ten
+        index = IntervalIndex([
+            (base, base + timedelta(minutes=30)),
+            (base + timedelta(hours=2), base + timedelta(hours=3)),
+        ])
+        self.assertTrue(index.overlaps(base + timedelta(minutes=29), base + timedelta(minutes=40)))
+        self.assertFalse(index.overlaps(base + timedelta(minutes=30), base + timedelta(hours=2)))
+        self.assertTrue(index.overlaps(base + timedelta(hours=2, minutes=50), base + timedelta(hours=4)))
+        self.assertFalse(IntervalIndex().overlaps(base, base + timedelta(minutes=1)))
+
+
+class BulkAppointmentTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN)
+        self.doctor = make_user('doc', User.DOCTOR)
+        self.other_doctor = make_user('doc2', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT)
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('appointment_bulk')
+
+    def row(self, minutes, doctor=None, **extra):
+        return {
+            'doctor': (doctor or self.doctor).pk, 'patient': self.patient.pk,
+            'appointment_date': (self.start + timedelta(minutes=minutes)).isoformat(), 'status': 'pending', **extra,
+        }
+
+    def test_creates_with_per_row_results(self):
+        response = self.client.post(self.url, {'create': [
+            self.row(0),
+            self.row(10),                        # Overlaps the row above
+            self.row(60),
+            {'doctor': self.doctor.pk},          # Missing appointment_date
+            self.row(0, doctor=self.other_doctor),
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        statuses = [row['status'] for row in response.data['create']]
+        self.assertEqual(statuses, [201, 409, 201, 400, 201])
+        self.assertEqual(Appointment.objects.count(), 3)
+        self.assertIn('appointment_date', response.data['create'][3]['errors'])
+
+    def test_conflicts_with_existing_bookings_use_one_query(self):
+        make_appointments(self.doctor, self.patient, 5, start=self.start)
+        rows = [self.row(60 * i + 15) for i in range(5)] + [self.row(60 * i + 30) for i in range(5, 25)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, {'create': rows}, format='json')
+        statuses = [row['status'] for row in response.data['create']]
+        self.assertEqual(statuses, [409] * 5 + [201] * 20)
+        appointment_queries = [q for q in ctx.captured_queries
+                               if q['sql'].startswith('SELECT') and 'FROM "api_appointment"' in q['sql']]
+        self.assertEqual(len(appointment_queries), 1)
+        # Related users are resolved with one query per field, not one per row, plus the doctor lock
+        user_queries = [q for q in ctx.captured_queries if 'FROM "api_user"' in q['sql']]
+        self.assertEqual(len(user_queries), 3)
+
+    def test_update_and_cancel(self):
+        first, second = make_appointments(self.doctor, self.patient, 2, start=self.start)
+        response = self.client.post(self.url, {
+            'cancel': [first.pk, 999999],
+            'update': [
+                {'id': second.pk, 'appointment_date': first.appointment_date.isoformat()},  # Takes the freed slot
+                {'id': 424242, 'status': 'confirmed'},
+            ],
+        }, format='json')
+        self.assertEqual([r['status'] for r in response.data['cancel']], [200, 404])
+        self.assertEqual([r['status'] for r in response.data['update']], [200, 404])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, 'canceled')
+        self.assertEqual(second.appointment_date, first.appointment_date)
+        self.assertGreater(second.updated_at, second.created_at)
+
+    def test_doctors_only_touch_their_own_diary(self):
+        theirs = make_appointments(self.other_doctor, self.patient, 1, start=self.start)[0]
+        self.client.force_authenticate(self.doctor)
+        response = self.client.post(self.url, {
+            'cancel': [theirs.pk],
+            'create': [self.row(0, doctor=self.other_doctor)],
+        }, format='json')
+        self.assertEqual(response.data['cancel'][0]['status'], 404)
+        self.assertEqual(response.data['create'][0]['status'], 201)
+        self.assertEqual(Appointment.objects.get(pk=response.data['create'][0]['id']).doctor, self.doctor)
+
+    def test_patients_and_oversized_batches_are_rejected(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.post(self.url, {'create': []}, format='json').status_code, 403)
+        self.client.force_authenticate(self.admin)
+        with self.settings(HMS_BULK_MAX_ITEMS=2):
+            response = self.client.post(self.url, {'cancel': [1, 2, 3]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CachedReadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_user('doc', User.DOCTOR, first_name='Greg')
+        self.patient = make_user('pat', User.PATIENT, first_name='Ann')
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def test_doctor_list_is_served_from_cache_with_etag(self):
+        url = reverse('doctor_list')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+    def test_doctor_profile_change_invalidates_list_and_detail(self):
+        list_url, detail_url = reverse('doctor_list'), reverse('doctor_detail', args=[self.doctor.pk])
+        etag = self.client.get(list_url)['ETag']
+        self.client.get(detail_url)
+
+        profile = self.doctor.profile
+        profile.first_name = 'Gregory'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+
+        response = self.client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['profile']['first_name'], 'Gregory')
+        self.assertEqual(self.client.get(detail_url).data['profile']['first_name'], 'Gregory')
+
+    def test_new_doctor_invalidates_list_but_new_patient_does_not(self):
+        url = reverse('doctor_list')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_user('pat2', User.PATIENT)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_user('doc2', User.DOCTOR)
+        self.assertEqual(len(self.client.get(url).data['results']), 2)
+
+    def test_missing_doctor_is_404(self):
+        response = self.client.get(reverse('doctor_detail', args=[self.patient.pk]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['detail'], 'Doctor not found.')
+
+    def test_own_profile_is_cached_until_updated(self):
+        url = reverse('profile')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data['first_name'], 'Ann')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(url, {'user': self.patient.pk, 'first_name': 'Anna'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url).data['first_name'], 'Anna')
+
+    def test_a_culled_generation_does_not_restart(self):
+        url = reverse('doctor_list')
+        stale = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            make_user('doc2', User.DOCTOR)
+        cache.delete('hms:gen:doctors')  # As a culling backend may, leaving the entries behind
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=stale)
+        self.assertEqual((response.status_code, len(response.data['results'])), (200, 2))
+
+    def test_invalidation_waits_for_the_commit(self):
+        before = generation('doctors')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.profile.save()
+            # A read rebuilt now still sees the old rows; it must not cache them under a new generation
+            self.assertEqual(generation('doctors'), before)
+        self.assertGreater(generation('doctors'), before)
+
+
+class AccountWriteTests(APITestCase):
+    def writes(self, queries):
+        return [query['sql'] for query in queries if not query['sql'].startswith('SELECT')]
+
+    def test_registration_inserts_user_and_profile_once(self):
+        data = {'username': 'new', 'email': 'new@example.com', 'password': 'pw-123456', 'password2': 'pw-123456', 'role': 'patient'}
+        with mock.patch('django.contrib.auth.hashers.PBKDF2PasswordHasher.iterations', 1):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse('register'), data)
+        self.assertEqual(response.status_code, 201)
+        writes = self.writes(queries)
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(writes[0].startswith('INSERT INTO "api_user"'))
+        self.assertTrue(writes[1].startswith('INSERT INTO "api_profile"'))
+        user = User.objects.get(username='new')
+        self.assertTrue(user.check_password('pw-123456'))
+        self.assertEqual(user.role, User.PATIENT)
+
+    def test_create_user_fills_profile_in_the_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            user = create_user('doc', 'doc@example.com', None, role=User.DOCTOR, slot_duration=20, date_of_birth=date(1980, 1, 1))
+        self.assertEqual(len(self.writes(queries)), 2)
+        user.profile.refresh_from_db()
+        self.assertEqual(user.profile.slot_duration, 20)
+        self.assertIsNotNone(user.profile.age)
+
+    def test_user_save_leaves_profile_alone(self):
+        user = make_user('pat', User.PATIENT)
+        with self.assertNumQueries(1):
+            update_last_login(None, user)
+
+    def test_profile_update_writes_only_changed_fields(self):
+        user = make_user('pat', User.PATIENT, first_name='Ann', last_name='Lee')
+        profile = user.profile
+        with self.assertNumQueries(0):
+            update_profile(profile, {'first_name': 'Ann'})
+        with CaptureQueriesContext(connection) as queries:
+            update_profile(profile, {'first_name': 'Anna', 'last_name': 'Lee'})
+        [update] = self.writes(queries)
+        self.assertIn('"first_name"', update)
+        self.assertNotIn('"last_name"', update)
+
+        with CaptureQueriesContext(connection) as queries:
+            update_profile(profile, {'date_of_birth': date(1990, 6, 1)})
+        [update] = self.writes(queries)
+        self.assertIn('"age"', update)
+        saved_age = Profile.objects.values_list('age', flat=True).get(pk=profile.pk)
+        self.assertEqual(saved_age, profile.age)
+        self.assertIsNotNone(saved_age)
+
+    def test_unchanged_profile_put_skips_the_update(self):
+        user = make_user('pat', User.PATIENT, first_name='Ann')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(reverse('profile'), {'user': user.pk, 'first_name': 'Ann'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.writes(queries), [])
+
+
+@override_settings(HMS_STATELESS_AUTH=True)
+class StatelessAuthTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_user('doc', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT)
+        make_appointments(self.doctor, self.patient, 3)
+        self.client = self.client_for(self.doctor)
+
+    def client_for(self, user):
+        client = APIClient()
+        token = MyTokenObtainPairSerializer.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_list_skips_the_user_query_once_the_state_is_cached(self):
+        url = reverse('appointment_list')
+        with self.assertNumQueries(2):  # Auth state, then the page
+            self.assertEqual(len(self.client.get(url).data['results']), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get(url).data['results']), 3)
+        with override_settings(HMS_STATELESS_AUTH=False), self.assertNumQueries(2):
+            self.client.get(url)
+
+    def test_patient_sees_only_own_appointments(self):
+        other = make_user('pat2', User.PATIENT)
+        response = self.client_for(other).get(reverse('appointment_list'))
+        self.assertEqual(response.data['results'], [])
+
+    def test_deactivated_user_is_rejected_immediately(self):
+        url = reverse('appointment_list')
+        self.client.get(url)
+        self.doctor.is_active = False
+        self.doctor.save()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_role_change_falls_back_to_the_database(self):
+        client = self.client_for(self.patient)
+        User.objects.filter(pk=self.patient.pk).update(role=User.DOCTOR)
+        user_states.discard(self.patient.pk)  # update() bypasses signals
+        response = client.get(reverse('appointment_list'))
+        self.assertEqual(len(response.data['results']), 0)  # Served as a doctor with no appointments
+
+    def test_claims_user_loads_the_row_only_when_needed(self):
+        token = MyTokenObtainPairSerializer.get_token(self.doctor).access_token
+        user = ClaimsUser(token)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.pk, user.role), (self.doctor.pk, User.DOCTOR))
+        with self.assertNumQueries(1):  # Compact tokens carry no username
+            self.assertEqual(user.username, 'doc')
+            self.assertEqual(user.profile.pk, self.doctor.profile.pk)
+            self.assertIsNotNone(user.date_joined)
+
+
+class CompactTokenTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = make_user('pat', User.PATIENT, first_name='Ann', medical_history='x' * 2000)
+
+    def claims(self):
+        return MyTokenObtainPairSerializer.get_token(self.patient).access_token.payload
+
+    def test_compact_token_carries_only_bounded_claims(self):
+        claims = self.claims()
+        self.assertEqual(
+            set(claims) - {'token_type', 'exp', 'iat', 'jti'},
+            {'user_id', 'role', 'username', 'email', 'profile_version'},  # The frontend shows username and email
+        )
+        self.assertEqual(claims['username'], 'pat')
+        self.assertEqual(claims['role'], User.PATIENT)
+        self.assertEqual(claims['profile_version'], self.patient.profile.version)
+
+    @override_settings(HMS_COMPACT_TOKENS=False)
+    def test_full_token_mode_keeps_the_profile_claims(self):
+        claims = self.claims()
+        self.assertEqual(claims['first_name'], 'Ann')
+        self.assertEqual(len(claims['medical_history']), 2000)
+
+    def test_profile_version_moves_on_every_change(self):
+        profile = self.patient.profile
+        version = profile.version
+        update_profile(profile, {'first_name': 'Anna'})
+        update_profile(profile, {'first_name': 'Anna'})  # No change, no new version
+        profile.refresh_from_db()
+        self.assertEqual(profile.version, version + 1)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        response = self.client.put(reverse('profile'), {'user': self.patient.pk, 'first_name': 'Ann', 'version': 1})
+        self.assertEqual(response.data['version'], version + 2)
+
+    def test_concurrent_profile_saves_each_move_the_version(self):
+        first, second = Profile.objects.get(user=self.patient), Profile.objects.get(user=self.patient)
+        version = first.version
+        update_profile(first, {'first_name': 'Anna'})
+        update_profile(second, {'last_name': 'Smith'})  # Loaded before the first save
+        self.assertEqual((first.version, second.version), (version + 1, version + 2))
+
+
+@override_settings(HMS_READ_REPLICA='default')  # Any existing alias stands in for the replica
+class ReplicaRoutingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_user('doc', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT)
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def replica_flags(self, request):
+        # Whether each read of `request` was routed while replica reads were on
+        seen = []
+        def spy(router, model, **hints):
+            seen.append(read_from_replica.get())
+            return 'default'
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', autospec=True, side_effect=spy):
+            response = request()
+        self.assertLess(response.status_code, 400)
+        return seen
+
+    def test_router_sends_only_flagged_reads_to_the_replica(self):
+        router = PrimaryReplicaRouter()
+        with override_settings(HMS_READ_REPLICA='replica'):
+            self.assertEqual(router.db_for_read(Appointment), 'default')
+            token = read_from_replica.set(True)
+            self.assertEqual(router.db_for_read(Appointment), 'replica')
+            self.assertEqual(router.db_for_write(Appointment), 'default')
+            read_from_replica.reset(token)
+        self.assertFalse(router.allow_migrate('replica', 'api'))
+
+    @override_settings(
+        CACHES={**settings.CACHES, 'db': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'hms_cache'}},
+        HMS_CACHE_ALIAS='db', HMS_READ_REPLICA='replica',
+    )
+    def test_database_cache_stays_on_the_primary_and_pins_nobody(self):
+        call_command('createcachetable', 'hms_cache')
+        cache_model = caches['db'].cache_model_class
+        token = read_from_replica.set(True)
+        try:
+            self.assertEqual(PrimaryReplicaRouter().db_for_read(cache_model), 'default')
+            self.assertEqual(PrimaryReplicaRouter().db_for_read(Appointment), 'replica')
+        finally:
+            read_from_replica.reset(token)
+        self.assertTrue(self.replica_flags(lambda: self.client.get(reverse('doctor_list'))))
+        self.assertFalse(recently_wrote(self.patient))  # Filling the cache was no write of theirs
+
+    def test_list_views_read_from_the_replica(self):
+        for name in ('appointment_list', 'doctor_list'):
+            flags = self.replica_flags(lambda: self.client.get(reverse(name)))
+            self.assertTrue(flags and all(flags), name)
+        self.assertFalse(read_from_replica.get())
+
+    def test_reads_stay_on_primary_right_after_a_booking(self):
+        when = timezone.now() + timedelta(days=7)
+        flags = self.replica_flags(lambda: self.client.post(reverse('appointment_create'), {
+            'doctor': self.doctor.pk, 'appointment_date': when.isoformat(), 'status': 'pending',
+        }))
+        self.assertFalse(any(flags))
+
+        flags = self.replica_flags(lambda: self.client.get(reverse('appointment_list')))
+        self.assertTrue(flags)
+        self.assertFalse(any(flags))
+
+        other = APIClient()
+        other.force_authenticate(self.doctor)  # Only the writer is pinned
+        self.assertTrue(all(self.replica_flags(lambda: other.get(reverse('appointment_list')))))
+
+
+class WriteQueueTests(APITestCase):
+    def test_writes_run_one_at_a_time_on_one_thread(self):
+        queue = WriteQueue()
+        threads = {queue.run(lambda: threading.current_thread().name) for _ in range(5)}
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads.pop().startswith('hms-writer'))
+
+        # Concurrent first writes still share the one writer
+        barrier = threading.Barrier(4)
+        names = []
+        def first_write(queue):
+            barrier.wait()
+            names.append(queue.run(lambda: threading.current_thread().name))
+        queue = WriteQueue()
+        callers = [threading.Thread(target=first_write, args=(queue,)) for _ in range(4)]
+        for thread in callers:
+            thread.start()
+        for thread in callers:
+            thread.join()
+        self.assertEqual(len(set(names)), 1)
+
+        def conflict():
+            raise scheduling.BookingConflict()
+        with self.assertRaises(scheduling.BookingConflict):  # Raised on the writer, re-raised here
+            queue.run(conflict)
+
+    def test_write_on_the_writer_thread_pins_the_request_to_the_primary(self):
+        patient = make_user('pat', User.PATIENT)
+        queue = WriteQueue()
+
+        def view(request):
+            queue.run(lambda: PrimaryReplicaRouter().db_for_write(Appointment))
+            return HttpResponse()
+        request = RequestFactory().post('/')
+        request.user = patient
+        ReadYourWritesMiddleware(view)(request)
+        self.assertTrue(recently_wrote(patient))
+
+    @override_settings(HMS_SQLITE_FAST=True)
+    def test_write_inside_a_transaction_runs_inline(self):
+        # TestCase wraps every test in a transaction, which cannot move to the writer thread
+        self.assertEqual(serialized_write(lambda: threading.current_thread().name), threading.current_thread().name)
+
+
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN)
+        self.doctor = make_user('doc', User.DOCTOR, first_name='Greg')
+        self.other_doctor = make_user('doc2', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT, first_name='Ann')
+        self.appointments = make_appointments(self.doctor, self.patient, 5)
+
+    def token(self, user):
+        return f'Bearer {MyTokenObtainPairSerializer.get_token(user).access_token}'
+
+    def assertSameResponse(self, view, name, user, args=(), query='', method='get', data=None, headers=None):
+        """Call the sync view through the client and the async one directly; both must answer alike."""
+        url = reverse(name, args=args) + query
+        headers = {'HTTP_AUTHORIZATION': self.token(user)} if user else {}
+        sync = getattr(APIClient(), method)(url, data, format='json', **headers)
+        request = getattr(RequestFactory(), method)(url, data, content_type='application/json', **headers)
+        kwargs = {'pk': args[0]} if args else {}
+        response = async_to_sync(view.as_view())(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()  # Writes come back from the sync DRF view unrendered
+        self.assertEqual(response.status_code, sync.status_code, url)
+        self.assertEqual(json.loads(response.content or 'null'), sync.json() if sync.content else None, url)
+        return response
+
+    def test_appointment_list_matches_the_sync_view(self):
+        for user in (self.admin, self.doctor, self.other_doctor, self.patient):
+            self.assertSameResponse(async_views.AppointmentListView, 'appointment_list', user)
+        first = self.assertSameResponse(async_views.AppointmentListView, 'appointment_list', self.doctor, query='?page_size=2&status=pending')
+        cursor = json.loads(first.content)['next'].split('?', 1)[1]
+        self.assertSameResponse(async_views.AppointmentListView, 'appointment_list', self.doctor, query=f'?{cursor}')
+        self.assertSameResponse(async_views.AppointmentListView, 'appointment_list', self.doctor, query='?status=bogus')
+
+    def test_appointment_detail_matches_the_sync_view(self):
+        pk = self.appointments[0].pk
+        for user in (self.admin, self.doctor, self.other_doctor, self.patient):
+            self.assertSameResponse(async_views.AppointmentDetailView, 'appointment_detail', user, args=[pk])
+        self.assertSameResponse(async_views.AppointmentDetailView, 'appointment_detail', self.admin, args=[pk + 100])
+
+    def test_directory_lists_and_profiles_match_the_sync_views(self):
+        for user in (self.admin, self.doctor, self.patient):
+            self.assertSameResponse(async_views.DoctorListView, 'doctor_list', user)
+            self.assertSameResponse(async_views.PatientListView, 'patient_list', user)
+            self.assertSameResponse(async_views.ProfileView, 'profile', user)
+            for other in (self.admin, self.doctor, self.patient):  # 200 or 404, per api/permissions.py
+                self.assertSameResponse(async_views.ProfileView, 'profile_detail', user, args=[other.profile.pk])
+        self.assertSameResponse(async_views.ProfileView, 'profile', None)
+
+    def test_missing_own_profile_is_a_404(self):
+        self.patient.profile.delete()
+        response = self.assertSameResponse(async_views.ProfileView, 'profile', self.patient)
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_reads_share_entries_and_etags(self):
+        etag = APIClient().get(reverse('profile'), HTTP_AUTHORIZATION=self.token(self.patient))['ETag']
+        request = RequestFactory().get(reverse('profile'), HTTP_AUTHORIZATION=self.token(self.patient), HTTP_IF_NONE_MATCH=etag)
+        with self.assertNumQueries(1):  # The user lookup; the profile comes from the cache
+            response = async_to_sync(async_views.ProfileView.as_view())(request)
+        self.assertEqual(response.status_code, 304)
+
+    def test_writes_go_through_the_sync_view(self):
+        self.assertSameResponse(
+            async_views.ProfileView, 'profile', self.patient, method='put', data={'user': self.patient.pk, 'first_name': 'Anna'},
+        )
+        self.patient.profile.refresh_from_db()
+        self.assertEqual(self.patient.profile.first_name, 'Anna')
+
+
+class TaskQueueTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_user('doc', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT)
+        self.client = APIClient()
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=3)
+
+    def drain(self):
+        # Runs the queue as run_tasks does, ignoring delays: reminders are due a day ahead
+        Task.objects.filter(status=Task.QUEUED).update(run_after=timezone.now())
+        while tasks.Worker().run_once():
+            pass
+
+    def test_booking_enqueues_its_side_effects_in_one_insert(self):
+        self.client.force_authenticate(self.patient)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('appointment_create'), {
+                'doctor': self.doctor.pk, 'appointment_date': self.start.isoformat(), 'status': 'pending',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'INSERT INTO "api_task"' in q['sql']]), 1)
+        self.assertEqual(sorted(Task.objects.values_list('name', flat=True)), ['audit', 'remind'])
+        remind = Task.objects.get(name='remind')
+        self.assertEqual(remind.run_after, self.start - timedelta(hours=24))
+        self.assertEqual(AppointmentAudit.objects.count(), 0)  # Nothing ran in the request
+
+        self.drain()
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(AppointmentAudit.objects.get().action, 'created')
+        self.assertEqual(Notification.objects.get().recipient, self.patient)
+
+    def test_status_change_notifies_both_parties(self):
+        appointment = make_appointments(self.doctor, self.patient, 1, start=self.start)[0]
+        self.client.force_authenticate(self.doctor)
+        response = self.client.patch(reverse('appointment_detail', args=[appointment.pk]), {'status': 'confirmed'})
+        self.assertEqual(response.status_code, 200)
+        self.drain()
+        self.assertEqual(AppointmentAudit.objects.get().action, 'status_changed')
+        notified = set(Notification.objects.filter(kind='status').values_list('recipient', flat=True))
+        self.assertEqual(notified, {self.doctor.pk, self.patient.pk})
+
+    def test_reminder_is_dropped_after_a_move_or_cancellation(self):
+        appointment = Appointment.objects.create(doctor=self.doctor, patient=self.patient, appointment_date=self.start, status='pending')
+        appointment.appointment_date += timedelta(hours=2)
+        appointment.save()
+        self.drain()
+        # Only the second reminder, for the new time, was sent
+        self.assertEqual(Notification.objects.filter(kind='reminder').count(), 1)
+        self.assertEqual(list(AppointmentAudit.objects.order_by('pk').values_list('action', flat=True)), ['created', 'rescheduled'])
+
+        appointment.status = 'canceled'
+        appointment.save()
+        tasks.enqueue('remind', {'appointment': appointment.pk, 'appointment_date': appointment.appointment_date.isoformat()})
+        self.drain()
+        self.assertEqual(Notification.objects.filter(kind='reminder').count(), 1)
+
+    def test_bulk_writes_enqueue_the_same_tasks(self):
+        admin = make_user('admin', User.ADMIN)
+        first = make_appointments(self.doctor, self.patient, 1, start=self.start)[0]
+        self.client.force_authenticate(admin)
+        self.client.post(reverse('appointment_bulk'), {
+            'cancel': [first.pk],
+            'create': [{'doctor': self.doctor.pk, 'patient': self.patient.pk,
+                        'appointment_date': (self.start + timedelta(hours=1)).isoformat(), 'status': 'pending'}],
+        }, format='json')
+        self.assertEqual(sorted(Task.objects.values_list('name', flat=True)), ['audit', 'audit', 'notify', 'remind'])
+
+    def test_failing_task_is_retried_with_backoff_then_marked_failed(self):
+        good = tasks.enqueue('flaky', {'fail': False})
+        bad = tasks.enqueue('flaky', {'fail': True})
+        batches = []
+
+        def flaky(batch):
+            batches.append([task.pk for task in batch])
+            if any(task.payload['fail'] for task in batch):
+                raise ValueError('boom')
+
+        with mock.patch.dict(tasks.handlers, {'flaky': flaky}), self.settings(HMS_TASK_MAX_ATTEMPTS=2):
+            self.assertEqual(tasks.Worker().run_once(), 2)
+            # The batch failed, then each task ran alone: the good one finished
+            self.assertEqual(batches, [[good.pk, bad.pk], [good.pk], [bad.pk]])
+            self.assertFalse(Task.objects.filter(pk=good.pk).exists())
+            bad.refresh_from_db()
+            self.assertEqual((bad.status, bad.attempts, bad.last_error), (Task.QUEUED, 1, 'ValueError: boom'))
+            self.assertGreater(bad.run_after, timezone.now() + timedelta(seconds=5))
+
+            self.assertEqual(tasks.Worker().run_once(), 0)  # Still backing off
+            Task.objects.update(run_after=timezone.now())
+            tasks.Worker().run_once()
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (Task.FAILED, 2))
+        self.assertEqual(tasks.Worker().run_once(), 0)
+
+    def test_expired_lease_is_redelivered_without_duplicate_effects(self):
+        appointment = make_appointments(self.doctor, self.patient, 1, start=self.start)[0]
+        audit = tasks.enqueue('audit', {
+            'appointment': appointment.pk, 'action': 'created', 'status': 'pending',
+            'appointment_date': self.start.isoformat(), 'changed_at': timezone.now().isoformat(),
+        })
+        tasks.Worker().claim()  # A worker that dies after claiming
+        self.assertEqual(tasks.Worker().run_once(), 0)
+        Task.objects.update(run_after=timezone.now())  # The lease runs out
+        tasks.record_audits([audit])  # The first worker had written its record before dying
+        self.assertEqual(tasks.Worker().run_once(), 1)
+        self.assertEqual(AppointmentAudit.objects.count(), 1)
+        self.assertFalse(Task.objects.exists())
+
+    def test_work_drains_due_tasks_and_returns(self):
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, appointment_date=self.start, status='pending')
+        Task.objects.update(run_after=timezone.now())
+        tasks.work(threading.Event(), batch_size=1, drain=True)
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(Notification.objects.count(), 1)
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN, first_name='Ada', last_name='Cardiff')
+        self.cardiologist = make_user('doc', User.DOCTOR, first_name='Gregory', last_name='House', specialization='Cardiology')
+        self.neurologist = make_user('doc2', User.DOCTOR, first_name='Stephen', last_name='Strange', specialization='Neurology')
+        self.patient = make_user('pat', User.PATIENT, first_name='Ann', last_name='Cardwell', medical_history='Chronic asthma')
+        self.other_patient = make_user('pat2', User.PATIENT, first_name='José', last_name='Núñez', medical_history='Cardiac arrhythmia')
+        self.client = APIClient()
+
+    def search(self, user, q, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['username'] for row in response.data['results']]
+
+    def test_prefix_matching_and_ranking(self):
+        # A name match outranks a specialization match, which outranks a history match
+        self.assertEqual(self.search(self.admin, 'card'), ['admin', 'pat', 'doc', 'pat2'])
+        self.assertEqual(self.search(self.admin, 'greg hou'), ['doc'])
+        self.assertEqual(self.search(self.admin, 'jose nunez'), ['pat2'])  # Accents folded both ways
+
+    def test_typos_are_tolerated(self):
+        self.assertEqual(self.search(self.patient, 'Cardiolgy'), ['doc'])
+        self.assertEqual(self.search(self.patient, 'nuerology'), ['doc2'])
+        self.assertEqual(self.search(self.patient, 'strnge'), ['doc2'])
+        self.assertEqual(self.search(self.patient, 'xyzzy'), [])
+
+    def test_results_follow_profile_visibility(self):
+        self.assertEqual(self.search(self.cardiologist, 'card'), ['pat', 'doc', 'pat2'])  # No admins
+        # Patients find doctors only, and never by another patient's history
+        self.assertEqual(self.search(self.patient, 'card'), ['doc'])
+        self.assertEqual(self.search(self.patient, 'asthma'), [])
+        self.assertEqual(self.search(self.cardiologist, 'asthma'), ['pat'])
+        self.assertEqual(self.search(self.admin, 'card', role=User.PATIENT), ['pat', 'pat2'])
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'card', 'role': User.PATIENT}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('search'), {'q': '  '}).status_code, 400)
+
+    def test_index_follows_profile_and_role_changes(self):
+        update_profile(self.neurologist.profile, {'specialization': 'Cardiology'})
+        self.assertCountEqual(self.search(self.patient, 'cardiology'), ['doc2', 'doc'])
+        self.assertEqual(self.search(self.patient, 'neurology'), [])
+        self.neurologist.role = User.ADMIN
+        self.neurologist.save()
+        self.assertEqual(self.search(self.patient, 'cardiology'), ['doc'])
+        self.cardiologist.delete()
+        self.assertEqual(self.search(self.patient, 'cardiology'), [])
+        # Bulk inserts skip signals but not the index triggers
+        Profile.objects.filter(user=self.patient).update(specialization='Cardiology')
+        self.assertEqual(self.search(self.admin, 'cardiology', role=User.PATIENT), ['pat'])
+
+    def test_pages_walk_the_ranking(self):
+        for i in range(5):
+            make_user(f'smith{i}', User.DOCTOR, last_name='Smith')
+        self.client.force_authenticate(self.patient)
+        first = self.client.get(reverse('search'), {'q': 'smith', 'page_size': 3}).data
+        second = self.client.get(first['next']).data
+        names = [row['username'] for row in first['results'] + second['results']]
+        self.assertEqual(sorted(names), [f'smith{i}' for i in range(5)])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(second['previous']).data['results'], first['results'])
+
+    def test_search_costs_a_constant_number_of_queries(self):
+        self.client.force_authenticate(self.patient)
+        with self.assertNumQueries(2):  # Ranked ids, users with their profiles
+            self.client.get(reverse('search'), {'q': 'house'})
+        with self.assertNumQueries(6):  # No match: three vocabulary ranges and a second, typo-tolerant search
+            self.client.get(reverse('search'), {'q': 'huose'})
+
+
+@override_settings(HMS_METRICS_SAMPLE_RATE=1, HMS_METRICS_TOKEN='scrape-me')
+class MetricsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.admin = make_user('admin', User.ADMIN)
+        self.doctor = make_user('doc', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT)
+        make_appointments(self.doctor, self.patient, 3)
+        self.client = APIClient()
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_sampled_responses_carry_server_timing(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('appointment_list'))
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'total', 'db', 'serialize'})
+        self.assertIn('desc="1 queries (0 duplicate)"', timing['db'])
+
+    def test_histograms_are_labelled_by_view(self):
+        self.client.force_authenticate(self.admin)
+        self.client.get(reverse('appointment_list'))
+        self.client.get(reverse('appointment_list'))
+        self.client.force_authenticate(None)
+        text = self.scrape()
+        labels = '{method="GET",view="appointment_list"}'
+        self.assertIn(f'hms_request_duration_seconds_count{labels} 2', text)
+        self.assertIn('hms_db_queries_bucket{method="GET",view="appointment_list",le="1"} 2', text)
+        self.assertIn(f'hms_serializer_duration_seconds_count{labels} 2', text)
+        self.assertIn('# TYPE hms_response_size_bytes histogram', text)
+
+    def test_list_plans_count_as_serializer_time(self):
+        stats = metrics.RequestStats()
+        token = metrics.request_stats.set(stats)
+        try:
+            with mock.patch('api.metrics.time.perf_counter', side_effect=[1.0, 1.25]):
+                self.assertEqual(plans.plan(AppointmentSummarySerializer).serialize([]), [])
+        finally:
+            metrics.request_stats.reset(token)
+        self.assertEqual(stats.serializer_seconds, 0.25)
+
+    def test_project_serializers_are_timed_and_drf_is_left_alone(self):
+        users = list(UserSerializer.setup_eager_loading(User.objects.all()))
+        stats = metrics.RequestStats()
+        token = metrics.request_stats.set(stats)
+        try:
+            with mock.patch('api.metrics.time.perf_counter', side_effect=[1.0, 1.5]):
+                # One measurement: the nested profiles are part of the list's
+                self.assertEqual(len(UserSerializer(users, many=True).data), 3)
+        finally:
+            metrics.request_stats.reset(token)
+        self.assertEqual(stats.serializer_seconds, 0.5)
+        self.assertEqual(BaseSerializer.data.fget.__module__, 'rest_framework.serializers')
+
+    def test_duplicate_queries_are_counted(self):
+        def view(request):
+            for _ in range(3):
+                list(User.objects.filter(pk=self.doctor.pk))
+            list(User.objects.filter(pk=self.patient.pk))
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/')
+        response = metrics.PerformanceMiddleware(view)(request)
+        self.assertIn('desc="4 queries (2 duplicate)"', response['Server-Timing'])
+        self.assertIn('hms_db_duplicate_queries_sum{method="GET",view="unresolved"} 2', metrics.render())
+
+    def test_sampling_can_be_turned_off(self):
+        self.client.force_authenticate(self.admin)
+        with override_settings(HMS_METRICS_SAMPLE_RATE=0):
+            response = self.client.get(reverse('appointment_list'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('appointment_list', metrics.render())
+
+    def test_metrics_are_for_scrapers_and_admins(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.client.force_authenticate(self.doctor)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SeedTests(TestCase):
+    def test_seed_hms_bulk_generates_consistent_data(self):
+        call_command('seed_hms', doctors=3, patients=20, appointments=200, batch_size=7, stdout=StringIO())
+        self.assertEqual(User.objects.filter(role=User.DOCTOR).count(), 3)
+        self.assertEqual(Profile.objects.count(), User.objects.count())
+        self.assertTrue(self.client.login(username='patient7', password='hms-bench'))
+        self.assertFalse(Profile.objects.filter(user__role=User.DOCTOR, specialization__isnull=True).exists())
+        # Per-row signals are bypassed: no side-effect tasks for seeded appointments
+        self.assertEqual(Appointment.objects.count(), 200)
+        self.assertFalse(Task.objects.exists())
+        # Every booking is inside working hours on the slot grid, and no doctor is double-booked
+        for appointment in Appointment.objects.all():
+            self.assertLess(appointment.appointment_date.weekday(), 5)
+            self.assertIn(appointment.appointment_date.minute, (0, 30))
+            self.assertTrue(9 <= appointment.appointment_date.hour < 17)
+        slots = Appointment.objects.values_list('doctor', 'appointment_date')
+        self.assertEqual(len(set(slots)), 200)
+
+        with self.assertRaises(CommandError):
+            call_command('seed_hms', doctors=1, patients=1, appointments=1, stdout=StringIO())
+        call_command('seed_hms', doctors=1, patients=2, appointments=5, flush=True, stdout=StringIO())
+        self.assertEqual(Appointment.objects.count(), 5)
+
+
+class DashboardTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN)
+        self.doctor = make_user('doc', User.DOCTOR, first_name='Greg', consultation_fees=Decimal('100.00'))
+        self.other_doctor = make_user('doc2', User.DOCTOR, consultation_fees=Decimal('40.00'))
+        self.patient = make_user('pat', User.PATIENT)
+        self.other_patient = make_user('pat2', User.PATIENT)
+        start = timezone.now() + timedelta(days=30)
+        statuses = ['confirmed', 'confirmed', 'pending', 'canceled']
+        Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctor, patient=self.patient if i % 2 else self.other_patient,
+                        appointment_date=start + timedelta(hours=i), status=status)
+            for i, status in enumerate(statuses)
+        ] + [
+            Appointment(doctor=self.other_doctor, patient=self.patient, appointment_date=start, status='confirmed'),
+        ])
+        self.client = APIClient()
+
+    def get(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assert_summary_exact(self):
+        live = Appointment.objects.values_list('doctor_id', 'status').annotate(n=Count('id')).order_by()
+        summary = AppointmentSummary.objects.filter(count__gt=0).values_list('doctor_id', 'status', 'count')
+        self.assertCountEqual(summary, [(doctor, status or '', n) for doctor, status, n in live])
+
+    def test_admin_dashboard(self):
+        with self.assertNumQueries(4):  # Summary rows, listed doctors' profiles, upcoming window, revenue
+            data = self.get(self.admin)
+        self.assertEqual(data['counts'], {'pending': 1, 'confirmed': 3, 'canceled': 1, 'total': 5})
+        self.assertEqual(data['revenue'], '240.00')
+        busiest = data['doctors'][0]
+        self.assertEqual((busiest['id'], busiest['first_name'], busiest['confirmed'], busiest['revenue']),
+                         (self.doctor.pk, 'Greg', 2, '200.00'))
+        with override_settings(HMS_DASHBOARD_SUMMARY=False):
+            self.assertEqual(self.get(self.admin), data)
+
+    def test_dashboards_are_scoped_to_the_caller(self):
+        self.assertEqual(self.get(self.doctor)['counts']['total'], 4)
+        self.assertEqual([doctor['id'] for doctor in self.get(self.doctor)['doctors']], [self.doctor.pk])
+        data = self.get(self.patient)
+        self.assertEqual(data['counts'], {'pending': 0, 'confirmed': 2, 'canceled': 1, 'total': 3})
+        self.assertEqual(data['revenue'], '140.00')  # What the patient's confirmed visits cost
+
+    def test_summary_follows_every_kind_of_write(self):
+        self.assert_summary_exact()
+        appointment = Appointment.objects.filter(status='pending').first()
+        appointment.status = 'confirmed'
+        appointment.save()
+        self.assert_summary_exact()
+        Appointment.objects.filter(doctor=self.doctor, status='confirmed').update(status='canceled')
+        Appointment.objects.filter(status='canceled').update(doctor=self.other_doctor)
+        latest = Appointment.objects.filter(status='canceled').latest('appointment_date')
+        Appointment.objects.filter(pk=latest.pk).update(status=None)
+        self.assert_summary_exact()
+        Appointment.objects.filter(doctor=self.other_doctor).first().delete()
+        self.assert_summary_exact()
+        self.patient.delete()  # Cascades to their appointments
+        self.assert_summary_exact()
+
+    def test_upcoming_counts_the_rest_of_today_and_this_week(self):
+        now = timezone.make_aware(datetime(2030, 1, 9, 10, 0))  # A Wednesday
+        for day, hour, status in [(9, 14, 'pending'), (11, 10, 'confirmed'), (14, 9, 'pending'),
+                                  (9, 9, 'confirmed'), (10, 9, 'canceled')]:
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, status=status,
+                                       appointment_date=timezone.make_aware(datetime(2030, 1, day, hour, 0)))
+        self.assertEqual(dashboard.upcoming(self.doctor, now), {'today': 1, 'this_week': 2})
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN)
+        self.doctor = make_user('doc', User.DOCTOR, first_name='Greg', consultation_fees=Decimal('80.00'))
+        self.other_doctor = make_user('doc2', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT, first_name='=HYPERLINK("x")', medical_history='Asthma')
+        self.appointments = make_appointments(self.doctor, self.patient, 5)
+        make_appointments(self.other_doctor, self.patient, 2)
+        self.client = APIClient()
+
+    def export(self, user, name, **params):
+        self.client.force_authenticate(user)
+        return self.client.get(reverse(name), params)
+
+    def rows(self, response):
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    @override_settings(HMS_EXPORT_CHUNK_SIZE=2)
+    def test_appointments_stream_as_csv_in_chunks(self):
+        Appointment.objects.filter(pk=self.appointments[0].pk).update(reason='\t=1+1')
+        response = self.export(self.doctor, 'appointment_export')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="appointments.csv"', response['Content-Disposition'])
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 3)  # Header and two rows, two rows, the last row
+        header, *rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual(header, list(exports.APPOINTMENT_COLUMNS))
+        self.assertEqual([int(row[0]) for row in rows], [a.pk for a in self.appointments])  # Only the doctor's, in date order
+        row = dict(zip(header, rows[0]))
+        self.assertEqual((row['doctor_first_name'], row['consultation_fees']), ('Greg', '80.00'))
+        self.assertEqual(row['patient_first_name'], '\'=HYPERLINK("x")')  # Not a formula in a spreadsheet
+        self.assertEqual(row['reason'], "'\t=1+1")
+
+    def test_appointments_as_ndjson_with_list_filters(self):
+        Appointment.objects.filter(pk=self.appointments[0].pk).update(status='confirmed')
+        response = self.export(self.admin, 'appointment_export', format='ndjson', status='confirmed')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.appointments[0].pk])
+        self.assertEqual(self.export(self.admin, 'appointment_export', status='nope').status_code, 400)
+
+    def test_patient_export_follows_patient_list_access(self):
+        self.assertEqual(self.export(self.patient, 'patient_export').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse('patient_export')).status_code, 401)
+        header, *rows = self.rows(self.export(self.doctor, 'patient_export'))
+        self.assertEqual([dict(zip(header, row))['medical_history'] for row in rows], ['Asthma'])
+
+    def test_export_reads_one_query_however_many_rows(self):
+        self.client.force_authenticate(self.admin)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('appointment_export'))
+            self.assertEqual(len(self.rows(response)), 8)
+
+    @override_settings(HMS_ASYNC_VIEWS=True, HMS_EXPORT_CHUNK_SIZE=3)
+    def test_exports_stream_asynchronously_under_asgi(self):
+        response = self.export(self.admin, 'appointment_export', format='ndjson')
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return [chunk async for chunk in response.streaming_content]
+
+        chunks = async_to_sync(read)()
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(b''.join(chunks).splitlines()), 7)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+@override_settings(HMS_IMPORT_WORKERS=1)
+class ImportTests(APITestCase):
+    PASSWORD = 'Import-pass-2024!'
+
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def post(self, body, content_type, **params):
+        url = reverse('user_import') + ('?' + '&'.join(f'{k}={v}' for k, v in params.items()) if params else '')
+        return self.client.generic('POST', url, body, content_type=content_type)
+
+    def run_import(self, response):
+        """Run the import that `response` queued, as run_tasks would, and return its report."""
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(self.client.get(response['Location']).data['status'], 'queued')
+        tasks.Worker().run_once()
+        result = self.client.get(response['Location'])
+        self.assertEqual(result.data['status'], 'done')
+        return result.data['report']
+
+    def test_command_imports_csv_in_batches_and_reports_rejected_rows(self):
+        body = io.StringIO()
+        writer = csv.writer(body)
+        writer.writerow(['username', 'email', 'password', 'role', 'first_name', 'date_of_birth', 'consultation_fees'])
+        writer.writerows([
+            ['house', 'house@example.com', self.PASSWORD, 'doctor', 'Greg', '1959-06-11', '250.00'],
+            ['cuddy', 'cuddy@example.com', self.PASSWORD, 'patient', 'Lisa', '', ''],
+            ['admin', 'new@example.com', self.PASSWORD, 'patient', '', '', ''],  # Username taken
+            ['wilson', 'house@example.com', self.PASSWORD, 'patient', '', '', ''],  # Email taken earlier in the file
+            ['chase', 'chase@example.com', '123', 'patient', '', '', ''],  # Weak password
+            ['foreman', 'foreman@example.com', self.PASSWORD, 'nurse', '', 'soon', ''],
+            ['cameron', 'cameron@example.com', self.PASSWORD, 'patient', 'Allison', '', ''],
+        ])
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        (directory / 'users.csv').write_text(body.getvalue())
+        with mock.patch('api.imports.cache.invalidate') as invalidate:
+            call_command('import_users', directory / 'users.csv', batch_size=2, workers=1,
+                         report=directory / 'report.json', stdout=StringIO(), stderr=StringIO())
+        invalidate.assert_called_once_with('doctors')
+        report = json.loads((directory / 'report.json').read_text())
+
+        self.assertEqual((report['rows'], report['created'], report['created_by_role']['doctor']), (7, 3, 1))
+        self.assertEqual({row['row']: sorted(row['errors']) for row in report['rejected']}, {
+            3: ['username'], 4: ['email'], 5: ['password'], 6: ['date_of_birth', 'role'],
+        })
+        house = User.objects.select_related('profile').get(username='house')
+        self.assertTrue(house.check_password(self.PASSWORD))
+        self.assertEqual((house.profile.consultation_fees, house.profile.age), (Decimal('250.00'), age_on(date(1959, 6, 11), date.today())))
+        self.assertEqual(Profile.objects.filter(user__username='cameron').get().first_name, 'Allison')
+
+    def test_passwords_hash_in_worker_processes(self):
+        lines = [json.dumps({'username': f'user{i}', 'email': f'user{i}@example.com', 'password': self.PASSWORD,
+                             'role': 'patient'}) for i in range(4)]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as source:
+            source.write('\n'.join(lines))
+            source.flush()
+            call_command('import_users', source.name, workers=2, stdout=StringIO())
+        self.assertTrue(all(user.check_password(self.PASSWORD) for user in User.objects.filter(username__startswith='user')))
+        self.assertTrue(self.client.login(username='user3', password=self.PASSWORD))
+
+    def test_endpoint_is_for_admins_and_reads_each_format(self):
+        self.client.force_authenticate(make_user('pat', User.PATIENT))
+        self.assertEqual(self.post('[]', 'application/json').status_code, 403)
+        self.client.force_authenticate(self.admin)
+
+        row = {'username': 'a', 'email': 'a@example.com', 'password': self.PASSWORD, 'role': 'patient'}
+        response = self.post(json.dumps([row, {**row, 'username': 'b', 'colour': 'red'}]), 'application/json')
+        rejected = [{'row': 2, 'username': 'b', 'errors': {'email': ['Email is already in use.'], 'colour': ['Unknown field.']}}]
+        self.assertEqual((response.data['accepted'], response.data['rejected']), (1, rejected))  # Known before it runs
+        self.assertFalse(User.objects.filter(username='a').exists())
+        report = self.run_import(response)
+        self.assertEqual((report['created'], report['rejected']), (1, rejected))
+        csv_body = f'username,email,password,role\nc,c@example.com,{self.PASSWORD},doctor\n'
+        self.assertEqual(self.run_import(self.post(csv_body, 'text/csv; charset=utf-8'))['created'], 1)
+        ndjson_body = json.dumps({**row, 'username': 'd', 'email': 'd@example.com'}) + '\n'
+        self.assertEqual(self.run_import(self.post(ndjson_body, 'application/x-ndjson'))['created'], 1)
+        self.assertEqual(list(User.objects.order_by('id').values_list('username', flat=True)), ['admin', 'pat', 'a', 'c', 'd'])
+
+        self.assertEqual(self.post('', 'text/csv').data['rows'], 0)
+        self.assertEqual(self.post('a,b', 'text/plain').status_code, 415)
+        self.assertEqual(self.post('{"oops', 'application/x-ndjson').status_code, 400)
+
+    @override_settings(HMS_IMPORT_WORKERS=4)
+    def test_endpoint_imports_hash_in_the_task_workers_pool(self):
+        row = {'username': 'a', 'email': 'a@example.com', 'password': self.PASSWORD, 'role': 'patient'}
+        with mock.patch('api.imports.ProcessPoolExecutor') as pool:
+            pool.return_value.map.side_effect = lambda fn, *args, chunksize: map(fn, *args)
+            response = self.post(json.dumps([row]), 'application/json')
+            pool.assert_not_called()  # Nothing is hashed in the request
+            self.assertEqual(self.run_import(response)['created'], 1)
+        self.assertEqual(pool.call_args.args[0], 4)
+        self.assertTrue(User.objects.get(username='a').check_password(self.PASSWORD))
+        self.assertEqual(UserImport.objects.get().rows, [])  # No passwords kept once it ran
+
+        tasks.enqueue('import_users', {'import': UserImport.objects.get().pk})  # A redelivery
+        tasks.Worker().run_once()
+        self.assertEqual(self.client.get(response['Location']).data['report']['created'], 1)
+        self.client.force_authenticate(make_user('pat', User.PATIENT))
+        self.assertEqual(self.client.get(response['Location']).status_code, 403)
+
+    def test_endpoint_checks_the_size_before_writing(self):
+        rows = [{'username': f'u{i}', 'email': f'u{i}@example.com', 'password': self.PASSWORD, 'role': 'patient'}
+                for i in range(3)]
+        with self.settings(HMS_IMPORT_MAX_ROWS=2):
+            self.assertEqual(self.post(json.dumps(rows), 'application/json').status_code, 400)
+        response = self.post(json.dumps(rows), 'application/json', dry_run=1)
+        self.assertEqual((response.status_code, response.data['created']), (200, 3))
+        self.assertEqual(User.objects.count(), 1)
+
+
+class SyncTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_user('doc', User.DOCTOR)
+        self.other_doctor = make_user('doc2', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT)
+        self.appointments = make_appointments(self.doctor, self.patient, 3)
+        self.other = make_appointments(self.other_doctor, self.patient, 1, start=timezone.now() + timedelta(days=9))[0]
+        self.client = APIClient()
+
+    def sync(self, user, since=None):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('appointment_changes'), {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def ids(self, data):
+        return [row['id'] for row in data['changed']]
+
+    def age(self, *appointments, seconds=60):
+        # Saved a while ago, so past the settle window
+        Appointment.objects.filter(pk__in=[a.pk for a in appointments]).update(
+            updated_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_initial_sync_pages_through_everything_visible(self):
+        self.age(*self.appointments, self.other)
+        with self.settings(HMS_SYNC_PAGE_SIZE=2):
+            first = self.sync(self.doctor)
+            self.assertTrue(first['has_more'])
+            second = self.sync(self.doctor, first['next'])
+        self.assertFalse(second['has_more'])
+        self.assertEqual(sorted(self.ids(first) + self.ids(second)), [a.pk for a in self.appointments])
+        self.assertEqual(self.sync(self.doctor, second['next'])['changed'], [])
+        self.assertEqual(len(self.sync(self.patient)['changed']), 4)
+
+    def test_later_syncs_return_changes_and_tombstones(self):
+        self.age(*self.appointments, self.other)
+        token = self.sync(self.doctor)['next']
+        changed, deleted, kept = self.appointments
+        changed.status = 'canceled'
+        changed.save()
+        deleted_pk = deleted.pk
+        deleted.delete()
+        self.other.delete()  # Another doctor's
+        created = make_appointments(self.doctor, self.patient, 1, start=timezone.now() + timedelta(days=5))[0]
+
+        data = self.sync(self.doctor, token)
+        self.assertEqual(self.ids(data), [changed.pk, created.pk])
+        self.assertEqual(data['changed'][0]['status'], 'canceled')
+        self.assertEqual(data['deleted'], [deleted_pk])
+        # Deleting a doctor removes their appointments by cascade; the triggers still leave tombstones
+        patient_token = self.sync(self.patient)['next']
+        self.doctor.delete()
+        self.assertLessEqual({changed.pk, kept.pk, created.pk}, set(self.sync(self.patient, patient_token)['deleted']))
+
+    def test_moved_appointments_leave_the_old_owner_only(self):
+        self.age(*self.appointments, self.other)
+        doctor_token, patient_token = self.sync(self.doctor)['next'], self.sync(self.patient)['next']
+        moved = self.appointments[0]
+        Appointment.objects.filter(pk=moved.pk).update(doctor=self.other_doctor, updated_at=timezone.now())
+        self.assertEqual(self.sync(self.doctor, doctor_token)['deleted'], [moved.pk])
+        data = self.sync(self.patient, patient_token)
+        self.assertEqual((self.ids(data), data['deleted']), ([moved.pk], []))
+
+    def test_late_commits_are_not_skipped(self):
+        token = self.sync(self.doctor)['next']
+        # Recent rows come back on every sync until they settle...
+        self.assertEqual(self.ids(self.sync(self.doctor, token)), [a.pk for a in self.appointments])
+        # ...so a row saved before the last sync but committed after it is still found
+        late = make_appointments(self.doctor, self.patient, 1, start=timezone.now() + timedelta(days=7))[0]
+        self.age(late, seconds=2)
+        self.assertIn(late.pk, self.ids(self.sync(self.doctor, token)))
+
+    def test_bad_and_expired_tokens(self):
+        self.client.force_authenticate(self.doctor)
+        self.assertEqual(self.client.get(reverse('appointment_changes'), {'since': 'nope'}).status_code, 400)
+        old = sync.encode(None, timezone.now() - timedelta(days=31))
+        self.assertEqual(self.client.get(reverse('appointment_changes'), {'since': old}).status_code, 410)
+
+        self.appointments[0].delete()
+        AppointmentTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=31))
+        call_command('prune_tombstones', stdout=StringIO())
+        self.assertFalse(AppointmentTombstone.objects.exists())
+
+    def test_query_count_is_constant(self):
+        self.age(*self.appointments, self.other)
+        token = self.sync(self.doctor)['next']
+        self.appointments[0].delete()
+        make_appointments(self.doctor, self.patient, 5, start=timezone.now() + timedelta(days=20))
+        self.client.force_authenticate(self.doctor)
+        # Settled rows, settling rows, tombstones, tombstoned rows still visible
+        with self.assertNumQueries(4):
+            self.client.get(reverse('appointment_changes'), {'since': token})
+
+
+class EventTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user('admin', User.ADMIN)
+        self.doctor = make_user('doc', User.DOCTOR)
+        self.other_doctor = make_user('doc2', User.DOCTOR)
+        self.patient = make_user('pat', User.PATIENT)
+        self.doctor_token = str(MyTokenObtainPairSerializer.get_token(self.doctor).access_token)
+
+    def messages(self, subscriber):
+        return [json.loads(message.decode().split('data: ')[1]) for message in subscriber.pending]
+
+    async def write(self, fn):
+        def committed():
+            with self.captureOnCommitCallbacks(execute=True):
+                return fn()
+        result = await sync_to_async(committed)()
+        await asyncio.sleep(0)  # Let the loop run the deliveries
+        return result
+
+    async def test_events_reach_only_their_audience(self):
+        subscribers = {user.username: events.hub.subscribe(user)
+                       for user in (self.admin, self.doctor, self.other_doctor, self.patient)}
+        self.addCleanup(lambda: [events.hub.unsubscribe(s) for s in subscribers.values()])
+        appointment = await self.write(lambda: Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, appointment_date=timezone.now() + timedelta(days=1)))
+        self.assertEqual([m['kind'] for m in self.messages(subscribers['doc'])], ['created'])
+        self.assertEqual(len(self.messages(subscribers['pat'])), 1)
+        self.assertEqual(len(self.messages(subscribers['admin'])), 1)
+        self.assertEqual(self.messages(subscribers['doc2']), [])
+
+        def move_and_cancel():
+            moved = Appointment.objects.get(pk=appointment.pk)  # As loaded by a view
+            moved.doctor = self.other_doctor
+            moved.save()
+            moved.status = 'canceled'
+            moved.save()
+        await self.write(move_and_cancel)
+        # The old doctor hears of the move away, then nothing
+        self.assertEqual([m['kind'] for m in self.messages(subscribers['doc'])], ['created', 'updated'])
+        self.assertEqual([m['kind'] for m in self.messages(subscribers['doc2'])], ['updated', 'canceled'])
+
+    async def test_bulk_writes_publish_and_rollbacks_do_not(self):
+        subscriber = events.hub.subscribe(self.doctor)
+        self.addCleanup(events.hub.unsubscribe, subscriber)
+
+        def bulk():
+            client = APIClient()
+            client.force_authenticate(self.doctor)
+            client.post(reverse('appointment_bulk'), {'create': [
+                {'doctor': self.doctor.pk, 'patient': self.patient.pk,
+                 'appointment_date': (timezone.now() + timedelta(days=2, hours=i)).isoformat()} for i in range(2)
+            ]}, format='json')
+        await self.write(bulk)
+        self.assertEqual([m['kind'] for m in self.messages(subscriber)], ['created', 'created'])
+
+        def rolled_back():
+            with transaction.atomic():
+                make_appointments(self.doctor, self.patient, 1)[0].save()
+                transaction.set_rollback(True)
+        await self.write(rolled_back)
+        self.assertEqual(len(subscriber.pending), 2)
+
+    @override_settings(HMS_EVENTS_BUFFER=1, HMS_EVENTS_HEARTBEAT_SECONDS=0.01)
+    async def test_stream_sends_keep_alives_and_drops_slow_subscribers(self):
+        subscriber = events.hub.subscribe(self.patient)
+        stream = events.stream(subscriber)
+        self.assertIn(b'event: ready', await anext(stream))
+        self.assertEqual(await anext(stream), b': keep-alive\n\n')
+        appointments = await self.write(lambda: make_appointments(self.doctor, self.patient, 1))
+        saved = [events.event(appointment, created=True) for appointment in appointments] * 2
+        events.hub.publish(saved)
+        await asyncio.sleep(0)
+        self.assertIn(b'"kind": "created"', await anext(stream))
+        self.assertEqual(await anext(stream), b'event: overflow\ndata: {}\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertEqual(events.hub.count(), 0)
+
+    async def test_endpoint_authenticates_and_needs_asgi(self):
+        client = AsyncClient()
+        url = reverse('appointment_events')
+        with self.settings(HMS_ASYNC_VIEWS=False):
+            self.assertEqual((await client.get(url, {'token': self.doctor_token})).status_code, 503)
+        with self.settings(HMS_ASYNC_VIEWS=True):
+            self.assertEqual((await client.get(url)).status_code, 401)
+            response = await client.get(url, {'token': self.doctor_token})
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            content = aiter(response.streaming_content)
+            self.assertIn(b'retry: 3000', await anext(content))
+            self.assertEqual(events.hub.count(), 1)
+            # The ASGI handler cancels the response when the client goes away
+            waiting = asyncio.ensure_future(anext(content))
+            await asyncio.sleep(0)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual(events.hub.count(), 0)
@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
-from api import views
+from api import async_views, views
+
+# Under ASGI the read-heavy endpoints are served by async views (GET) that hand writes to views
+reads = async_views if settings.HMS_ASYNC_VIEWS else views
 
 urlpatterns = [
     # JWT Token endpoints
@@ -9,22 +13,39 @@ urlpatterns = [
 
     # Registration endpoint
     path("register/", views.RegisterView.as_view(), name='register'),
+    path("users/import/", views.UserImportView.as_view(), name='user_import'),  # Bulk CSV/NDJSON/JSON onboarding (admins)
+    path("users/import/<int:pk>/", views.UserImportDetailView.as_view(), name='user_import_detail'),  # A queued import's report
 
     # Profile endpoints
-    path("profile/", views.ProfileView.as_view(), name='profile'),  # For retrieving/updating the logged-in user's profile
-    path("profile/<int:pk>/", views.ProfileView.as_view(), name='profile_detail'),  # For retrieving/updating/deleting specific profiles
+    path("profile/", reads.ProfileView.as_view(), name='profile'),  # For retrieving/updating the logged-in user's profile
+    path("profile/<int:pk>/", reads.ProfileView.as_view(), name='profile_detail'),  # For retrieving/updating/deleting specific profiles
 
     # Appointment endpoints
-    path("appointments/", views.AppointmentListView.as_view(), name='appointment_list'),  # List all appointments for the logged-in user
+    path("appointments/", reads.AppointmentListView.as_view(), name='appointment_list'),  # List all appointments for the logged-in user
     path("appointments/create/", views.AppointmentCreateView.as_view(), name='appointment_create'),  # Create a new appointment
-    path("appointments/<int:pk>/", views.AppointmentDetailView.as_view(), name='appointment_detail'), # PUT, DELETE, GET by ID
+    path("appointments/<int:pk>/", reads.AppointmentDetailView.as_view(), name='appointment_detail'), # PUT, DELETE, GET by ID
+    path("appointments/bulk/", views.AppointmentBulkView.as_view(), name='appointment_bulk'),  # Batch create/update/cancel
+    path("appointments/export/", views.AppointmentExportView.as_view(), name='appointment_export'),  # Streamed CSV/NDJSON
+    path("appointments/changes/", views.AppointmentChangesView.as_view(), name='appointment_changes'),  # Delta sync
+    path("appointments/events/", async_views.AppointmentEventsView.as_view(), name='appointment_events'),  # SSE, ASGI only
     
     
     # Patient list endpoint (only accessible by doctors)
-    path("patients/", views.PatientListView.as_view(), name='patient_list'),
+    path("patients/", reads.PatientListView.as_view(), name='patient_list'),
     path("patient/<int:pk>/", views.PatientDetailView.as_view(), name="patient_detail"),
+    path("patients/export/", views.PatientExportView.as_view(), name='patient_export'),  # Streamed CSV/NDJSON
     
     # Doctor list endpoint (only accessible by admins)
-    path("doctors/", views.DoctorListView.as_view(), name='doctor_list'),
-    path("doctor/<int:pk>/", views.DoctorDetailView.as_view(), name="doctor_detail")
+    path("doctors/", reads.DoctorListView.as_view(), name='doctor_list'),
+    path("doctor/<int:pk>/", views.DoctorDetailView.as_view(), name="doctor_detail"),
+    path("doctors/<int:pk>/availability/", views.DoctorAvailabilityView.as_view(), name="doctor_availability"),
+
+    # Ranked search over doctors and patients by name, specialization and history
+    path("search/", views.SearchView.as_view(), name='search'),
+
+    # Appointment counts, load and revenue for the caller's role, aggregated in the database
+    path("dashboard/", views.DashboardView.as_view(), name='dashboard'),
+
+    # Prometheus scrape target for the request metrics of api/metrics.py
+    path("metrics/", views.MetricsView.as_view(), name='metrics'),
 ]
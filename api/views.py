@@ -1,14 +1,33 @@
 from rest_framework import generics, status
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.generics import RetrieveUpdateAPIView
-from api.models import User, Profile, Appointment
-from api.serializers import UserSerializer, ProfileSerializer, MyTokenObtainPairSerializer, RegisterSerializer, AppointmentSerializer
+from api.models import User, Profile, Appointment, Task, UserImport
+from api.serializers import (UserSerializer, ProfileSerializer, MyTokenObtainPairSerializer, RegisterSerializer, AppointmentSerializer,
+                             UserSummarySerializer, AppointmentSummarySerializer)
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import PermissionDenied
+import csv
+import io
+from datetime import timedelta
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import NotFound, ParseError, UnsupportedMediaType, ValidationError
+from api.authentication import ClaimsJWTAuthentication, MetricsTokenAuthentication
+from api.cache import cached_response
+from api.filters import AppointmentFilterBackend, parse_datetime_param
+from api.pagination import AppointmentCursorPagination, RankedPagination, UserCursorPagination
+from api.routers import ReplicaReadMixin
+from api.scheduling import book, free_slots, slot_length
+from api import dashboard, exports, fieldsets, imports, metrics, permissions, plans, search, sync, tasks
+from api.sqlite import serialized_write
+from api.bulk import BulkAppointmentWriter
 
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
@@ -19,31 +38,34 @@ class RegisterView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
 
     def perform_create(self, serializer):
-        # Directly pass role to the serializer to create the user with it
-        user = serializer.save(role=self.request.data.get('role', 'Patient'))  # Default to 'Patient' if not specified
+        # role is a required, validated field of RegisterSerializer
+        serializer.save()
 
 class ProfileView(RetrieveUpdateAPIView):
-    queryset = Profile.objects.all()
+    queryset = ProfileSerializer.setup_eager_loading(Profile.objects.all())
     serializer_class = ProfileSerializer
     permission_classes = [IsAuthenticated]
 
+    def serves_own_profile(self):
+        return self.kwargs.get('pk') is None  # /api/profile/, rather than a profile by id
+
     def get_object(self):
-        user = self.request.user
-        if user.role == 'Admin':
-            return get_object_or_404(Profile, pk=self.kwargs.get('pk'))
-        return user.profile  # Doctors and Patients can only access their own profile
+        if self.serves_own_profile():
+            return get_object_or_404(self.get_queryset(), user_id=self.request.user.pk)
+        # Any profile the caller may see; admins change any, everyone else only their own (api/permissions.py)
+        return permissions.PROFILES.get(self.get_queryset(), self.request.user,
+                                        write=self.request.method not in SAFE_METHODS,
+                                        denied="You do not have permission to edit this profile.", pk=self.kwargs['pk'])
+
+    def get(self, request, *args, **kwargs):
+        # A user's own profile is cached until it changes; lookups by id are not
+        if not self.serves_own_profile():
+            return super().get(request, *args, **kwargs)
+        return cached_response(request, f'profile:{request.user.pk}', lambda: self.get_serializer(self.get_object()).data)
 
     def put(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
-
-        # Role-based field validation
-        if request.user.role != 'Admin':
-            # Check if the user is trying to edit a different profile
-            if instance.user != request.user:
-                return Response({"detail": "You do not have permission to edit this profile."}, 
-                                status=status.HTTP_403_FORBIDDEN)
-
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
@@ -53,28 +75,17 @@ class ProfileView(RetrieveUpdateAPIView):
         return self.put(request, *args, **kwargs)  # Reusing PUT logic for POST
 
     def perform_update(self, serializer):
-        serializer.save()
+        serialized_write(serializer.save)
 
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def profile_detail(request, pk):
-    user = request.user
-
-    # Fetch profile based on role
-    if user.role in ['Admin', 'admin']:
-        profile = get_object_or_404(Profile, pk=pk)  # Admin can access any profile
-    elif user.role in ['Doctor', 'doctor']:
-        profile = get_object_or_404(Profile, pk=pk)  # Doctors can access any profile
-        # Check if the profile belongs to an Admin
-        if profile.user.role in ['Admin', 'admin']:
-            return Response({"detail": "You do not have permission to view this profile."},
-                            status=status.HTTP_403_FORBIDDEN)
-    elif user.role in ['Patient', 'patient']:
-        profile = get_object_or_404(Profile, pk=pk)
-        # Check if the profile belongs to an Admin or another Patient
-        if profile.user.role in ['Admin', 'admin']:
-            return Response({"detail": "You do not have permission to view this profile."},
-                            status=status.HTTP_403_FORBIDDEN)
+    # One query decides: 404 for a profile the caller may not see, 403 for a change they may not make
+    profile = permissions.PROFILES.get(
+        ProfileSerializer.setup_eager_loading(Profile.objects.all()), request.user,
+        write=request.method not in SAFE_METHODS,
+        denied=f"You do not have permission to {'edit' if request.method == 'PUT' else 'delete'} this profile.", pk=pk,
+    )
 
     # Handle GET request
     if request.method == 'GET':
@@ -83,30 +94,19 @@ def profile_detail(request, pk):
 
     # Handle PUT request
     elif request.method == 'PUT':
-        # Check if the user is trying to edit their own profile
-        if user.role not in ['Admin', 'admin']:
-            if profile.user != user:
-                return Response({"detail": "You do not have permission to edit this profile."},
-                                status=status.HTTP_403_FORBIDDEN)
-
-        request.data['user'] = request.user.id
+        request.data['user'] = profile.user_id  # An admin's edit must not hand the profile over to them
         serializer = ProfileSerializer(profile, data=request.data)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    # Handle DELETE request
+    # Handle DELETE request: admins, or users deleting their own profile
     elif request.method == 'DELETE':
-        # Allow Admins and users to delete their own profile
-        if user.role in ['Admin', 'admin'] or profile.user == user:
-            user_to_delete = profile.user
-            profile.delete()
-            user_to_delete.delete()  # Delete the associated User instance
-            return Response(status=status.HTTP_204_NO_CONTENT)
-
-        return Response({"detail": "You do not have permission to delete this profile."},
-                        status=status.HTTP_403_FORBIDDEN)
+        user_to_delete = profile.user
+        profile.delete()
+        user_to_delete.delete()  # Delete the associated User instance
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 # Appointment View
@@ -117,8 +117,6 @@ class AppointmentCreateView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         user = self.request.user
-        
-        print(f"Request Data: {self.request.data}")  # Debugging line
         doctor, patient = None, None
 
         # Case 1: If the user is a doctor, override the doctor field with the logged-in user
@@ -126,7 +124,7 @@ class AppointmentCreateView(generics.CreateAPIView):
             doctor = user  # Set the doctor to the logged-in doctor
             patient_id = self.request.data.get('patient')
             if not patient_id:
-                return Response({"detail": "Patient ID must be provided for doctor."}, status=status.HTTP_400_BAD_REQUEST)
+                raise ValidationError({"patient": "Patient ID must be provided for doctor."})
             patient = get_object_or_404(User, pk=patient_id, role=User.PATIENT)
 
         # Case 2: If the user is a patient, override the patient field with the logged-in user
@@ -134,7 +132,7 @@ class AppointmentCreateView(generics.CreateAPIView):
             patient = user  # Set the patient to the logged-in patient
             doctor_id = self.request.data.get('doctor')
             if not doctor_id:  # Check if doctor ID is provided
-                return Response({"detail": "Doctor ID must be provided."}, status=status.HTTP_400_BAD_REQUEST)
+                raise ValidationError({"doctor": "Doctor ID must be provided."})
             doctor = get_object_or_404(User, pk=doctor_id, role=User.DOCTOR)
 
         # Case 3: If the user is an admin, they can specify both the patient and doctor
@@ -142,18 +140,17 @@ class AppointmentCreateView(generics.CreateAPIView):
             patient_id = self.request.data.get('patient')
             doctor_id = self.request.data.get('doctor')
             if not patient_id or not doctor_id:
-                return Response({"detail": "Patient and Doctor IDs must be provided."}, status=status.HTTP_400_BAD_REQUEST)
+                raise ValidationError({"detail": "Patient and Doctor IDs must be provided."})
             patient = get_object_or_404(User, pk=patient_id, role=User.PATIENT)
             doctor = get_object_or_404(User, pk=doctor_id, role=User.DOCTOR)
 
-        # Check if the doctor is already booked for the requested date
-        appointment_date = self.request.data.get('appointment_date')
-        if Appointment.objects.filter(doctor=doctor, appointment_date=appointment_date).exists():
-            return Response({"detail": "This doctor is already booked for this date."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            raise PermissionDenied("Only admins, doctors and patients can book appointments.")
 
-        # Save the appointment with the appropriate patient and doctor
-        serializer.save(patient=patient, doctor=doctor)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        # Check the doctor's schedule and save the appointment in one transaction;
+        # an overlapping booking raises BookingConflict (409)
+        appointment_date = serializer.validated_data.get('appointment_date')
+        book(doctor, appointment_date, lambda: serializer.save(patient=patient, doctor=doctor))
 
 
 
@@ -161,69 +158,152 @@ class AppointmentCreateView(generics.CreateAPIView):
 
 
 # List all appointments for the logged-in user (doctor, patient, or admin)
-class AppointmentListView(generics.ListAPIView):
-    serializer_class = AppointmentSerializer
+class AppointmentListView(ReplicaReadMixin, generics.ListAPIView):
+    authentication_classes = [ClaimsJWTAuthentication]  # request.user may be a ClaimsUser: filter on its pk
     permission_classes = [IsAuthenticated]
+    pagination_class = AppointmentCursorPagination  # Keyset pages ordered on (appointment_date, id)
+    filter_backends = [AppointmentFilterBackend]  # ?doctor=&patient=&status=&date_from=&date_to=
+
+    def get_serializer_class(self):
+        # Compact rows, shaped by ?fields= and ?expand=; see api/fieldsets.py
+        return fieldsets.serializer_class(self.request, AppointmentSummarySerializer, AppointmentSerializer)
 
     def get_queryset(self):
-        user = self.request.user
-        
-        # If the logged-in user is an admin, return all appointments
-        if user.role == User.ADMIN:
-            return Appointment.objects.all()
+        return visible_appointments(self.request.user)
 
-        # If the logged-in user is a doctor, return only their appointments
-        elif user.role == User.DOCTOR:
-            return Appointment.objects.filter(doctor=user)
-        
-        # If the logged-in user is a patient, return only their appointments
-        elif user.role == User.PATIENT:
-            return Appointment.objects.filter(patient=user)
-        
-        # If the user has any other role, return an empty queryset
-        return Appointment.objects.none()
+    def list(self, request, *args, **kwargs):
+        # Rows from values_list(), serialized by the precompiled plan of the serializer (api/plans.py)
+        plan = plans.plan(self.get_serializer_class(), *AppointmentCursorPagination.ordering)
+        page = self.paginate_queryset(self.filter_queryset(plan.queryset(self.get_queryset())))
+        return self.get_paginated_response(plan.serialize(page))
+
+
+class AppointmentExportView(ReplicaReadMixin, APIView):
+    """The appointments the caller may list, with the list's filters, streamed as CSV or NDJSON; see api/exports.py."""
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [exports.CSVRenderer, exports.NDJSONRenderer]
+
+    def get(self, request):
+        appointments = AppointmentFilterBackend().filter_queryset(
+            request, visible_appointments(request.user), self
+        ).order_by('appointment_date', 'id')
+        return exports.stream(request, 'appointments', exports.APPOINTMENT_COLUMNS, appointments)
+
+
+class AppointmentChangesView(APIView):
+    """The caller's appointments changed or gone since a sync token; see api/sync.py."""
+    # Not a ReplicaReadMixin view: a lagging replica would let changes slip behind the token
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        result = sync.changes(request.user, visible_appointments(request.user), request.query_params.get('since'))
+        result['changed'] = AppointmentSerializer(result['changed'], many=True).data
+        return Response(result)
+
+
+def visible_appointments(user):
+    # Admins see every appointment, doctors and patients their own (api/permissions.py)
+    queryset = permissions.APPOINTMENTS.visible(Appointment.objects.all(), user)
+    return AppointmentSerializer.setup_eager_loading(queryset)
 
 
 class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Appointment.objects.all()
+    queryset = AppointmentSerializer.setup_eager_loading(Appointment.objects.all())
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        # Get the specific appointment instance
-        appointment = get_object_or_404(Appointment, pk=self.kwargs.get('pk'))
-        user = self.request.user
-        
-        # Allow a doctor to access their own appointments
-        if user.role == User.DOCTOR and appointment.doctor != user:
-            raise PermissionDenied("You do not have permission to modify this appointment.")
-        
-        # Allow a patient to access their own appointments
-        if user.role == User.PATIENT and appointment.patient != user:
-            raise PermissionDenied("You do not have permission to modify this appointment.")
-        
-        # Admins can modify any appointment
-        if user.role == User.ADMIN:
-            return appointment
-
-        return appointment
+        # Doctors and patients reach only their own appointments, admins any: a 404 otherwise (api/permissions.py)
+        return permissions.APPOINTMENTS.get(self.get_queryset(), self.request.user, pk=self.kwargs.get('pk'))
 
     def perform_update(self, serializer):
         user = self.request.user
 
+        # Re-check the doctor's schedule when the appointment moves or a canceled one is reopened
+        instance = serializer.instance
+        doctor = user if user.role == User.DOCTOR else serializer.validated_data.get('doctor', instance.doctor)
+        appointment_date = serializer.validated_data.get('appointment_date', instance.appointment_date)
+        new_status = serializer.validated_data.get('status', instance.status)
+        moved = doctor != instance.doctor or appointment_date != instance.appointment_date
+        reopened = instance.status == 'canceled' and new_status != 'canceled'
+
         # Allow the doctor or patient to modify specific fields including status
         if user.role == User.DOCTOR:
-            serializer.save(doctor=user)  # This might be relevant if a doctor is changing the appointment
+            save = lambda: serializer.save(doctor=user)  # This might be relevant if a doctor is changing the appointment
         elif user.role == User.PATIENT:
-            serializer.save(patient=user)  # Patients are allowed to modify their own appointments
+            save = lambda: serializer.save(patient=user)  # Patients are allowed to modify their own appointments
         else:
-            serializer.save()  # Admins can modify anything
+            save = serializer.save  # Admins can modify anything
+
+        if (moved or reopened) and new_status != 'canceled':
+            book(doctor, appointment_date, save, exclude_pk=instance.pk)
+        else:
+            save()  # Status changes included: the serializer validates and writes them
+
+
+class AppointmentBulkView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        # Schedule imports and mass cancellations are clinic work: admins, and doctors for their own diary
+        if request.user.role not in [User.ADMIN, User.DOCTOR]:
+            return Response({"detail": "Only admins and doctors can make bulk changes."}, status=status.HTTP_403_FORBIDDEN)
+        # Per-row outcomes are reported in the body; see api/bulk.py for the payload format
+        results = BulkAppointmentWriter(request).run(request.data)
+        return Response(results)
+
+
+class UserImportView(APIView):
+    permission_classes = [IsAuthenticated]
+    # The body is read as a stream by api/imports.py, not parsed up front
+    formats = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/json': 'json'}
+
+    def post(self, request):
+        if request.user.role != User.ADMIN:
+            return Response({"detail": "Only admins can import users."}, status=status.HTTP_403_FORBIDDEN)
+        format = self.formats.get(request.content_type.split(';')[0].strip())
+        if format is None:
+            raise UnsupportedMediaType(request.content_type)
+        limit = settings.HMS_IMPORT_MAX_ROWS
+        try:
+            # Read (and parse) the whole import before writing any of it; it is at most `limit` rows
+            # DRF's stream is None for an empty body
+            rows = list(islice(imports.read_rows(request.stream or io.BytesIO(), format), limit + 1))
+        except (ValueError, csv.Error) as error:
+            raise ParseError(f"Malformed {format} body: {error}")
+        if len(rows) > limit:
+            raise ValidationError({"detail": f"An import may hold at most {limit} users."})
+        # Checked now, so the caller learns of bad rows at once; hashing the passwords takes
+        # PBKDF2 time per user, so the import itself runs as a task (api/tasks.py)
+        report = imports.UserImporter(dry_run=True).run(iter(rows))
+        if request.query_params.get('dry_run') in ('1', 'true') or not report['created']:
+            return Response(report)
+        with transaction.atomic():
+            upload = UserImport.objects.create(requested_by_id=request.user.pk, rows=rows)
+            tasks.enqueue('import_users', {'import': upload.pk})
+        url = reverse('user_import_detail', args=[upload.pk])
+        return Response({'import': upload.pk, 'status': 'queued', 'rows': report['rows'], 'accepted': report['created'],
+                         'rejected': report['rejected'], 'report': url},
+                        status=status.HTTP_202_ACCEPTED, headers={'Location': url})
+
+
+class UserImportDetailView(APIView):
+    """The report of a queued import, once the `import_users` task has run it."""
+    permission_classes = [IsAuthenticated]
 
-        # Allow status to be updated regardless of user role
-        if 'status' in self.request.data:
-            appointment = self.get_object()
-            appointment.status = self.request.data['status']
-            appointment.save()
+    def get(self, request, pk):
+        if request.user.role != User.ADMIN:
+            return Response({"detail": "Only admins can import users."}, status=status.HTTP_403_FORBIDDEN)
+        upload = get_object_or_404(UserImport.objects.defer('rows'), pk=pk)
+        if upload.report is not None:
+            state = 'done'
+        elif Task.objects.filter(name='import_users', payload__import=upload.pk, status=Task.FAILED).exists():
+            state = 'failed'
+        else:
+            state = 'queued'
+        return Response({'import': upload.pk, 'status': state, 'report': upload.report})
 
 
 
@@ -234,19 +314,35 @@ from rest_framework.response import Response
 from .models import User
 from .serializers import UserSerializer
 
-class PatientListView(APIView):
+class PatientListView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]  # Only authenticated users
 
     def get(self, request):
         # Allow both doctors and admins to view the patient list
         if request.user.role in [User.DOCTOR, User.ADMIN]:
-            patients = User.objects.filter(role=User.PATIENT)
-            serializer = UserSerializer(patients, many=True)
-            return Response(serializer.data)
+            plan = plans.plan(fieldsets.serializer_class(request, UserSummarySerializer, UserSerializer),
+                              *UserCursorPagination.ordering)
+            paginator = UserCursorPagination()
+            page = paginator.paginate_queryset(plan.queryset(User.objects.filter(role=User.PATIENT)), request, view=self)
+            return paginator.get_paginated_response(plan.serialize(page))
 
         # If user is not a doctor or admin, deny access
         return Response({"detail": "You are a Patient; you cannot view this list."}, status=403)
 
+
+class PatientExportView(ReplicaReadMixin, APIView):
+    """Every patient with their profile, streamed as CSV or NDJSON to doctors and admins; see api/exports.py."""
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [exports.CSVRenderer, exports.NDJSONRenderer]
+
+    def get(self, request):
+        # The same check as PatientListView
+        if request.user.role not in [User.DOCTOR, User.ADMIN]:
+            return Response({"detail": "You are a Patient; you cannot view this list."}, status=403)
+        patients = User.objects.filter(role=User.PATIENT).order_by('id')
+        return exports.stream(request, 'patients', exports.PATIENT_COLUMNS, patients)
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
@@ -257,85 +353,146 @@ from .serializers import UserSerializer
 class PatientDetailView(APIView):
     permission_classes = [IsAuthenticated]  # Only authenticated users
 
-    def get_object(self, pk):
-        try:
-            return User.objects.get(pk=pk, role=User.PATIENT)
-        except User.DoesNotExist:
-            return None
+    def get_object(self, pk, write=False):
+        # Doctors and admins see any patient, a patient only themself; only admins change others (api/permissions.py)
+        return permissions.PATIENTS.get(UserSerializer.setup_eager_loading(User.objects.all()), self.request.user,
+                                        write=write, not_found="Patient not found.",
+                                        denied="You do not have permission to change this patient.", pk=pk)
 
     def get(self, request, pk):
         # Retrieve a specific patient profile
-        patient = self.get_object(pk)
-        if patient:
-            serializer = UserSerializer(patient)
-            return Response(serializer.data)
-        return Response({"detail": "Patient not found."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = UserSerializer(self.get_object(pk))
+        return Response(serializer.data)
 
     def put(self, request, pk):
         # Update a specific patient profile
-        patient = self.get_object(pk)
-        if patient:
-            serializer = UserSerializer(patient, data=request.data)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        return Response({"detail": "Patient not found."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = UserSerializer(self.get_object(pk, write=True), data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, pk):
         # Delete a specific patient profile
-        patient = self.get_object(pk)
-        if patient:
-            patient.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response({"detail": "Patient not found."}, status=status.HTTP_404_NOT_FOUND)
+        self.get_object(pk, write=True).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     
-class DoctorListView(APIView):
+class DoctorListView(ReplicaReadMixin, APIView):
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
         
         # Allow only Admins to view Full Doctors List
         if request.user.role == User.ADMIN or request.user.role == User.PATIENT or request.user.role == User.DOCTOR:
-            doctors = User.objects.filter(role=User.DOCTOR)
-            serializer = UserSerializer(doctors, many=True)
-            return Response(serializer.data)
+            # Same directory for every caller, so each page is cached until a doctor changes
+            return cached_response(request, 'doctors', lambda: self.list_doctors(request))
         else:
         
         # If user is not a Doctor or Patient, deny access
             return Response({"detail": "You are not an Admin; you cannot view this list."}, status=403)
+
+    def list_doctors(self, request):
+        plan = plans.plan(fieldsets.serializer_class(request, UserSummarySerializer, UserSerializer),
+                          *UserCursorPagination.ordering)
+        paginator = UserCursorPagination()
+        page = paginator.paginate_queryset(plan.queryset(User.objects.filter(role=User.DOCTOR)), request, view=self)
+        return paginator.get_paginated_response(plan.serialize(page)).data
         
 
+class SearchView(ReplicaReadMixin, APIView):
+    """Ranked full-text search over names, specialization and history; see api/search.py."""
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        terms = search.query_terms(request.query_params.get('q', ''))
+        if not terms:
+            raise ValidationError({"q": "Enter at least one word to search for."})
+        roles = search.visible_roles(request.user)
+        role = request.query_params.get('role')
+        if role:
+            if role not in roles:
+                raise ValidationError({"role": f"Must be one of: {', '.join(sorted(roles))}."})
+            roles = {role}
+        columns = search.searchable_columns(request.user)
+
+        paginator = RankedPagination()
+        ids = paginator.paginate_search(
+            lambda offset, limit: search.search_profiles(terms, roles, columns, offset, limit), request
+        )
+        users = UserSerializer.setup_eager_loading(User.objects.filter(profile__in=ids))
+        by_profile = {user.profile.pk: user for user in users}
+        page = [by_profile[pk] for pk in ids if pk in by_profile]  # In rank order
+        return paginator.get_paginated_response(UserSerializer(page, many=True).data)
+
+
+class DashboardView(ReplicaReadMixin, APIView):
+    """Appointment counts, upcoming load, per-doctor load and revenue for the caller; see api/dashboard.py."""
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(dashboard.summary(request.user))
+
+
+class MetricsView(APIView):
+    """Request metrics in the Prometheus text format, for a scraper or an admin; see api/metrics.py."""
+    authentication_classes = [MetricsTokenAuthentication, ClaimsJWTAuthentication]
+    permission_classes = [metrics.IsMetricsReader]
+    renderer_classes = [metrics.PrometheusRenderer]
+
+    def get(self, request):
+        return Response(metrics.render(), content_type=metrics.PrometheusRenderer.content_type)
+
+
 class DoctorDetailView(APIView):
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]  # Only authenticated users
 
-    def get_object(self, pk):
-        try:
-            return User.objects.get(pk=pk, role=User.DOCTOR)  # Get the doctor by primary key
-        except User.DoesNotExist:
-            return None
+    def get_object(self, pk, write=False):
+        # Every role sees the doctors; only admins change others (api/permissions.py)
+        return permissions.DOCTORS.get(UserSerializer.setup_eager_loading(User.objects.all()), self.request.user,
+                                       write=write, not_found="Doctor not found.",
+                                       denied="You do not have permission to change this doctor.", pk=pk)
 
     def get(self, request, pk):
-        doctor = self.get_object(pk)
-        if doctor is not None:
-            serializer = UserSerializer(doctor)
-            return Response(serializer.data)
-        return Response({"detail": "Doctor not found."}, status=status.HTTP_404_NOT_FOUND)
+        return cached_response(request, 'doctors', lambda: self.retrieve_doctor(pk))
+
+    def retrieve_doctor(self, pk):
+        return UserSerializer(self.get_object(pk)).data
 
     def put(self, request, pk):
-        doctor = self.get_object(pk)
-        if doctor is not None:
-            serializer = UserSerializer(doctor, data=request.data, partial=True)  # Allow partial updates
-            if serializer.is_valid():
-                serializer.save()  # Save the updated data
-                return Response(serializer.data)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        return Response({"detail": "Doctor not found."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = UserSerializer(self.get_object(pk, write=True), data=request.data, partial=True)  # Allow partial updates
+        if serializer.is_valid():
+            serializer.save()  # Save the updated data
+            return Response(serializer.data)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, pk):
-        doctor = self.get_object(pk)
-        if doctor is not None:
-            doctor.delete()  # Delete the doctor record
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response({"detail": "Doctor not found."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.get_object(pk, write=True).delete()  # Delete the doctor record
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class DoctorAvailabilityView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        doctor = permissions.DOCTORS.get(UserSerializer.setup_eager_loading(User.objects.all()), request.user, pk=pk)
+
+        # Window defaults to the next week; ?from= and ?to= accept ISO dates or datetimes
+        window_start = parse_datetime_param(request.query_params, 'from') or timezone.now()
+        window_end = parse_datetime_param(request.query_params, 'to') or window_start + timedelta(days=7)
+        if window_end <= window_start:
+            raise ValidationError({"to": "Must be later than 'from'."})
+        if window_end - window_start > timedelta(days=settings.HMS_MAX_AVAILABILITY_DAYS):
+            raise ValidationError({"to": f"The window may span at most {settings.HMS_MAX_AVAILABILITY_DAYS} days."})
+
+        slots = free_slots(doctor, window_start, window_end)
+        return Response({
+            "doctor": doctor.pk,
+            "slot_minutes": int(slot_length(doctor).total_seconds() // 60),
+            "slots": [{"start": start, "end": end} for start, end in slots],
+        })
+
@@ -0,0 +1,42 @@
+"""
+Shared bootstrap for the benchmark scripts.
+
+Benchmarks never touch the development database: they point the `default` alias at a
+separate SQLite file (``--db``, default ``/tmp/hms_bench.sqlite3``) before Django is set up,
+migrate it, and reuse it between runs so expensive seeding only happens once.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_DB = '/tmp/hms_bench.sqlite3'
+
+
+def setup(db_path=DEFAULT_DB, migrate=True):
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hms.settings')
+
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = str(db_path)
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['127.0.0.1', 'localhost', 'testserver']
+
+    import django
+    django.setup()
+
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+
+
+def timed(fn, repeat=50):
+    """Run fn `repeat` times and return (median_ms, p95_ms)."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95) - 1]
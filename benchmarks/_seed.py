@@ -0,0 +1,15 @@
+"""
+Synthetic data for the benchmarks: the generator behind `manage.py seed_hms`
+(api/seeding.py), run once per database file and reused while it holds enough rows.
+"""
+
+
+def seed(doctors=500, patients=20_000, appointments=1_000_000, seed=42):
+    from django.core.management import call_command
+    from api import seeding
+    from api.models import Appointment
+
+    if Appointment.objects.count() >= appointments:
+        return
+    call_command('flush', interactive=False, verbosity=0)
+    seeding.seed(doctors=doctors, patients=patients, appointments=appointments, seed=seed)
@@ -0,0 +1,256 @@
+"""
+End-to-end benchmark suite for the API routes, comparable across commits.
+
+Serves the project from a child process (WSGI on Django's threaded server by default, or
+ASGI on uvicorn) against a database seeded by `manage.py seed_hms` (seeded here on first
+use), with every request sampled by the metrics middleware (HMS_METRICS_SAMPLE_RATE=1) so
+each response's Server-Timing header reports its query count. Then, route by route,
+--concurrency client threads on keep-alive connections issue --requests requests between
+them (--slow-requests for the two routes that hash a password), after --warmup unmeasured
+ones:
+
+    token               POST /api/token/                  a patient logs in
+    register            POST /api/register/               a new patient signs up
+    appointment_list    GET  /api/appointments/           a doctor's first page of 20
+    appointment_create  POST /api/appointments/create/    a patient books a free slot
+    appointment_detail  GET  /api/appointments/<id>/      a doctor opens one of theirs
+    doctor_list         GET  /api/doctors/                a patient browses doctors
+    patient_list        GET  /api/patients/               a doctor browses patients
+
+For each it reports requests/s, latency percentiles, errors, and the median and maximum
+queries per request (and duplicates, see api/metrics.py), together with the commit the
+tree is at. Save a run with --output and pass it as --baseline to a later run to get the
+ratios against it.
+
+    python benchmarks/api_suite.py --output before.json
+    python benchmarks/api_suite.py --baseline before.json
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+
+import _django
+import asgi_load
+
+SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries \((\d+) duplicate\)"')
+PASSWORD = 'Suite-pass-2024!'  # Passes the password validators; seeded users share seed_hms's
+
+
+def fixtures(password, clients=20):
+    """Tokens and ids the scenarios need, from the seeded data."""
+    from django.db.models import Max
+    from api import seeding
+    from api.models import User, Appointment
+    from api.serializers import MyTokenObtainPairSerializer
+
+    def token(user):
+        return str(MyTokenObtainPairSerializer.get_token(user).access_token)
+
+    doctors = list(User.objects.filter(role=User.DOCTOR).order_by('id')[:clients])
+    patients = list(User.objects.filter(role=User.PATIENT).order_by('id')[:clients])
+    last = Appointment.objects.aggregate(last=Max('appointment_date'))['last']
+    return {
+        'password': password,
+        'patient_names': [patient.username for patient in patients],
+        'doctor_ids': [doctor.pk for doctor in doctors],
+        'doctor_tokens': [token(doctor) for doctor in doctors],
+        'patient_tokens': [token(patient) for patient in patients],
+        'appointments': [
+            list(Appointment.objects.filter(doctor=doctor).order_by('-appointment_date').values_list('id', flat=True)[:50])
+            for doctor in doctors
+        ],
+        # Bookings go to the week after the last seeded or booked appointment, one slot per doctor each
+        'first_free': seeding.first_monday(last.date() + timedelta(days=7)),
+        'slots': seeding.week_slots(),
+        'run': int(time.time()),
+    }
+
+
+def scenarios(data):
+    from api import seeding
+
+    def pick(items, i):
+        return items[i % len(items)]
+
+    def book(i):
+        doctors = data['doctor_ids']
+        start = seeding.slot_start(data['first_free'], data['slots'], i // len(doctors))
+        body = {'doctor': doctors[i % len(doctors)], 'appointment_date': start.isoformat(), 'status': 'pending',
+                'reason': 'Benchmark booking'}
+        return 'POST', '/api/appointments/create/', body, pick(data['patient_tokens'], i)
+
+    def detail(i):
+        k = i % len(data['doctor_tokens'])
+        return 'GET', f'/api/appointments/{pick(data["appointments"][k], i // len(data["doctor_tokens"]))}/', None, \
+            data['doctor_tokens'][k]
+
+    return {
+        'token': (True, lambda i: ('POST', '/api/token/', {
+            'username': pick(data['patient_names'], i), 'password': data['password']}, None)),
+        'register': (True, lambda i: ('POST', '/api/register/', {
+            'username': f'suite-{data["run"]}-{i}', 'email': f'suite-{data["run"]}-{i}@hms.test',
+            'password': PASSWORD, 'password2': PASSWORD, 'role': 'patient'}, None)),
+        'appointment_list': (False, lambda i: (
+            'GET', '/api/appointments/?page_size=20', None, pick(data['doctor_tokens'], i))),
+        'appointment_create': (False, book),
+        'appointment_detail': (False, detail),
+        'doctor_list': (False, lambda i: ('GET', '/api/doctors/?page_size=20', None, pick(data['patient_tokens'], i))),
+        'patient_list': (False, lambda i: ('GET', '/api/patients/?page_size=20', None, pick(data['doctor_tokens'], i))),
+    }
+
+
+def drive(port, scenario, first, count, concurrency):
+    """Issue requests first..first+count-1 from `concurrency` threads; return one sample per request."""
+    indexes = itertools.count(first)
+    samples = []
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        while (i := next(indexes)) < first + count:
+            method, path, body, token = scenario(i)
+            headers = {'Content-Type': 'application/json'}
+            if token:
+                headers['Authorization'] = f'Bearer {token}'
+            began = time.perf_counter()
+            try:
+                connection.request(method, path, body=json.dumps(body) if body else None, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                samples.append((time.perf_counter() - began, None, None))
+                continue
+            samples.append((time.perf_counter() - began, response.status, response.getheader('Server-Timing')))
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - began
+
+
+def summarize(samples, seconds):
+    latencies = sorted(latency * 1000 for latency, _, _ in samples)
+    timings = [SERVER_TIMING.search(header) for _, _, header in samples if header]
+    queries = sorted(int(match[2]) for match in timings if match)
+    duplicates = [int(match[3]) for match in timings if match]
+    db_ms = sorted(float(match[1]) for match in timings if match)
+    errors = {}
+    for _, status, _ in samples:
+        if status is None or status >= 400:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    def percentile(values, q):
+        return round(values[min(len(values) - 1, int(len(values) * q))], 2) if values else None
+
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'requests_per_second': round(len(samples) / seconds, 1),
+        'latency_ms': {f'p{int(q * 100)}': percentile(latencies, q) for q in (0.5, 0.9, 0.95, 0.99)}
+        | {'max': percentile(latencies, 1)},
+        'queries': {'median': percentile(queries, 0.5), 'max': percentile(queries, 1),
+                    'duplicates_max': max(duplicates, default=None)},
+        'db_ms_p50': percentile(db_ms, 0.5),
+    }
+
+
+def compare(results, baseline):
+    """Ratios of this run to `baseline`: above 1 is more throughput or more latency."""
+    changes = {}
+    for name, now in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        ratio = lambda a, b: round(a / b, 3) if a and b else None
+        changes[name] = {
+            'requests_per_second': ratio(now['requests_per_second'], before['requests_per_second']),
+            'p95_ms': ratio(now['latency_ms']['p95'], before['latency_ms']['p95']),
+            'median_queries': (None if now['queries']['median'] is None or before['queries']['median'] is None
+                               else now['queries']['median'] - before['queries']['median']),
+        }
+    return {'commit': baseline.get('commit'), 'changes': changes}
+
+
+def git_state():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=_django.ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=_django.ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_suite.sqlite3')
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--slow-requests', type=int, default=200, help='Requests for token and register.')
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='Run just these scenarios.')
+    parser.add_argument('--doctors', type=int, default=200, help='Seed size, on first use of --db.')
+    parser.add_argument('--patients', type=int, default=20_000)
+    parser.add_argument('--appointments', type=int, default=200_000)
+    parser.add_argument('--password', default=PASSWORD, help='Of the seeded users, if --db was seeded elsewhere.')
+    parser.add_argument('--output', help='Also write the results to this file.')
+    parser.add_argument('--baseline', help='Results of an earlier run to compare against.')
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.core.management import call_command
+    from api.models import User, Appointment
+
+    if not User.objects.filter(username='doctor0').exists():
+        call_command('seed_hms', doctors=args.doctors, patients=args.patients, appointments=args.appointments,
+                     password=args.password, flush=True)
+    data = fixtures(args.password)
+    chosen = {name: spec for name, spec in scenarios(data).items() if not args.only or name in args.only}
+
+    commit, dirty = git_state()
+    results = {
+        'commit': commit, 'dirty': dirty, 'server': args.server, 'concurrency': args.concurrency,
+        'data': {'users': User.objects.count(), 'appointments': Appointment.objects.count()},
+        'scenarios': {},
+    }
+    port = asgi_load.free_port()
+    environment = dict(os.environ, HMS_METRICS_SAMPLE_RATE='1')
+    server = subprocess.Popen([sys.executable, asgi_load.__file__, '--serve', args.server, '--db', args.db,
+                               '--port', str(port)], env=environment)
+    try:
+        asgi_load.wait_for(port)
+        for name, (slow, scenario) in chosen.items():
+            drive(port, scenario, 0, args.warmup, args.concurrency)
+            count = args.slow_requests if slow else args.requests
+            samples, seconds = drive(port, scenario, args.warmup, count, args.concurrency)
+            results['scenarios'][name] = summarize(samples, seconds)
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            results['baseline'] = compare(results, json.load(baseline))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
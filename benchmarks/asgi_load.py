@@ -0,0 +1,173 @@
+"""
+WSGI vs ASGI throughput and tail latency for the read-heavy endpoints.
+
+Serves the project from a child process twice, once as WSGI on Django's threaded server
+(sync DRF views) and once as ASGI on uvicorn (the async views, HMS_ASYNC_VIEWS=1), against
+the same SQLite file. For each, --clients concurrent keep-alive connections from an asyncio
+client in this process alternate between GET /api/appointments/?page_size=20 and
+GET /api/doctors/ for --seconds, and requests/s, p50 and p99 latency are reported.
+
+Needs uvicorn (pip install uvicorn).
+
+    python benchmarks/asgi_load.py --clients 1000 --seconds 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+import _django
+
+PATHS = ['/api/appointments/?page_size=20', '/api/doctors/']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(kind, db, port):
+    """Child process: run the app on `port` until killed."""
+    if kind == 'asgi':
+        os.environ['HMS_ASYNC_VIEWS'] = '1'  # Read when settings load
+    _django.setup(db, migrate=False)
+    if kind == 'asgi':
+        import uvicorn
+        from django.core.asgi import get_asgi_application
+        uvicorn.run(get_asgi_application(), host='127.0.0.1', port=port, log_level='warning', access_log=False,
+                    backlog=4096)
+    else:
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadedWSGIServer):
+            request_queue_size = 4096
+
+        server = Server(('127.0.0.1', port), QuietHandler, allow_reuse_address=True)
+        server.set_app(WSGIHandler())
+        server.serve_forever()
+
+
+def seed():
+    from django.utils import timezone
+    from api.models import User, Appointment
+    from api.serializers import MyTokenObtainPairSerializer
+    from api.services import create_user
+
+    Appointment.objects.all().delete()
+    User.objects.filter(username__startswith='asgi-').delete()
+    doctors = [create_user(f'asgi-doc{i}', f'asgi-doc{i}@bench.test', None, role=User.DOCTOR) for i in range(20)]
+    patient = create_user('asgi-pat', 'asgi-pat@bench.test', None, role=User.PATIENT)
+    start = timezone.now() + timedelta(days=1)
+    Appointment.objects.bulk_create([
+        Appointment(doctor=doctors[i % 20], patient=patient, appointment_date=start + timedelta(hours=i), status='pending')
+        for i in range(500)
+    ])
+    return [str(MyTokenObtainPairSerializer.get_token(doctor).access_token) for doctor in doctors]
+
+
+async def client(port, token, deadline, latencies, errors, index):
+    reader = writer = None
+    i = index
+    while time.monotonic() < deadline:
+        path = PATHS[i % len(PATHS)]
+        i += 1
+        began = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write((f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {token}\r\n'
+                          f'Connection: keep-alive\r\n\r\n').encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length, keep_alive = 0, True
+            while (line := await reader.readline()) not in (b'\r\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+                elif name.lower() == 'connection' and value.strip().lower() == 'close':
+                    keep_alive = False
+            await reader.readexactly(length)
+            if not keep_alive:
+                writer.close()
+                reader = writer = None
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            errors.append(1)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        if status != 200:
+            errors.append(status)
+        latencies.append(time.perf_counter() - began)
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, tokens, clients, seconds):
+    latencies, errors = [], []
+    deadline = time.monotonic() + seconds
+    began = time.perf_counter()
+    await asyncio.gather(*(
+        client(port, tokens[i % len(tokens)], deadline, latencies, errors, i) for i in range(clients)
+    ))
+    elapsed = time.perf_counter() - began
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 1) if latencies else None
+    return {
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': pick(0.50),
+        'p99_ms': pick(0.99),
+        'errors': len(errors),
+    }
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_asgi.sqlite3')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve, args.db, args.port)
+
+    _django.setup(args.db)
+    tokens = seed()
+    results = {'clients': args.clients, 'seconds': args.seconds}
+    for kind in ('wsgi', 'asgi'):
+        port = free_port()
+        server = subprocess.Popen([sys.executable, __file__, '--serve', kind, '--db', args.db, '--port', str(port)])
+        try:
+            wait_for(port)
+            results[kind] = asyncio.run(load(port, tokens, args.clients, args.seconds))
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Concurrent booking load test.
+
+Starts the real WSGI application on a threaded HTTP server, then fires bookings from a
+thread pool. Requests deliberately collide: every request picks one of a few doctors and a
+start time on a 10-minute grid, while slots are 30 minutes long, so most of them overlap an
+existing booking (some exactly, most partially). Afterwards every doctor's active bookings
+are checked for overlaps.
+
+    python benchmarks/booking_load.py --requests 2000 --threads 32
+
+Exit status is non-zero if any double booking is found.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import _django
+
+
+def start_server():
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadedWSGIServer):
+        request_queue_size = 256  # The default backlog of 5 resets connections under load
+
+    server = Server(('127.0.0.1', 0), QuietHandler, allow_reuse_address=True)
+    server.set_app(WSGIHandler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_users(doctors, patients):
+    from django.utils import timezone
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from api.models import User, Appointment
+
+    Appointment.objects.all().delete()
+    User.objects.filter(username__startswith='load-').delete()
+    doctor_ids = [User.objects.create(username=f'load-doc{i}', email=f'load-doc{i}@bench.test', role=User.DOCTOR).pk
+                  for i in range(doctors)]
+    tokens = [str(RefreshToken.for_user(User.objects.create(
+        username=f'load-pat{i}', email=f'load-pat{i}@bench.test', role=User.PATIENT)).access_token)
+        for i in range(patients)]
+    start = (timezone.now() + timedelta(days=30)).replace(hour=9, minute=0, second=0, microsecond=0)
+    return doctor_ids, tokens, start
+
+
+def count_double_bookings(doctor_ids):
+    from api.models import User, Appointment
+    from api.scheduling import slot_length
+
+    overlaps = 0
+    for doctor in User.objects.filter(pk__in=doctor_ids).select_related('profile'):
+        length = slot_length(doctor)
+        starts = list(Appointment.objects.filter(doctor=doctor).exclude(status='canceled')
+                      .order_by('appointment_date').values_list('appointment_date', flat=True))
+        overlaps += sum(1 for a, b in zip(starts, starts[1:]) if b < a + length)
+    return overlaps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_booking_load.sqlite3')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--doctors', type=int, default=5)
+    parser.add_argument('--slots', type=int, default=100, help='Distinct 10-minute start times per doctor')
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    doctor_ids, tokens, start = make_users(args.doctors, 50)
+    server = start_server()
+    url = f'http://127.0.0.1:{server.server_port}/api/appointments/create/'
+    rng = random.Random(7)
+
+    def book(i):
+        body = json.dumps({
+            'doctor': rng.choice(doctor_ids),
+            'appointment_date': (start + timedelta(minutes=10 * rng.randrange(args.slots))).isoformat(),
+            'status': 'pending',
+        }).encode()
+        request = urllib.request.Request(url, body, {
+            'Content-Type': 'application/json', 'Authorization': f'Bearer {tokens[i % len(tokens)]}',
+        })
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status
+        except urllib.error.HTTPError as exc:
+            if exc.code >= 500:
+                print(exc.read()[:2000].decode(errors='replace'), file=sys.stderr)
+            return exc.code
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        statuses = Counter(pool.map(book, range(args.requests)))
+    elapsed = time.perf_counter() - began
+    server.shutdown()
+
+    double_bookings = count_double_bookings(doctor_ids)
+    print(json.dumps({
+        'requests': args.requests,
+        'threads': args.threads,
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(args.requests / elapsed, 1),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'double_bookings': double_bookings,
+    }, indent=2))
+    sys.exit(1 if double_bookings else 0)
+
+
+if __name__ == '__main__':
+    main()
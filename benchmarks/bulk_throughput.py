@@ -0,0 +1,66 @@
+"""
+Single-row vs bulk appointment writes.
+
+Creates the same number of appointments through POST /api/appointments/create/ (one
+request per row) and through one POST /api/appointments/bulk/, both via the in-process test
+client with a real JWT, and reports rows per second for each path.
+
+    python benchmarks/bulk_throughput.py --rows 1000
+"""
+import argparse
+import contextlib
+import io
+import json
+import time
+from datetime import timedelta
+
+import _django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_bulk.sqlite3')
+    parser.add_argument('--rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.test import Client
+    from django.utils import timezone
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from api.models import User, Appointment
+
+    Appointment.objects.all().delete()
+    User.objects.filter(username__startswith='bulk-').delete()
+    admin = User.objects.create(username='bulk-admin', email='bulk-admin@bench.test', role=User.ADMIN)
+    doctor = User.objects.create(username='bulk-doc', email='bulk-doc@bench.test', role=User.DOCTOR)
+    patient = User.objects.create(username='bulk-pat', email='bulk-pat@bench.test', role=User.PATIENT)
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(admin).access_token}')
+    start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+
+    def rows(offset):
+        return [{
+            'doctor': doctor.pk, 'patient': patient.pk, 'status': 'pending',
+            'appointment_date': (start + timedelta(days=offset, minutes=30 * i)).isoformat(),
+        } for i in range(args.rows)]
+
+    began = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # The create view still prints each request
+        for row in rows(0):
+            assert client.post('/api/appointments/create/', row, content_type='application/json').status_code == 201
+    single = time.perf_counter() - began
+
+    began = time.perf_counter()
+    response = client.post('/api/appointments/bulk/', {'create': rows(400)}, content_type='application/json')
+    bulk = time.perf_counter() - began
+    assert all(row['status'] == 201 for row in response.json()['create'])
+
+    print(json.dumps({
+        'rows': args.rows,
+        'single_rows_per_second': round(args.rows / single, 1),
+        'bulk_rows_per_second': round(args.rows / bulk, 1),
+        'speedup': round(single / bulk, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
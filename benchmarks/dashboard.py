@@ -0,0 +1,69 @@
+"""
+Dashboard latency over a large appointment table.
+
+Seeds --appointments appointments once per database file, then times GET /api/dashboard/
+for an admin, a doctor and a patient, once grouping the appointments on every request
+(HMS_DASHBOARD_SUMMARY off) and once reading the trigger-maintained summary table. Also
+times booking an appointment through the API with the summary triggers in place, since
+every write now pays for them. Reports median and p95 milliseconds.
+
+    python benchmarks/dashboard.py --appointments 1000000
+"""
+import argparse
+import json
+from datetime import timedelta
+
+import _django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=_django.DEFAULT_DB)
+    parser.add_argument('--appointments', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.conf import settings
+    from django.db.models import Max
+    from rest_framework.test import APIClient
+    import _seed
+    from api import seeding
+    from api.models import User, Appointment
+
+    _seed.seed(appointments=args.appointments)
+    callers = {
+        'admin': User.objects.filter(role=User.ADMIN).first(),
+        'doctor': User.objects.filter(role=User.DOCTOR).first(),
+        'patient': User.objects.filter(role=User.PATIENT).first(),
+    }
+    client = APIClient()
+    results = {'appointments': Appointment.objects.count()}
+    for summary in (False, True):
+        settings.HMS_DASHBOARD_SUMMARY = summary
+        for role, user in callers.items():
+            client.force_authenticate(user)
+            median, p95 = _django.timed(lambda: client.get('/api/dashboard/'), args.repeat)
+            results[f'{role}_{"summary" if summary else "group_by"}'] = {
+                'median_ms': round(median, 2), 'p95_ms': round(p95, 2)}
+
+    # Bookings in the free week after the last seeded appointment, one slot after another
+    client.force_authenticate(callers['patient'])
+    doctor = callers['doctor']
+    first_free = seeding.first_monday(
+        Appointment.objects.aggregate(last=Max('appointment_date'))['last'].date() + timedelta(days=7))
+    slots, offsets = iter(range(10 ** 6)), seeding.week_slots()
+
+    def book():
+        start = seeding.slot_start(first_free, offsets, next(slots))
+        response = client.post('/api/appointments/create/', {
+            'doctor': doctor.pk, 'appointment_date': start.isoformat(), 'status': 'pending'})
+        assert response.status_code == 201, response.content
+
+    median, p95 = _django.timed(book, args.repeat)
+    results['booking'] = {'median_ms': round(median, 2), 'p95_ms': round(p95, 2)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Appointment event streams: idle connection cost and delivery latency under ASGI.
+
+Serves the project on uvicorn from a child process (see asgi_load.py), opens
+--connections idle GET /api/appointments/events/ streams spread over --doctors doctors,
+and reports the server's resident memory before and after, per connection. Then a patient
+books --bookings appointments through POST /api/appointments/create/, one doctor after
+another, and every stream of the booked doctor must receive the event: reports the
+latency from sending the booking to each delivery, and checks that no other doctor's
+stream got it.
+
+Needs uvicorn (pip install uvicorn).
+
+    python benchmarks/events.py --connections 5000
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+import _django
+import asgi_load
+
+
+def rss_mb(pid):
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+
+
+def seed(doctors):
+    from django.core.management import call_command
+    from api import seeding
+    from api.models import User
+    from api.serializers import MyTokenObtainPairSerializer
+    from api.services import create_user
+
+    call_command('flush', interactive=False, verbosity=0)
+    doctors = [create_user(f'events-doc{i}', f'events-doc{i}@hms.test', None, role=User.DOCTOR) for i in range(doctors)]
+    patient = create_user('events-pat', 'events-pat@hms.test', None, role=User.PATIENT)
+
+    def token(user):
+        return str(MyTokenObtainPairSerializer.get_token(user).access_token)
+
+    from django.utils import timezone
+    first_free = seeding.first_monday(timezone.localdate() + timedelta(days=7))
+    return [(doctor.pk, token(doctor)) for doctor in doctors], token(patient), first_free, seeding.week_slots()
+
+
+async def subscribe(port, token):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET /api/appointments/events/?token={token} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.encode())
+    await writer.drain()
+    while b'event: ready' not in await reader.readline():
+        pass
+    return reader, writer
+
+
+async def next_event(reader):
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('stream closed')
+        if line.startswith(b'data: ') and b'"kind"' in line:
+            return json.loads(line[6:])
+
+
+async def book(port, token, doctor, start):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps({'doctor': doctor, 'appointment_date': start.isoformat(), 'status': 'pending'})
+    writer.write((f'POST /api/appointments/create/ HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {token}\r\n'
+                  f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n{body}')
+                 .encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    writer.close()
+    assert status == 201, status
+
+
+async def run(port, pid, doctors, patient_token, first_free, slots, connections, bookings):
+    before = rss_mb(pid)
+    streams = []
+    for begin in range(0, connections, 500):  # In waves, so the listen backlog keeps up
+        streams += await asyncio.gather(*(
+            subscribe(port, doctors[i % len(doctors)][1]) for i in range(begin, min(begin + 500, connections))))
+    await asyncio.sleep(1)
+    after = rss_mb(pid)
+
+    from api import seeding
+    latencies = []
+    for n in range(bookings):
+        k = n % len(doctors)
+        mine = [reader for i, (reader, _) in enumerate(streams) if i % len(doctors) == k]
+        began = time.perf_counter()
+        receive = [asyncio.ensure_future(next_event(reader)) for reader in mine]
+        await book(port, patient_token, doctors[k][0], seeding.slot_start(first_free, slots, n))
+        for done in asyncio.as_completed(receive):
+            assert (await done)['doctor'] == doctors[k][0]
+            latencies.append(time.perf_counter() - began)
+    # Every event was read by the stream it was meant for: any other is a stray
+    async def stray(reader):
+        try:
+            await asyncio.wait_for(next_event(reader), 0.5)
+            return 1
+        except asyncio.TimeoutError:
+            return 0
+    strays = sum(await asyncio.gather(*(stray(reader) for reader, _ in streams)))
+    for _, writer in streams:
+        writer.close()
+
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 1)
+    return {
+        'connections': connections,
+        'server_rss_mb': {'idle': round(before, 1), 'with_streams': round(after, 1),
+                          'per_connection_kb': round((after - before) * 1024 / connections, 1)},
+        'deliveries': len(latencies),
+        'delivery_ms': {'p50': pick(0.5), 'p99': pick(0.99), 'max': pick(1)},
+        'stray_events': strays,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_events.sqlite3')
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--doctors', type=int, default=20)
+    parser.add_argument('--bookings', type=int, default=40)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    doctors, patient_token, first_free, slots = seed(args.doctors)
+    port = asgi_load.free_port()
+    server = subprocess.Popen([sys.executable, asgi_load.__file__, '--serve', 'asgi', '--db', args.db,
+                               '--port', str(port)])
+    try:
+        asgi_load.wait_for(port)
+        results = asyncio.run(run(port, server.pid, doctors, patient_token, first_free, slots, args.connections,
+                                  args.bookings))
+    finally:
+        server.terminate()
+        server.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Streaming export throughput and memory over a large appointment table.
+
+Streams GET /api/appointments/export/ as CSV and as NDJSON for an admin (every
+appointment) and reports rows per second and how far the process's peak resident memory
+rose while doing so. For comparison it then serializes --materialize appointments the
+way the list view does, all at once through AppointmentSerializer and the JSON renderer,
+and reports the same. Run it in a fresh process: peak memory only ever goes up, so the
+exports are measured first.
+
+Seed the database once with many appointments, e.g.
+
+    python manage.py seed_hms --appointments 5000000 --patients 200000 --doctors 1000 --future-days 365
+    python benchmarks/export.py --db /tmp/hms_export.sqlite3
+"""
+import argparse
+import json
+import resource
+import time
+
+import _django
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Kilobytes on Linux
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=_django.DEFAULT_DB)
+    parser.add_argument('--materialize', type=int, default=200_000,
+                        help='Appointments to serialize in memory for the comparison.')
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIClient
+    from api.models import User, Appointment
+    from api.serializers import AppointmentSerializer
+    from api.views import visible_appointments
+
+    admin = User.objects.filter(role=User.ADMIN).first()
+    client = APIClient()
+    client.force_authenticate(admin)
+    results = {'appointments': Appointment.objects.count(), 'baseline_peak_mb': round(peak_mb(), 1)}
+
+    for format in ('csv', 'ndjson'):
+        before = peak_mb()
+        began = time.perf_counter()
+        response = client.get('/api/appointments/export/', {'format': format})
+        rows = size = 0
+        for chunk in response.streaming_content:
+            rows += chunk.count(b'\n')
+            size += len(chunk)
+        seconds = time.perf_counter() - began
+        rows -= format == 'csv'  # The header
+        results[format] = {
+            'rows': rows, 'mb': round(size / 2 ** 20, 1), 'seconds': round(seconds, 1),
+            'rows_per_second': round(rows / seconds), 'peak_rise_mb': round(peak_mb() - before, 1),
+        }
+
+    before = peak_mb()
+    began = time.perf_counter()
+    appointments = visible_appointments(admin).order_by('appointment_date', 'id')[:args.materialize]
+    body = JSONRenderer().render(AppointmentSerializer(appointments, many=True).data)
+    seconds = time.perf_counter() - began
+    results['materialized'] = {
+        'rows': args.materialize, 'mb': round(len(body) / 2 ** 20, 1), 'seconds': round(seconds, 1),
+        'rows_per_second': round(args.materialize / seconds), 'peak_rise_mb': round(peak_mb() - before, 1),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Bulk user import against one registration at a time.
+
+Generates --users users as CSV, then times creating them three ways, on an empty database
+each time: --register of them through RegisterSerializer one by one (what POST
+/api/register/ does per request), all of them with `manage.py import_users` hashing in the
+importing process (--workers 1), and all of them hashing in a pool of --workers processes.
+Passwords use the project's real hasher, which dominates: expect the pool to scale with
+the cores available and the rest to be the same on a single core. --cheap-hashes switches
+to the MD5 hasher to time everything but the hashing. Reports users per second.
+
+    python benchmarks/import_users.py --users 400 --workers 4
+    python benchmarks/import_users.py --users 20000 --register 2000 --cheap-hashes
+"""
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+
+import _django
+
+PASSWORD = 'Import-bench-2024!'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_import.sqlite3')
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--register', type=int, default=40, help='Users created one by one for comparison.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--cheap-hashes', action='store_true', help='Hash with MD5, to time the rest.')
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.conf import settings
+    if args.cheap_hashes:
+        settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    from io import StringIO
+    from django.core.management import call_command
+    from api.models import User
+    from api.serializers import RegisterSerializer
+
+    rows = [{'username': f'hms{i:07d}', 'email': f'hms{i:07d}@hms.test', 'password': PASSWORD,
+             'role': User.DOCTOR if i % 10 == 0 else User.PATIENT, 'first_name': 'Test', 'last_name': f'User{i}',
+             'date_of_birth': '1980-01-01'} for i in range(args.users)]
+    source = tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False)
+    with source:
+        writer = csv.DictWriter(source, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    results = {'users': args.users, 'cpus': os.cpu_count()}
+    try:
+        call_command('flush', interactive=False, verbosity=0)
+        began = time.perf_counter()
+        for row in rows[:args.register]:
+            serializer = RegisterSerializer(data={**row, 'password2': row['password']})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        seconds = time.perf_counter() - began
+        results['register_one_by_one'] = {'users': args.register, 'users_per_second': round(args.register / seconds, 2)}
+
+        for name, workers in (('import_in_process', 1), (f'import_{args.workers}_workers', args.workers)):
+            call_command('flush', interactive=False, verbosity=0)
+            began = time.perf_counter()
+            call_command('import_users', source.name, workers=workers, stdout=StringIO(), stderr=StringIO())
+            seconds = time.perf_counter() - began
+            assert User.objects.count() == args.users
+            results[name] = {'users': args.users, 'users_per_second': round(args.users / seconds, 2)}
+    finally:
+        os.unlink(source.name)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
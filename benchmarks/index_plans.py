@@ -0,0 +1,91 @@
+"""
+Query plans and latency of the hot appointment/user queries, before and after the
+indexes added in api/migrations/0005_appointment_and_role_indexes.py.
+
+    python benchmarks/index_plans.py --appointments 1000000
+
+"Before" is measured by migrating the api app back to 0004, "after" by migrating forward
+again, so the comparison uses exactly the schema each migration produces.
+"""
+import argparse
+import json
+
+import _django
+
+
+def hot_queries():
+    from django.db.models import Q
+    from api.models import User, Appointment
+
+    doctor = User.objects.filter(role=User.DOCTOR).order_by('id')[10]
+    patient = User.objects.filter(role=User.PATIENT).order_by('id')[10]
+    probe = Appointment.objects.filter(doctor=doctor).order_by('appointment_date')[100]
+    when = probe.appointment_date
+    return {
+        'conflict_check': lambda: Appointment.objects.filter(doctor=doctor, appointment_date=when).exists(),
+        'doctor_page': lambda: list(
+            Appointment.objects.filter(doctor=doctor).filter(Q(appointment_date__gte=when) & (
+                Q(appointment_date__gt=when) | Q(appointment_date=when, id__gt=probe.id)
+            )).order_by('appointment_date', 'id')[:51]
+        ),
+        'patient_page': lambda: list(Appointment.objects.filter(patient=patient).order_by('appointment_date', 'id')[:51]),
+        'admin_page': lambda: list(
+            Appointment.objects.filter(appointment_date__gte=when).order_by('appointment_date', 'id')[:51]
+        ),
+        'status_page': lambda: list(
+            Appointment.objects.filter(status='pending').order_by('appointment_date', 'id')[:51]
+        ),
+        'doctor_pending_queue': lambda: list(
+            Appointment.objects.filter(doctor=doctor, status='pending').order_by('appointment_date')[:51]
+        ),
+        'doctor_directory': lambda: list(User.objects.filter(role=User.DOCTOR).order_by('id')[:51]),
+        'role_lookup': lambda: User.objects.filter(pk=doctor.pk, role=User.DOCTOR).exists(),
+    }
+
+
+def explain(fn):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as ctx:
+        fn()
+    sql = ctx.captured_queries[-1]['sql']
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return ' | '.join(row[-1] for row in cursor.fetchall())
+
+
+def measure(repeat):
+    results = {}
+    for name, fn in hot_queries().items():
+        median, p95 = _django.timed(fn, repeat)
+        results[name] = {'median_ms': round(median, 3), 'p95_ms': round(p95, 3), 'plan': explain(fn)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=_django.DEFAULT_DB)
+    parser.add_argument('--appointments', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.core.management import call_command
+    from django.db import connection
+    import _seed
+
+    _seed.seed(appointments=args.appointments)
+
+    call_command('migrate', 'api', '0004', verbosity=0)
+    connection.cursor().execute('ANALYZE')
+    before = measure(args.repeat)
+    call_command('migrate', verbosity=0)
+    connection.cursor().execute('ANALYZE')
+    after = measure(args.repeat)
+
+    print(json.dumps({'appointments': args.appointments, 'before': before, 'after': after}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+What the request metrics of api/metrics.py cost.
+
+Seeds a modest data set once per database file, then times, through the whole middleware
+stack, GET /api/appointments/ (a page of --page-size rows for an admin) and GET /api/doctors/
+(served from the read cache, so mostly middleware: the worst case for relative overhead),
+with HMS_METRICS_SAMPLE_RATE at 0 (off), 0.1 (the default) and 1 (every request). The rates
+are interleaved round by round so drift in the machine affects them alike. Reports median
+and p95 milliseconds per rate and the median overhead against 0.
+
+    python benchmarks/metrics_overhead.py --repeat 2000
+"""
+import argparse
+import json
+
+import _django
+
+RATES = (0.0, 0.1, 1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_metrics.sqlite3')
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--page-size', type=int, default=20)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.conf import settings
+    from rest_framework.test import APIClient
+    from _seed import seed
+    from api.models import User
+
+    seed(doctors=50, patients=2000, appointments=50_000)
+    client = APIClient()
+    client.force_authenticate(User.objects.get(username='admin0'))
+    endpoints = {
+        'appointment_list': ('/api/appointments/', {'page_size': args.page_size}),
+        'doctor_list': ('/api/doctors/', {'page_size': args.page_size}),
+    }
+
+    results = {}
+    for label, (url, params) in endpoints.items():
+        samples = {rate: [] for rate in RATES}
+        for _ in range(args.rounds):
+            for rate in RATES:
+                settings.HMS_METRICS_SAMPLE_RATE = rate
+                samples[rate].append(_django.timed(lambda: client.get(url, params), args.repeat // args.rounds))
+        results[label] = {}
+        for rate in RATES:
+            medians = sorted(median for median, _ in samples[rate])
+            p95s = sorted(p95 for _, p95 in samples[rate])
+            results[label][f'rate_{rate}'] = {
+                'median_ms': round(medians[len(medians) // 2], 3), 'p95_ms': round(p95s[len(p95s) // 2], 3),
+            }
+        base = results[label]['rate_0.0']['median_ms']
+        for rate in RATES[1:]:
+            entry = results[label][f'rate_{rate}']
+            entry['overhead_pct'] = round((entry['median_ms'] - base) / base * 100, 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
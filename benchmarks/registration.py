@@ -0,0 +1,73 @@
+"""
+User registration and last-login update cost.
+
+Registers users through POST /api/register/ and then records a login for each of them with
+django.contrib.auth.models.update_last_login (what the token view does with UPDATE_LAST_LOGIN
+on, and what session logins always do). Reports writes per operation and operations per
+second. Password hashing dominates a real registration, so it is swapped for a fast hasher
+unless --real-hasher is given; the numbers then reflect the database work.
+
+    python benchmarks/registration.py --users 500
+"""
+import argparse
+import json
+import time
+
+import _django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_registration.sqlite3')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--real-hasher', action='store_true')
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    if not args.real_hasher:
+        from django.conf import settings
+        from django.contrib.auth.hashers import get_hashers
+        settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+        get_hashers.cache_clear()
+    from django.contrib.auth.models import update_last_login
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from api.models import User
+
+    User.objects.filter(username__startswith='reg-').delete()
+    client = Client()
+
+    def writes(queries):
+        return sum(1 for query in queries if not query['sql'].lstrip().upper().startswith('SELECT'))
+
+    began = time.perf_counter()
+    with CaptureQueriesContext(connection) as registering:
+        for i in range(args.users):
+            response = client.post('/api/register/', {
+                'username': f'reg-{i}', 'email': f'reg-{i}@bench.test', 'password': 'bench-pass', 'password2': 'bench-pass',
+                'role': 'patient',
+            }, content_type='application/json')
+            assert response.status_code == 201, response.content
+    register_seconds = time.perf_counter() - began
+
+    users = list(User.objects.filter(username__startswith='reg-'))
+    began = time.perf_counter()
+    with CaptureQueriesContext(connection) as logging_in:
+        for user in users:
+            update_last_login(None, user)
+    login_seconds = time.perf_counter() - began
+
+    print(json.dumps({
+        'users': args.users,
+        'registrations_per_second': round(args.users / register_seconds, 1),
+        'queries_per_registration': round(len(registering) / args.users, 2),
+        'writes_per_registration': round(writes(registering) / args.users, 2),
+        'last_logins_per_second': round(len(users) / login_seconds, 1),
+        'queries_per_last_login': round(len(logging_in) / len(users), 2),
+        'writes_per_last_login': round(writes(logging_in) / len(users), 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
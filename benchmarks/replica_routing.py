@@ -0,0 +1,71 @@
+"""
+Read routing and read-your-writes against two SQLite stand-ins.
+
+Migrates a primary SQLite file, adds two users and copies it as the "replica", which then
+never catches up, so every read that lands on it is visibly stale. A patient books through
+POST /api/appointments/create/ and lists their appointments right away (pinned to the
+primary), another user lists theirs (replica), and the patient lists again once the pin has
+expired (replica). Also times a list read served by the replica.
+
+    python benchmarks/replica_routing.py
+"""
+import argparse
+import json
+import os
+import shutil
+from datetime import timedelta
+from pathlib import Path
+
+import _django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_primary.sqlite3')
+    parser.add_argument('--replica', default='/tmp/hms_replica.sqlite3')
+    args = parser.parse_args()
+
+    for path in (args.db, args.replica):
+        Path(path).unlink(missing_ok=True)
+    os.environ['HMS_DB_REPLICA_NAME'] = args.replica  # Read when settings load
+    _django.setup(args.db)
+
+    from django.test import Client
+    from django.utils import timezone
+    from api.cache import get_cache
+    from api.models import User
+    from api.routers import pin_key
+    from api.serializers import MyTokenObtainPairSerializer
+    from api.services import create_user
+
+    doctor = create_user('route-doc', 'route-doc@bench.test', None, role=User.DOCTOR)
+    patient = create_user('route-pat', 'route-pat@bench.test', None, role=User.PATIENT)
+    # The replica starts as a copy with the same users; from here on it is frozen
+    shutil.copyfile(args.db, args.replica)
+
+    def client_for(user):
+        return Client(HTTP_AUTHORIZATION=f'Bearer {MyTokenObtainPairSerializer.get_token(user).access_token}')
+
+    def visible(client):
+        return len(client.get('/api/appointments/').json()['results'])
+
+    patient_client, doctor_client = client_for(patient), client_for(doctor)
+    response = patient_client.post('/api/appointments/create/', {
+        'doctor': doctor.pk, 'status': 'pending',
+        'appointment_date': (timezone.now() + timedelta(days=3)).isoformat(),
+    }, content_type='application/json')
+    assert response.status_code == 201, response.content
+
+    results = {
+        'writer_right_after_booking': visible(patient_client),  # 1: pinned to the primary
+        'other_user': visible(doctor_client),  # 0: replica, which never saw the booking
+    }
+    get_cache().delete(pin_key(patient.pk))  # What HMS_REPLICA_PIN_SECONDS does on its own
+    results['writer_after_pin_expired'] = visible(patient_client)  # 0: back on the replica
+    median, p95 = _django.timed(lambda: doctor_client.get('/api/appointments/'), repeat=200)
+    results['replica_list_median_ms'] = round(median, 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
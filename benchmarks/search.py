@@ -0,0 +1,96 @@
+"""
+Profile search latency at scale.
+
+Seeds --profiles users (2% doctors) with generated names, specializations and medical
+histories, once per database file, then times GET /api/search/ end to end for a mix of
+queries: a full name, a three-letter prefix, a misspelt name, a specialization searched by
+a patient, and a diagnosis shared by a large share of patients searched by a doctor.
+Reports median and p95 milliseconds per query.
+
+    python benchmarks/search.py --profiles 500000
+"""
+import argparse
+import json
+import random
+
+import _django
+
+SYLLABLES = ['an', 'ber', 'cal', 'dor', 'el', 'fin', 'gar', 'hol', 'is', 'jon', 'kel', 'lin', 'mar', 'nor',
+             'ol', 'per', 'quin', 'ros', 'san', 'tor', 'ul', 'ver', 'wil', 'yan', 'zel']
+SPECIALIZATIONS = ['Cardiology', 'Neurology', 'Dermatology', 'Pediatrics', 'Oncology', 'Orthopedics',
+                   'Radiology', 'Psychiatry', 'Urology', 'Gastroenterology', 'Endocrinology', 'Nephrology']
+CONDITIONS = ['asthma', 'diabetes', 'hypertension', 'allergy', 'migraine', 'fracture', 'arthritis', 'anemia',
+              'bronchitis', 'eczema', 'gout', 'insomnia', 'obesity', 'psoriasis', 'sinusitis', 'tonsillitis']
+
+
+def name(rng, parts):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(parts)).title()
+
+
+def seed(count):
+    from django.db import transaction
+    from api.models import User, Profile
+
+    if Profile.objects.count() >= count:
+        return
+    rng = random.Random(7)
+    firsts = [name(rng, 2) for _ in range(2000)]
+    lasts = [name(rng, 3) for _ in range(40000)]
+    with transaction.atomic():
+        Profile.objects.all().delete()
+        User.objects.all().delete()
+        for start in range(0, count, 10000):
+            users = User.objects.bulk_create([
+                User(username=f'user{i}', email=f'user{i}@bench.test', password='!',
+                     role=User.DOCTOR if i % 50 == 0 else User.PATIENT)
+                for i in range(start, min(start + 10000, count))
+            ])
+            # The index triggers fire on these inserts
+            Profile.objects.bulk_create([
+                Profile(
+                    user=user, first_name=rng.choice(firsts), last_name=rng.choice(lasts),
+                    specialization=rng.choice(SPECIALIZATIONS) if user.role == User.DOCTOR else None,
+                    medical_history=None if user.role == User.DOCTOR else
+                    f'History of {" and ".join(rng.sample(CONDITIONS, 2))}.',
+                )
+                for user in users
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_search.sqlite3')
+    parser.add_argument('--profiles', type=int, default=500_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from rest_framework.test import APIClient
+    from api.models import User, Profile
+
+    seed(args.profiles)
+    doctor = User.objects.filter(role=User.DOCTOR).first()
+    patient = User.objects.filter(role=User.PATIENT).first()
+    sample = Profile.objects.filter(user__role=User.PATIENT).order_by('-id').first()
+    last = sample.last_name.lower()
+    typo = last[:3] + last[4] + last[3] + last[5:]  # Fourth and fifth letters swapped
+    queries = {
+        'full_name': (doctor, f'{sample.first_name} {sample.last_name}'),
+        'prefix': (doctor, last[:3]),
+        'misspelt_name': (doctor, typo),
+        'specialization_by_patient': (patient, 'cardiolo'),
+        'common_diagnosis_by_doctor': (doctor, 'asthma'),
+    }
+
+    client = APIClient()
+    results = {'profiles': Profile.objects.count()}
+    for label, (user, q) in queries.items():
+        client.force_authenticate(user)
+        hits = len(client.get('/api/search/', {'q': q}).data['results'])
+        median, p95 = _django.timed(lambda: client.get('/api/search/', {'q': q}), args.repeat)
+        results[label] = {'q': q, 'results': hits, 'median_ms': round(median, 2), 'p95_ms': round(p95, 2)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+List serialization throughput: DRF serializers against their precompiled plans (api/plans.py).
+
+For the full and compact appointment rows and the full and compact user rows, reads
+--rows rows and reports rows per second two ways each:
+
+- serialize: turning rows already in memory into dicts, model instances through the
+  serializer against values_list() tuples through the plan;
+- end to end: the query, the serialization and JSON rendering.
+
+It also checks that both give the same JSON. Any seeded database works, e.g. the one
+benchmarks/export.py uses:
+
+    python benchmarks/serialization.py --db /tmp/hms_export.sqlite3
+"""
+import argparse
+import json
+import time
+
+import _django
+
+
+def rate(fn, rows, repeat):
+    best = min(timed(fn) for _ in range(repeat))
+    return round(rows / best)
+
+
+def timed(fn):
+    began = time.perf_counter()
+    fn()
+    return time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=_django.DEFAULT_DB)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from rest_framework.renderers import JSONRenderer
+    from api import plans
+    from api.models import User, Appointment
+    from api.serializers import (AppointmentSerializer, AppointmentSummarySerializer, UserSerializer,
+                                 UserSummarySerializer)
+
+    appointments = AppointmentSerializer.setup_eager_loading(Appointment.objects.order_by('appointment_date', 'id'))
+    users = UserSerializer.setup_eager_loading(User.objects.order_by('id'))
+    cases = [
+        ('appointments (full)', AppointmentSerializer, appointments, ('appointment_date', 'id')),
+        ('appointments (compact)', AppointmentSummarySerializer, appointments, ('appointment_date', 'id')),
+        ('users (full)', UserSerializer, users, ('id',)),
+        ('users (compact)', UserSummarySerializer, users, ('id',)),
+    ]
+    render = JSONRenderer().render
+    results = {'rows': args.rows}
+    for name, serializer_class, queryset, ordering in cases:
+        plan = plans.plan(serializer_class, *ordering)
+        queryset = queryset[:args.rows]
+        rows = plan.queryset(queryset)
+        instances, tuples = list(queryset), list(rows)
+        assert render(serializer_class(instances, many=True).data) == render(plan.serialize(tuples))
+
+        serializer = {
+            'serialize': rate(lambda: serializer_class(instances, many=True).data, len(instances), args.repeat),
+            'end_to_end': rate(lambda: render(serializer_class(list(queryset.all()), many=True).data),
+                               len(instances), args.repeat),
+        }
+        planned = {
+            'serialize': rate(lambda: plan.serialize(tuples), len(tuples), args.repeat),
+            'end_to_end': rate(lambda: render(plan.serialize(rows.all())), len(tuples), args.repeat),
+        }
+        results[name] = {
+            'serializer_rows_per_s': serializer,
+            'plan_rows_per_s': planned,
+            'speedup': {key: round(planned[key] / serializer[key], 1) for key in planned},
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Sustained mixed read/write load on SQLite, with or without the high-throughput profile.
+
+Starts the real WSGI application on a threaded HTTP server and, for --seconds, keeps
+--writers threads booking appointments (each on its own doctor's free slots, so every
+booking should succeed) and updating their own profile, while --readers threads list
+appointments. Reports per-kind throughput and status counts; any 5xx (e.g. "database is
+locked") is counted as an error and makes the exit status non-zero.
+
+    python benchmarks/sqlite_profile.py            # stock settings
+    python benchmarks/sqlite_profile.py --fast     # HMS_SQLITE_FAST=1
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+import _django
+from booking_load import start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_sqlite_profile.sqlite3')
+    parser.add_argument('--fast', action='store_true')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--readers', type=int, default=16)
+    args = parser.parse_args()
+
+    for suffix in ('', '-wal', '-shm'):
+        Path(args.db + suffix).unlink(missing_ok=True)  # Journal mode sticks to the file
+    os.environ['HMS_SQLITE_FAST'] = '1' if args.fast else '0'  # Read when settings load
+    _django.setup(args.db)
+    from django.utils import timezone
+    from api.models import User
+    from api.serializers import MyTokenObtainPairSerializer
+    from api.services import create_user
+
+    def token(user):
+        return str(MyTokenObtainPairSerializer.get_token(user).access_token)
+
+    doctors = [create_user(f'sq-doc{i}', f'sq-doc{i}@bench.test', None, role=User.DOCTOR) for i in range(args.writers)]
+    patients = [create_user(f'sq-pat{i}', f'sq-pat{i}@bench.test', None, role=User.PATIENT) for i in range(args.writers)]
+    readers = [token(create_user(f'sq-read{i}', f'sq-read{i}@bench.test', None, role=User.ADMIN)) for i in range(args.readers)]
+    start = (timezone.now() + timedelta(days=30)).replace(minute=0, second=0, microsecond=0)
+    server = start_server()
+    base = f'http://127.0.0.1:{server.server_port}/api'
+
+    counts = Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+
+    def call(kind, method, path, bearer, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(f'{base}{path}', data, method=method, headers={
+            'Content-Type': 'application/json', 'Authorization': f'Bearer {bearer}',
+        })
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                code = response.status
+        except urllib.error.HTTPError as exc:
+            code = exc.code
+            if code >= 500:
+                print(exc.read()[:500].decode(errors='replace'), file=sys.stderr)
+        with lock:
+            counts[(kind, code)] += 1
+
+    def write_loop(i):
+        bearer, doctor = token(patients[i]), doctors[i]
+        n = 0
+        while time.monotonic() < deadline:
+            slot = start + timedelta(minutes=30 * n)
+            call('booking', 'POST', '/appointments/create/', bearer, {
+                'doctor': doctor.pk, 'appointment_date': slot.isoformat(), 'status': 'pending',
+            })
+            call('profile', 'PUT', '/profile/', bearer, {'user': patients[i].pk, 'address': f'{n} Main St'})
+            n += 1
+
+    def read_loop(i):
+        while time.monotonic() < deadline:
+            call('read', 'GET', '/appointments/?page_size=50', readers[i])
+
+    threads = [threading.Thread(target=write_loop, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=read_loop, args=(i,)) for i in range(args.readers)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    server.shutdown()
+
+    errors = sum(count for (_, code), count in counts.items() if code >= 500)
+    per_kind = Counter()
+    for (kind, _), count in counts.items():
+        per_kind[kind] += count
+    print(json.dumps({
+        'profile': 'fast' if args.fast else 'stock',
+        'seconds': round(elapsed, 2),
+        'per_second': {kind: round(count / elapsed, 1) for kind, count in sorted(per_kind.items())},
+        'statuses': {f'{kind} {code}': count for (kind, code), count in sorted(counts.items())},
+        'errors': errors,
+    }, indent=2))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
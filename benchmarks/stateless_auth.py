@@ -0,0 +1,61 @@
+"""
+Per-request database work of JWT authentication, with and without the stateless mode.
+
+Calls GET /api/appointments/ and GET /api/doctors/ with a real access token through the
+in-process test client, once with HMS_STATELESS_AUTH off (User row loaded per request) and
+once with it on (claims-backed user, auth state from the in-process TTL cache), and reports
+queries per request and latency for each.
+
+    python benchmarks/stateless_auth.py --requests 500
+"""
+import argparse
+import json
+from datetime import timedelta
+
+import _django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_auth.sqlite3')
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+    from api.models import User, Appointment
+    from api.serializers import MyTokenObtainPairSerializer
+
+    User.objects.filter(username__startswith='auth-').delete()
+    doctor = User.objects.create(username='auth-doc', email='auth-doc@bench.test', role=User.DOCTOR)
+    patient = User.objects.create(username='auth-pat', email='auth-pat@bench.test', role=User.PATIENT)
+    start = timezone.now() + timedelta(days=1)
+    Appointment.objects.bulk_create([
+        Appointment(doctor=doctor, patient=patient, appointment_date=start + timedelta(hours=i), status='pending')
+        for i in range(50)
+    ])
+    token = MyTokenObtainPairSerializer.get_token(doctor).access_token
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    results = {}
+    for stateless in (False, True):
+        settings.HMS_STATELESS_AUTH = stateless
+        mode = 'stateless' if stateless else 'database'
+        for path in ('/api/appointments/', '/api/doctors/'):
+            client.get(path)  # Warm the auth-state and response caches
+            with CaptureQueriesContext(connection) as queries:
+                median, p95 = _django.timed(lambda: client.get(path), repeat=args.requests)
+            results[f'{mode} {path}'] = {
+                'queries_per_request': round(len(queries) / args.requests, 2),
+                'median_ms': round(median, 2),
+                'p95_ms': round(p95, 2),
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
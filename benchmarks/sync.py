@@ -0,0 +1,77 @@
+"""
+Delta sync against refetching everything, over a large appointment table.
+
+For a doctor and for an admin, compares bringing a client up to date after --changes
+appointment edits two ways: walking every page of GET /api/appointments/ (what the
+screens do on mount; the admin walk stops after --admin-pages pages), and one GET
+/api/appointments/changes/ with the token of the previous sync. Reports milliseconds and
+response bytes. The database needs many appointments, e.g. the one benchmarks/export.py
+uses:
+
+    python benchmarks/sync.py --db /tmp/hms_export.sqlite3
+"""
+import argparse
+import json
+import time
+from datetime import timedelta
+
+import _django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=_django.DEFAULT_DB)
+    parser.add_argument('--changes', type=int, default=10)
+    parser.add_argument('--admin-pages', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    began = time.perf_counter()
+    _django.setup(args.db)  # Adds the updated_at index on first use
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from api import sync
+    from api.models import User, Appointment
+
+    results = {'appointments': Appointment.objects.count(), 'setup_seconds': round(time.perf_counter() - began, 1)}
+    client = APIClient()
+    for role, pages in (('doctor', None), ('admin', args.admin_pages)):
+        user = User.objects.filter(role=role).order_by('id').first()
+        client.force_authenticate(user)
+
+        def refetch():
+            url, size, count = '/api/appointments/?page_size=200', 0, 0
+            while url and (pages is None or count < pages):
+                response = client.get(url)
+                size += len(response.content)
+                url, count = response.data['next'], count + 1
+            return size
+
+        began = time.perf_counter()
+        full_bytes = refetch()
+        full_ms = (time.perf_counter() - began) * 1000
+
+        # A client that was caught up a minute ago, then a few appointments change
+        caught_up = timezone.now() - timedelta(minutes=1)
+        token = sync.encode((caught_up, 0), caught_up)
+        mine = Appointment.objects.filter(**({'doctor': user} if role == 'doctor' else {}))
+        ids = list(mine.order_by('-appointment_date').values_list('id', flat=True)[:args.changes])
+        Appointment.objects.filter(pk__in=ids).update(reason='Rescheduled by phone', updated_at=timezone.now())
+        sizes = []
+
+        def delta():
+            response = client.get('/api/appointments/changes/', {'since': token})
+            sizes.append(len(response.content))
+            assert len(response.data['changed']) >= args.changes, response.data
+
+        median, p95 = _django.timed(delta, args.repeat)
+        results[role] = {
+            'refetch': {'pages': pages or 'all', 'ms': round(full_ms, 1), 'bytes': full_bytes},
+            'delta': {'changed': args.changes, 'median_ms': round(median, 2), 'p95_ms': round(p95, 2),
+                      'bytes': sizes[0]},
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Background task queue: what a booking pays for its side effects, and worker throughput.
+
+First books --bookings appointments through POST /api/appointments/create/ three ways:
+with no side effects at all (the task receivers disconnected), with the side effects
+enqueued as tasks (the default), and with them run inline, i.e. the queued tasks handled
+before the response returns, which is what doing the work in the request would cost.
+Reports the median and p95 booking latency of each.
+
+Then enqueues --tasks audit tasks and drains them with `run_tasks`' worker threads, once
+claiming one task at a time and once in batches of --batch-size, and reports tasks/s.
+
+    python benchmarks/task_queue.py --bookings 300 --tasks 20000
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import timedelta
+
+import _django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_tasks.sqlite3')
+    parser.add_argument('--bookings', type=int, default=300)
+    parser.add_argument('--tasks', type=int, default=20_000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.db.models.signals import post_save, post_delete
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from api import tasks
+    from api.models import User, Appointment, AppointmentAudit, Notification, Task
+    from api.services import create_user
+
+    Appointment.objects.all().delete()
+    Task.objects.all().delete()
+    AppointmentAudit.objects.all().delete()
+    Notification.objects.all().delete()
+    User.objects.filter(username__startswith='tq-').delete()
+    doctor = create_user('tq-doc', 'tq-doc@bench.test', None, role=User.DOCTOR)
+    patient = create_user('tq-pat', 'tq-pat@bench.test', None, role=User.PATIENT)
+    client = APIClient()
+    client.force_authenticate(patient)
+    start = timezone.now().replace(microsecond=0) + timedelta(days=2)
+    slots = iter(range(10 ** 6))
+
+    def book(after=None):
+        began = time.perf_counter()
+        response = client.post('/api/appointments/create/', {
+            'doctor': doctor.pk, 'appointment_date': (start + timedelta(minutes=30 * next(slots))).isoformat(),
+            'status': 'pending',
+        })
+        assert response.status_code == 201, response.content
+        if after:
+            after()
+        return (time.perf_counter() - began) * 1000
+
+    def inline():
+        Task.objects.update(run_after=timezone.now())  # Reminders included
+        tasks.Worker().run_once()
+
+    def measure(after=None):
+        samples = sorted(book(after) for _ in range(args.bookings))
+        return {'median_ms': round(samples[len(samples) // 2], 2), 'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 2)}
+
+    results = {'bookings': args.bookings}
+    post_save.disconnect(tasks.appointment_saved, sender=Appointment)
+    results['no_side_effects'] = measure()
+    post_save.connect(tasks.appointment_saved, sender=Appointment)
+    results['enqueued'] = measure()
+    Task.objects.all().delete()
+    results['inline'] = measure(after=inline)
+
+    Task.objects.all().delete()
+    appointment = Appointment.objects.first()
+    payload = {'appointment': appointment.pk, 'action': 'updated', 'status': 'pending',
+               'appointment_date': appointment.appointment_date.isoformat(), 'changed_at': timezone.now().isoformat()}
+    for batch_size in (1, args.batch_size):
+        AppointmentAudit.objects.all().delete()
+        tasks.enqueue_many([tasks.task('audit', payload) for _ in range(args.tasks)])
+        began = time.perf_counter()
+        threads = tasks.start_workers(args.workers, threading.Event(), batch_size=batch_size, drain=True)
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - began
+        assert not Task.objects.exists() and AppointmentAudit.objects.count() == args.tasks
+        results[f'drain_batch_{batch_size}'] = {'workers': args.workers, 'tasks_per_second': round(args.tasks / seconds, 1)}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
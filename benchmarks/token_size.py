@@ -0,0 +1,58 @@
+"""
+Access-token size and authentication cost, compact vs full claims.
+
+Issues an access token for a patient with a long medical history in each mode
+(HMS_COMPACT_TOKENS on and off) and reports the Authorization header size, the time to issue
+the token pair, and the time JWTAuthentication.authenticate spends decoding and verifying
+the token (the User lookup is included, as in production).
+
+    python benchmarks/token_size.py --history-bytes 4000
+"""
+import argparse
+import json
+
+import _django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='/tmp/hms_auth.sqlite3')
+    parser.add_argument('--history-bytes', type=int, default=4000)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.conf import settings
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from api.models import User
+    from api.serializers import MyTokenObtainPairSerializer
+    from api.services import create_user, update_profile
+
+    User.objects.filter(username='token-pat').delete()
+    patient = create_user('token-pat', 'token-pat@bench.test', None, role=User.PATIENT)
+    update_profile(patient.profile, {
+        'first_name': 'Ann', 'last_name': 'Example', 'medical_history': 'h' * args.history_bytes,
+    })
+    authentication = JWTAuthentication()
+    factory = APIRequestFactory()
+
+    results = {}
+    for compact in (True, False):
+        settings.HMS_COMPACT_TOKENS = compact
+        header = f'Bearer {MyTokenObtainPairSerializer.get_token(patient).access_token}'
+        request = Request(factory.get('/api/appointments/', HTTP_AUTHORIZATION=header))
+        issue_median, _ = _django.timed(lambda: str(MyTokenObtainPairSerializer.get_token(patient).access_token), args.repeat)
+        auth_median, auth_p95 = _django.timed(lambda: authentication.authenticate(request), args.repeat)
+        results['compact' if compact else 'full'] = {
+            'authorization_header_bytes': len(header),
+            'issue_median_ms': round(issue_median, 3),
+            'authenticate_median_ms': round(auth_median, 3),
+            'authenticate_p95_ms': round(auth_p95, 3),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -21,7 +21,7 @@ const authReducer = (state, action) => {
         ...state,
         isAuthenticated: true,
         token: action.payload.token,
-        user: decodedToken,
+        user: { ...decodedToken, id: Number(decodedToken.user_id) }, // Tokens name the id user_id
         isLoading: false // Set to false after successful login
       };
     case 'LOGOUT':
@@ -3,6 +3,7 @@ import { useAuth } from '../context/AuthContext'; // Assuming AuthContext is in
 import PatientList from '../lists/PatientList'; // Adjust path as needed
 import DoctorList from '../lists/DoctorList'; // Adjust path as needed
 import AppointmentList from '../lists/AppointmentList'; // Adjust path as needed
+import DashboardSummary from './DashboardSummary';
 
 const Dashboard = () => {
   const { authState } = useAuth();
@@ -17,7 +18,9 @@ const Dashboard = () => {
   return (
     <div className="dashboard-container bg-gray-100 min-h-screen p-6">
       <h1 className="text-3xl font-bold text-center text-gray-800 mb-6">Dashboard</h1>
-      
+
+      <DashboardSummary />
+
       <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-8">
         {/* Show different components based on the user's role */}
         {role === 'admin' && (
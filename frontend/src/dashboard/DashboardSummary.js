@@ -0,0 +1,92 @@
+import React, { useEffect, useState } from 'react';
+import { useAuth } from '../context/AuthContext';
+
+// Appointment counts, upcoming load and revenue, aggregated by the server (/api/dashboard/)
+const DashboardSummary = () => {
+  const { authState } = useAuth();
+  const [summary, setSummary] = useState(null);
+  const [error, setError] = useState(null);
+
+  useEffect(() => {
+    const fetchSummary = async () => {
+      try {
+        const response = await fetch('http://127.0.0.1:8000/api/dashboard/', {
+          method: 'GET',
+          headers: {
+            'Authorization': `Bearer ${authState.token}`,
+          },
+        });
+
+        if (response.ok) {
+          setSummary(await response.json());
+        } else {
+          setError('Failed to fetch dashboard summary');
+        }
+      } catch (error) {
+        setError('Error fetching dashboard summary');
+      }
+    };
+
+    if (authState.isAuthenticated) {
+      fetchSummary();
+    }
+  }, [authState.isAuthenticated, authState.token]);
+
+  if (error) {
+    return <div style={{ color: 'red' }}>{error}</div>;
+  }
+
+  if (!summary) {
+    return <div>Loading summary...</div>;
+  }
+
+  const role = authState.user.role;
+  const tiles = [
+    ['Today', summary.upcoming.today],
+    ['This week', summary.upcoming.this_week],
+    ['Pending', summary.counts.pending],
+    ['Confirmed', summary.counts.confirmed],
+    ['Canceled', summary.counts.canceled],
+    [role === 'patient' ? 'Fees' : 'Revenue', summary.revenue],
+  ];
+
+  return (
+    <div className="bg-white shadow-lg rounded-lg p-4 mb-8">
+      <div className="grid grid-cols-2 md:grid-cols-3 lg:grid-cols-6 gap-4 text-center">
+        {tiles.map(([label, value]) => (
+          <div key={label}>
+            <div className="text-2xl font-bold text-gray-800">{value}</div>
+            <div className="text-sm text-gray-500">{label}</div>
+          </div>
+        ))}
+      </div>
+
+      {role === 'admin' && summary.doctors.length > 0 && (
+        <table className="w-full mt-6 text-left">
+          <thead>
+            <tr className="text-gray-600">
+              <th>Doctor</th>
+              <th>Specialization</th>
+              <th>Pending</th>
+              <th>Confirmed</th>
+              <th>Revenue</th>
+            </tr>
+          </thead>
+          <tbody>
+            {summary.doctors.map((doctor) => (
+              <tr key={doctor.id}>
+                <td>Dr. {doctor.first_name} {doctor.last_name}</td>
+                <td>{doctor.specialization}</td>
+                <td>{doctor.pending}</td>
+                <td>{doctor.confirmed}</td>
+                <td>{doctor.revenue}</td>
+              </tr>
+            ))}
+          </tbody>
+        </table>
+      )}
+    </div>
+  );
+};
+
+export default DashboardSummary;
@@ -52,7 +52,7 @@ const AppointmentForm = () => {
   useEffect(() => {
     const fetchDoctors = async () => {
       try {
-        const response = await fetch('http://127.0.0.1:8000/api/doctors/', {
+        const response = await fetch('http://127.0.0.1:8000/api/doctors/?page_size=200', {
           method: 'GET',
           headers: {
             'Authorization': `Bearer ${authState.token}`,
@@ -62,7 +62,7 @@ const AppointmentForm = () => {
 
         if (response.ok) {
           const data = await response.json();
-          setDoctors(data);
+          setDoctors(data.results);
         } else {
           setError('Failed to fetch doctors');
         }
@@ -74,7 +74,7 @@ const AppointmentForm = () => {
     const fetchPatients = async () => {
       if (authState.user.role === 'admin' || authState.user.role === 'doctor') {
         try {
-          const response = await fetch('http://127.0.0.1:8000/api/patients/', {
+          const response = await fetch('http://127.0.0.1:8000/api/patients/?page_size=200', {
             method: 'GET',
             headers: {
               'Authorization': `Bearer ${authState.token}`,
@@ -84,7 +84,7 @@ const AppointmentForm = () => {
 
           if (response.ok) {
             const data = await response.json();
-            setPatients(data);
+            setPatients(data.results);
           } else {
             setError('Failed to fetch patients');
           }
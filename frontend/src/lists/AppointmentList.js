@@ -7,39 +7,45 @@ const AppointmentList = () => {
   const [appointments, setAppointments] = useState([]); // To store appointment data
   const [loading, setLoading] = useState(true); // To show loading state
   const [error, setError] = useState(null); // To handle errors
+  const [nextPage, setNextPage] = useState(null); // Cursor URL of the next page, null on the last page
+  const [statusFilter, setStatusFilter] = useState(''); // Filtering is done by the server
   const navigate = useNavigate();
 
-  useEffect(() => {
-    const fetchAppointments = async () => {
-      try {
-        const response = await fetch('http://127.0.0.1:8000/api/appointments/', {
-          method: 'GET',
-          headers: {
-            'Authorization': `Bearer ${authState.token}`, // Pass token for authentication
-            'Content-Type': 'application/json',
-          },
-        });
+  // Fetch one page of appointments; append=true keeps the rows already on screen
+  const fetchAppointments = async (url, append) => {
+    try {
+      const response = await fetch(url, {
+        method: 'GET',
+        headers: {
+          'Authorization': `Bearer ${authState.token}`, // Pass token for authentication
+          'Content-Type': 'application/json',
+        },
+      });
 
-        if (response.ok) {
-          const data = await response.json();
-          setAppointments(data); // Set the appointments data
-        } else {
-          setError('Failed to fetch appointments');
-        }
-      } catch (error) {
-        setError('Error fetching appointments');
-      } finally {
-        setLoading(false); // Stop loading
+      if (response.ok) {
+        const data = await response.json();
+        setAppointments((prevAppointments) => (append ? [...prevAppointments, ...data.results] : data.results));
+        setNextPage(data.next);
+      } else {
+        setError('Failed to fetch appointments');
       }
-    };
+    } catch (error) {
+      setError('Error fetching appointments');
+    } finally {
+      setLoading(false); // Stop loading
+    }
+  };
 
+  useEffect(() => {
     // Fetch appointments only if the user is authenticated
     if (authState.isAuthenticated) {
-      fetchAppointments();
+      const query = statusFilter ? `?status=${statusFilter}` : '';
+      fetchAppointments(`http://127.0.0.1:8000/api/appointments/${query}`, false);
     } else {
       navigate('/login'); // Redirect to login if not authenticated
     }
-  }, [authState.isAuthenticated, authState.token, navigate]);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [authState.isAuthenticated, authState.token, statusFilter, navigate]);
 
   const deleteAppointment = async (appointmentId) => {
     if (window.confirm('Are you sure you want to delete this appointment?')) {
@@ -74,7 +80,7 @@ const AppointmentList = () => {
     return <div style={{ color: 'red' }}>{error}</div>; // Error message
   }
 
-  if (appointments.length === 0) {
+  if (appointments.length === 0 && !statusFilter) {
     return <div>No appointments found.</div>; // No appointments message
   }
 
@@ -90,10 +96,22 @@ const AppointmentList = () => {
       </h2>
     ) : null}
 
-    {/* Sort appointments by 'updated_at' in descending order */}
+    <div className="mb-6 flex justify-end">
+      <select
+        value={statusFilter}
+        onChange={(e) => setStatusFilter(e.target.value)}
+        className="px-3 py-1 border border-gray-300 rounded-md"
+      >
+        <option value="">All statuses</option>
+        <option value="pending">Pending</option>
+        <option value="confirmed">Confirmed</option>
+        <option value="canceled">Canceled</option>
+      </select>
+    </div>
+
+    {/* Appointments arrive from the server ordered by appointment date */}
     <ul className="space-y-4">
       {appointments
-        .sort((a, b) => new Date(b.updated_at) - new Date(a.updated_at)) // Sorting logic
         .map((appointment) => {
           let appointmentInfo = '';
           if (authState.user.role === 'patient') {
@@ -146,6 +164,16 @@ const AppointmentList = () => {
           );
         })}
     </ul>
+    {nextPage && (
+      <div className="mt-6 text-center">
+        <button
+          onClick={() => fetchAppointments(nextPage, true)}
+          className="px-4 py-1 bg-blue-600 text-white rounded-md hover:bg-blue-700 transition duration-200"
+        >
+          Load more
+        </button>
+      </div>
+    )}
 </div>
 
   );
@@ -11,7 +11,7 @@ const DoctorList = () => {
   useEffect(() => {
     const fetchDoctors = async () => {
       try {
-        const response = await fetch('http://127.0.0.1:8000/api/doctors/', {
+        const response = await fetch('http://127.0.0.1:8000/api/doctors/?page_size=200', {
           method: 'GET',
           headers: {
             'Authorization': `Bearer ${authState.token}`, // Use token for authorization
@@ -20,7 +20,7 @@ const DoctorList = () => {
 
         if (response.ok) {
           const data = await response.json();
-          setDoctors(data); // Set the doctors data
+          setDoctors(data.results); // Set the doctors data (first page of the cursor-paginated list)
         } else {
           setError('Failed to fetch doctor list');
           console.error('Failed to fetch doctor list');
@@ -34,7 +34,7 @@ const PatientList = () => {
   useEffect(() => {
     const fetchPatients = async () => {
       try {
-        const response = await fetch('http://127.0.0.1:8000/api/patients/', {
+        const response = await fetch('http://127.0.0.1:8000/api/patients/?page_size=200', {
           method: 'GET',
           headers: {
             'Authorization': `Bearer ${authState.token}`, // Use token for authorization
@@ -44,7 +44,7 @@ const PatientList = () => {
         if (response.ok) {
           const data = await response.json();
           console.log('Fetched patients:', data); // Log the data for debugging
-          setPatients(data); // Set the fetched patient list data
+          setPatients(data.results); // Set the fetched patient list data (first page of the cursor-paginated list)
         } else {
           setError('Failed to fetch patient list');
         }
@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hms.settings')
+os.environ.setdefault('HMS_ASYNC_VIEWS', '1')  # Serve the read-heavy endpoints from api/async_views.py
 
 application = get_asgi_application()
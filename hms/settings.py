@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.PerformanceMiddleware',  # Outermost, so its wall time covers the other middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'api.routers.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'hms.urls'
@@ -78,12 +81,104 @@ WSGI_APPLICATION = 'hms.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# HMS_DB_ENGINE picks the backend:
+#   sqlite   - the default; HMS_DB_NAME or db.sqlite3
+#   postgres - HMS_DB_NAME/USER/PASSWORD/HOST/PORT. Connections persist for HMS_DB_CONN_MAX_AGE
+#              seconds and are health-checked before reuse; HMS_DB_POOL=1 uses a psycopg
+#              connection pool (HMS_DB_POOL_MIN_SIZE/MAX_SIZE) instead
+# HMS_DB_REPLICA_HOST (postgres) or HMS_DB_REPLICA_NAME (sqlite file) adds a `replica` alias that
+# serves the list views' reads; see api/routers.py. For a local stand-in, copy the SQLite file
+# and point HMS_DB_REPLICA_NAME at the copy (benchmarks/replica_routing.py does exactly that).
+# Run the test suite without a replica: a mirrored alias is a second connection, which cannot
+# see the data of a TestCase's open transaction
+
+HMS_DB_ENGINE = os.environ.get('HMS_DB_ENGINE', 'sqlite')
+
+
+def database(engine, name=None, host=None):
+    if engine == 'sqlite':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': name or os.environ.get('HMS_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Take the write lock when a transaction starts instead of on its first write, so
+                # concurrent read-then-write transactions (bookings) wait their turn rather than deadlock
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    pooled = os.environ.get('HMS_DB_POOL', '0') == '1'
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('HMS_DB_NAME', 'hms'),
+        'USER': os.environ.get('HMS_DB_USER', 'hms'),
+        'PASSWORD': os.environ.get('HMS_DB_PASSWORD', ''),
+        'HOST': host or os.environ.get('HMS_DB_HOST', 'localhost'),
+        'PORT': os.environ.get('HMS_DB_PORT', '5432'),
+        # The pool owns connection lifetimes, so Django must not keep its own
+        'CONN_MAX_AGE': 0 if pooled else int(os.environ.get('HMS_DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('HMS_DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('HMS_DB_POOL_MAX_SIZE', 20)),
+            },
+        } if pooled else {},
+    }
+
 
 DATABASES = {
+    'default': database(HMS_DB_ENGINE),
+}
+
+# SQLite high-throughput profile (api/sqlite.py), opt-in with HMS_SQLITE_FAST=1: these pragmas
+# on every connection, and booking/profile writes funnelled through one writer thread. The busy
+# timeout is the 'timeout' option above
+HMS_SQLITE_FAST = HMS_DB_ENGINE == 'sqlite' and os.environ.get('HMS_SQLITE_FAST', '0') == '1'
+HMS_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # Durable across application crashes; a power cut may lose the last commits
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+HMS_READ_REPLICA = None  # Alias the router reads from, when a replica is configured
+HMS_REPLICA_PIN_SECONDS = 5  # After a write, the writer's reads stay on the primary this long
+if os.environ.get('HMS_DB_REPLICA_HOST') or os.environ.get('HMS_DB_REPLICA_NAME'):
+    DATABASES['replica'] = database(
+        HMS_DB_ENGINE, name=os.environ.get('HMS_DB_REPLICA_NAME'), host=os.environ.get('HMS_DB_REPLICA_HOST')
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    HMS_READ_REPLICA = 'replica'
+
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# HMS_CACHE_BACKEND picks where cached directory/profile reads (api/cache.py) live:
+#   locmem - per process, the default
+#   file   - shared by all processes on one host, under HMS_CACHE_LOCATION
+#   db     - shared through the database; run `python manage.py createcachetable` first
+
+HMS_CACHE_BACKEND = os.environ.get('HMS_CACHE_BACKEND', 'locmem')
+HMS_CACHE_ALIAS = 'default'
+HMS_CACHE_TIMEOUT = 300  # Seconds; invalidation is signal-driven, this only bounds staleness across processes
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'hms',
+        },
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('HMS_CACHE_LOCATION', BASE_DIR / '.cache'),
+        },
+        'db': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'hms_cache',
+        },
+    }[HMS_CACHE_BACKEND]
 }
 
 
@@ -136,6 +231,23 @@ REST_FRAMEWORK = {
     )
 }
 
+# Stateless JWT authentication (api/authentication.py)
+# Views that opt in with ClaimsJWTAuthentication build request.user from the token claims
+# instead of loading the User row, when HMS_STATELESS_AUTH is on. Whether the user is still
+# active (and still has the role in the token) is checked against a per-process cache that
+# holds each user's state for HMS_AUTH_STATE_TTL seconds; saves in the same process evict it
+HMS_STATELESS_AUTH = os.environ.get('HMS_STATELESS_AUTH', '0') == '1'
+HMS_AUTH_STATE_TTL = 30
+HMS_AUTH_STATE_MAX_ENTRIES = 10000
+
+# Async views (api/async_views.py) for the appointment, doctor, patient and profile reads;
+# on by default under ASGI (hms/asgi.py), e.g. `uvicorn hms.asgi:application`
+HMS_ASYNC_VIEWS = os.environ.get('HMS_ASYNC_VIEWS', '0') == '1'
+
+# Compact tokens carry only user_id, role, username, email and profile_version (MyTokenObtainPairSerializer);
+# set HMS_COMPACT_TOKENS=0 to also embed names and profile details as before
+HMS_COMPACT_TOKENS = os.environ.get('HMS_COMPACT_TOKENS', '1') == '1'
+
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -169,4 +281,58 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+
+# Scheduling (api/scheduling.py)
+# Doctors without a Profile.slot_duration or WorkingHours rows fall back to these
+HMS_DEFAULT_SLOT_MINUTES = 30
+HMS_DEFAULT_WORKING_HOURS = {weekday: [('09:00', '17:00')] for weekday in range(5)}  # Monday-Friday
+HMS_MAX_AVAILABILITY_DAYS = 31  # Widest from/to window the availability endpoint will expand
+HMS_BULK_MAX_ITEMS = 5000  # Largest batch accepted by /api/appointments/bulk/
+
+# Background tasks (api/tasks.py), run by `python manage.py run_tasks`
+HMS_TASK_WORKERS = 4  # Worker threads per run_tasks process
+HMS_TASK_BATCH_SIZE = 50  # Tasks a worker claims at once; same-named tasks in a claim run as one batch
+HMS_TASK_POLL_SECONDS = 1.0  # Idle wait between claims when nothing is due
+HMS_TASK_LEASE_SECONDS = 300  # A claimed task not finished in this time is handed to another worker
+HMS_TASK_MAX_ATTEMPTS = 5  # Then the task is marked failed and left for inspection
+HMS_TASK_RETRY_SECONDS = 10  # Backoff before the first retry, doubled for each further one
+HMS_REMINDER_LEAD = timedelta(hours=24)  # How long before an appointment its patient is reminded
+
+# Profile search (api/search.py): fts5 on SQLite, tsvector on Postgres; the index is created by
+# migration 0010 for the database in use, so this only needs changing with HMS_DB_ENGINE
+HMS_SEARCH_BACKEND = os.environ.get('HMS_SEARCH_BACKEND', 'tsvector' if HMS_DB_ENGINE == 'postgres' else 'fts5')
+HMS_SEARCH_CANDIDATES = 1000  # Matches ranked per query; see api/search.py
+HMS_SEARCH_MAX_TERMS = 8  # Words of a query beyond this are ignored
+HMS_SEARCH_FUZZY_MIN_LENGTH = 4  # Shorter words only match as prefixes, never as typos
+HMS_SEARCH_FUZZY_EXPANSIONS = 5  # Most indexed words a misspelt word may stand for
+
+# Streaming exports (api/exports.py): rows read from the database and sent per piece of the
+# response; memory use is proportional to this, not to the export
+HMS_EXPORT_CHUNK_SIZE = 2000
+
+# Delta sync (api/sync.py): GET /api/appointments/changes/?since=<token>
+HMS_SYNC_PAGE_SIZE = 500  # Changed appointments per response while catching up
+HMS_SYNC_SETTLE_SECONDS = 5  # Longest a write may take to commit, clock skew between servers included
+HMS_SYNC_TOMBSTONE_DAYS = 30  # Deletions kept for, and so the oldest token honoured; see prune_tombstones
+
+# Appointment event streams (api/events.py): GET /api/appointments/events/, under ASGI
+HMS_EVENTS_HEARTBEAT_SECONDS = 15  # Keep-alive comment on an idle stream, so proxies do not close it
+HMS_EVENTS_BUFFER = 100  # Events a slow subscriber may fall behind by before it is disconnected
+
+# Bulk user import (api/imports.py): `manage.py import_users` and POST /api/users/import/
+HMS_IMPORT_BATCH_SIZE = 1000  # Rows hashed and written together, in one transaction
+HMS_IMPORT_WORKERS = os.cpu_count() or 1  # Processes hashing passwords, in import_users and in run_tasks for the endpoint's imports
+HMS_IMPORT_MAX_ROWS = 5000  # Largest import the endpoint accepts (and holds until run_tasks runs it); the command has no limit
+
+# Dashboard (api/dashboard.py): read admin and doctor counts from the trigger-maintained
+# api_appointmentsummary table instead of grouping the appointments on every request
+HMS_DASHBOARD_SUMMARY = True
+HMS_DASHBOARD_DOCTORS = 20  # Busiest doctors listed with their load
+
+# Request metrics (api/metrics.py): the share of requests PerformanceMiddleware times, from 0
+# (off) to 1 (every request, e.g. while profiling locally); see benchmarks/metrics_overhead.py
+HMS_METRICS_SAMPLE_RATE = float(os.environ.get('HMS_METRICS_SAMPLE_RATE', '0.1'))
+HMS_METRICS_SERVER_TIMING = True  # Add a Server-Timing header to sampled responses
+# Bearer token a Prometheus scraper presents to GET /api/metrics/ (admins need none); empty disables it
+HMS_METRICS_TOKEN = os.environ.get('HMS_METRICS_TOKEN', '')